@@ -19,11 +19,14 @@ import datetime
 import logging
 import os
 import re
+import subprocess
 import sys
+import time
 
 from distutils.version import LooseVersion
 
 from refresh_source import Refresher
+from spinnaker.run import run_and_monitor
 from spinnaker.run import run_quick
 
 
@@ -147,6 +150,10 @@ class Annotator(object):
   # regex for 'version-X.Y.Z' versions
   TAG_MATCHER = re.compile('^version-[0-9]+\.[0-9]+\.[0-9]+$')
 
+  # Separates the individual commits in the 'git log' output we parse.
+  # This is the ASCII record separator, which will not be in commit messages.
+  COMMIT_SEPARATOR = '\x1e'
+
   def __init__(self, options, path=None, next_tag=None):
     self.__next_tag = next_tag or options.next_tag
     self.__path = path or options.path
@@ -155,6 +162,7 @@ class Annotator(object):
     self.__force_rebuild = options.force_rebuild
     self.__tags_to_delete = []
     self.__filtered_tags = []
+    self.__existing_tags = set()
     self.__current_version = None
 
   @property
@@ -195,7 +203,8 @@ class Annotator(object):
                                    .format(path=self.path),
                                echo=False)
     ref_lines = tag_ref_result.stdout.strip().split('\n')
-    hash_tags = [CommitTag(s) for s in ref_lines]
+    hash_tags = [CommitTag(s) for s in ref_lines if s]
+    self.__existing_tags = set([ht.tag for ht in hash_tags])
     self.__filtered_tags = [ht for ht in hash_tags if self.TAG_MATCHER.match(ht.tag)]
     self.__tags_to_delete = [ht for ht in hash_tags if not self.TAG_MATCHER.match(ht.tag)]
 
@@ -210,39 +219,35 @@ class Annotator(object):
       [VersionBump]: The version bump used to tag the git repository, or None
       if the tagging fails.
     """
-    if self.__is_head_current():
+    head_commit = self.get_head_commit()
+    if self.__current_version.hash == head_commit:
       # We manually specified a tag and want to override with that one.
       if self.__next_tag:
-        self.__tag_head_with_build(self.__next_tag)
-        run_quick('git -C {path} tag {next_tag} HEAD'
-                  .format(path=self.path, next_tag=self.__next_tag))
-        return VersionBump(self.__next_tag, self.get_head_commit())
+        self.__tag_head_with_build(self.__next_tag, head_commit)
+        return VersionBump(self.__next_tag, head_commit)
       # We didn't manually specify, but want to force a rebuild of the old tag.
       elif self.__force_rebuild:
-        self.__tag_head_with_build(self.__current_version.tag)
-        run_quick('git -C {path} tag {next_tag} HEAD'
-                  .format(path=self.path, next_tag=self.__current_version.tag))
-        return VersionBump(self.__current_version.tag, self.get_head_commit(), patch=True)
+        self.__tag_head_with_build(self.__current_version.tag, head_commit)
+        return VersionBump(self.__current_version.tag, head_commit, patch=True)
       # Else fail.
       else:
         logging.warn("There is already a tag of the form 'version-X.Y.Z' at HEAD. Not forcing rebuild.")
         return None
     else:
       version_bump = self.determine_new_tag()
-      # This tag is for logical identification for developers. This will be pushed
-      # to the upstream git repository if we choose to use this version in a
-      # formal Spinnaker product release.
-      run_quick('git -C {path} tag {next_tag} HEAD'
-                .format(path=self.path, next_tag=version_bump.version_str))
-      self.__tag_head_with_build(version_bump.version_str)
+      self.__tag_head_with_build(version_bump.version_str, head_commit)
       return version_bump
 
-  def __tag_head_with_build(self, version_bump_tag):
-    """Tags the current branch's HEAD with the next semver gradle build tag.
+  def __tag_head_with_build(self, version_bump_tag, head_commit):
+    """Tags the current branch's HEAD with the semver and gradle build tags.
 
     Args:
-      version_bump_tag [String]: Semver string to add as a gradle build tag.
+      version_bump_tag [String]: Semver tag of the form 'version-X.Y.Z'.
+      head_commit [String]: The commit hash at HEAD.
     """
+    # The semver tag is for logical identification for developers. This will
+    # be pushed to the upstream git repository if we choose to use this
+    # version in a formal Spinnaker product release.
     next_tag_with_build = '{0}-{1}'.format(version_bump_tag,
                                            self.build_number)
     # This tag is for gradle to use as the package version. It incorporates the
@@ -251,8 +256,16 @@ class Annotator(object):
     # to the upstream git repository.
     first_dash_idx = next_tag_with_build.index('-')
     gradle_version = next_tag_with_build[first_dash_idx + 1:]
-    run_quick('git -C {path} tag {next_tag} HEAD'
-              .format(path=self.path, next_tag=gradle_version))
+
+    create_tags = []
+    for tag in [version_bump_tag, gradle_version]:
+      if tag in self.__existing_tags:
+        # This is what 'git tag' would have done.
+        sys.stderr.write("fatal: tag '{tag}' already exists in {path}\n"
+                         .format(tag=tag, path=self.path))
+      else:
+        create_tags.append(tag)
+    self.update_tag_refs(create_tags=create_tags, commit_hash=head_commit)
 
   def delete_unwanted_tags(self):
     """Locally deletes tags that don't match TAG_MATCHER.
@@ -262,9 +275,43 @@ class Annotator(object):
     """
     print ('Deleting {0} unwanted git tags locally from {1}'
            .format(len(self.__tags_to_delete), self.path))
-    for bad_hash_tag in self.__tags_to_delete:
-      run_quick('git -C {path} tag -d {tag}'
-                .format(path=self.path, tag=bad_hash_tag.tag), echo=False)
+    self.update_tag_refs(
+        delete_tags=[bad_hash_tag.tag for bad_hash_tag in self.__tags_to_delete])
+
+  def update_tag_refs(self, create_tags=None, delete_tags=None,
+                      commit_hash=None):
+    """Creates and deletes local tags in a single 'git update-ref' transaction.
+
+    Args:
+      create_tags [list of String]: The tags to create at commit_hash.
+      delete_tags [list of String]: The tags to delete.
+      commit_hash [String]: The commit to create tags at.
+
+    Returns:
+      [int]: The number of refs that were updated.
+    """
+    commands = (['create refs/tags/{0} {1}'.format(tag, commit_hash)
+                 for tag in create_tags or []]
+                + ['delete refs/tags/{0}'.format(tag)
+                   for tag in delete_tags or []])
+    if not commands:
+      return 0
+
+    start_time = time.time()
+    result = run_and_monitor('git -C {path} update-ref --stdin'
+                             .format(path=self.path),
+                             echo=False, input='\n'.join(commands) + '\n')
+    if result.returncode != 0:
+      sys.stderr.write('Failed to update tags in {path}:\n{err}\n'
+                       .format(path=self.path, err=result.stderr))
+      return 0
+
+    self.__existing_tags.update(create_tags or [])
+    self.__existing_tags.difference_update(delete_tags or [])
+    print ('Updated {count} tag refs in {path} in {secs:.2f}s'
+           .format(count=len(commands), path=self.path,
+                   secs=time.time() - start_time))
+    return len(commands)
 
   def checkout_branch(self):
     """Checks out a branch.
@@ -281,15 +328,6 @@ class Annotator(object):
     return head_commit_res.stdout.strip()
 
 
-  def __is_head_current(self):
-    """Checks if the current version is at HEAD.
-
-    Returns:
-      [Boolean]: True if the current version tag is on HEAD, else False.
-    """
-    head_commit = self.get_head_commit()
-    return self.__current_version.hash == head_commit
-
   def __determine_current_version(self):
     """Determines and stores the current (latest) semantic version from
     'version-X.Y.Z' tags.
@@ -319,21 +357,56 @@ class Annotator(object):
     if self.__next_tag:
       return VersionBump(self.__next_tag, self.get_head_commit())
 
-    # 'git log' entries of the form '$hash $commit_title'
-    log_onelines = run_quick('git -C {path} log --pretty=oneline'.format(path=self.path),
-                             echo=False).stdout.strip().split('\n')
-    commit_hashes = [line.split(' ')[0].strip() for line in log_onelines]
+    return self.bump_semver_from_commits(
+        self.__current_version,
+        self.iter_commits_since(self.__current_version.hash))
+
+  def iter_commits_since(self, since_hash):
+    """Streams the commits after since_hash up to HEAD, most recent first.
 
-    # Full commit messages, including bodies for finding 'BREAKING CHANGE:'.
-    msgs = [
-      run_quick('git -C {path} log -n 1 --pretty=medium {hash}'.format(path=self.path, hash=h),
-                echo=False).stdout.strip() for h in commit_hashes
-    ]
+    This runs a single 'git log' over just that range and parses its output
+    as it arrives. If the caller stops iterating early, 'git log' is killed.
 
-    if len(commit_hashes) != len(msgs):
-      raise IOError('Git commit hash list and commit message list are unequal sizes.')
+    Args:
+      since_hash [String]: The hash of the oldest commit, which is excluded.
 
-    return self.bump_semver(self.__current_version, commit_hashes, msgs)
+    Yields:
+      [CommitMessage]: Each commit with its full message including the body,
+      which we need for finding 'BREAKING CHANGE:'.
+    """
+    process = subprocess.Popen(
+        ['git', '-C', self.path, 'log',
+         '--pretty=format:%H%n%B%x{0:02x}'.format(ord(self.COMMIT_SEPARATOR)),
+         '{0}..HEAD'.format(since_hash)],
+        stdout=subprocess.PIPE, close_fds=True)
+    pending = ''
+    try:
+      while True:
+        chunk = os.read(process.stdout.fileno(), 64 * 1024)
+        if not chunk:
+          break
+        records = (pending + chunk).split(self.COMMIT_SEPARATOR)
+        pending = records.pop()
+        for record in records:
+          yield self.__parse_commit_record(record)
+      if pending.strip():
+        yield self.__parse_commit_record(pending)
+    finally:
+      if process.poll() is None:
+        process.kill()
+      process.stdout.close()
+      process.wait()
+
+    if process.returncode != 0:
+      raise IOError('"git log {since}..HEAD" failed in {path}'
+                    .format(since=since_hash, path=self.path))
+
+  @staticmethod
+  def __parse_commit_record(record):
+    """Parses an entry of 'git log --pretty=format:%H%n%B' into a CommitMessage.
+    """
+    hash, _, msg = record.lstrip('\n').partition('\n')
+    return CommitMessage(hash.strip(), msg)
 
   def bump_semver(self, curr_version, commit_hashes, commit_msgs):
     """Determines the semver version bump based on commit messages in 'git log'.
@@ -349,14 +422,34 @@ class Annotator(object):
 
       commit_msgs [String list]: List of ordered, full commit messages.
 
+    Returns:
+      [VersionBump]: Next semantic version tag to be used, along with what type
+      of version bump it was.
+    """
+    return self.bump_semver_from_commits(
+        curr_version,
+        [CommitMessage(hash, msg) for hash, msg in zip(commit_hashes, commit_msgs)])
+
+  def bump_semver_from_commits(self, curr_version, commits):
+    """Determines the semver version bump from a sequence of commits.
+
+    The commits are only consumed as far as needed, so a breaking change
+    stops the iteration early.
+
+    Args:
+      curr_version [CommitTag]: Latest 'version-X.Y.Z' tag/commit hash pair
+      calcluated by semver sort.
+
+      commits [CommitMessage iterable]: The commits ordered most recent first.
+
     Returns:
       [VersionBump]: Next semantic version tag to be used, along with what type
       of version bump it was.
     """
     # Commits are output from 'git log ...' ordered most recent to least.
-    commits_iter = iter([CommitMessage(hash, msg) for hash, msg in zip(commit_hashes, commit_msgs)])
+    commits_iter = iter(commits)
     commit = next(commits_iter, None)
-    head_commit_hash = commit.hash
+    head_commit_hash = commit.hash if commit is not None else curr_version.hash
 
     feat_matcher = re.compile('feat\(.*\)*')
     bc_matcher = re.compile('BREAKING CHANGE')
@@ -378,6 +471,11 @@ class Annotator(object):
         feature = True
       commit = next(commits_iter, None)
 
+    close = getattr(commits_iter, 'close', None)
+    if close:
+      # Stop producing commits we are not going to look at.
+      close()
+
     if breaking_change == True:
       return VersionBump(
         'version-' + str(int(major) + 1) + '.0.0', head_commit_hash, major=True)
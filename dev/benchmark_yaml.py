@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures how long our yaml processing takes.
+
+The corpus is the yaml files in config/ along with a synthetic BOM as
+written by generate_bom. Each measurement is the best of --repeat runs.
+
+Usage:
+  PYTHONPATH=pylib:dev python dev/benchmark_yaml.py [--bom_services N]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+import yaml
+
+from spinnaker.yaml_util import HAVE_ACCELERATED_YAML, yaml_loader
+
+
+def make_synthetic_bom(num_services):
+  """Returns a BOM dictionary shaped like the ones generate_bom writes.
+
+  Args:
+    num_services [int]: The number of service entries to generate.
+  """
+  services = {}
+  for index in range(num_services):
+    services['service-{0:04d}'.format(index)] = {
+        'commit': '{0:040x}'.format(index * 7919),
+        'version': '{0}.{1}.{2}-{3}'.format(index % 3, index % 17, index,
+                                            20170101 + index)
+    }
+  return {
+      'artifactSources': {
+          'debianRepository': 'https://dl.bintray.com/spinnaker/debians',
+          'dockerRegistry': 'gcr.io/spinnaker-marketplace',
+          'googleImageProject': 'marketplace-spinnaker-release',
+          'gitPrefix': 'https://github.com/spinnaker'
+      },
+      'dependencies': {
+          'consul': {'version': '0.7.5'},
+          'redis': {'version': '2:2.8.4-2'},
+          'vault': {'version': '0.7.0'}
+      },
+      'services': services,
+      'timestamp': '2017-01-01 00:00:00',
+      'version': 'master-20170101-1'
+  }
+
+
+def load_corpus(num_bom_services):
+  """Returns a list of (name, yaml text) to benchmark with."""
+  root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+  corpus = []
+  for path in sorted(glob.glob(os.path.join(root, 'config', '*.yml'))):
+    with open(path, 'r') as stream:
+      corpus.append((os.path.basename(path), stream.read()))
+  corpus.append(('synthetic-bom.yml',
+                 yaml.dump(make_synthetic_bom(num_bom_services),
+                           default_flow_style=False)))
+  return corpus
+
+
+def best_secs(func, repeat):
+  """Returns the fastest of repeated calls to func."""
+  timings = []
+  for _ in range(repeat):
+    start = time.time()
+    func()
+    timings.append(time.time() - start)
+  return min(timings)
+
+
+def benchmark_loaders(corpus, repeat):
+  """Compare the pure python loader with the one yaml_util selects."""
+  def load_all(loader):
+    for _, text in corpus:
+      yaml.load(text, Loader=loader)
+
+  pure_secs = best_secs(lambda: load_all(yaml.Loader), repeat)
+  print 'load    pure python {0:8.4f}s'.format(pure_secs)
+  if not HAVE_ACCELERATED_YAML:
+    print 'load    libyaml is not available.'
+    return
+  fast_secs = best_secs(lambda: load_all(yaml_loader()), repeat)
+  print 'load    libyaml     {0:8.4f}s  ({1:.1f}x)'.format(
+      fast_secs, pure_secs / fast_secs)
+
+
+def benchmark_scanner(corpus, repeat):
+  """Compare the scanner's fast path with its general path."""
+  class GeneralPathLoader(yaml.Loader):
+    fast_path = False
+
+  def scan_all(loader):
+    for _, text in corpus:
+      for _ in yaml.scan(text, Loader=loader):
+        pass
+
+  general_secs = best_secs(lambda: scan_all(GeneralPathLoader), repeat)
+  fast_secs = best_secs(lambda: scan_all(yaml.Loader), repeat)
+  print 'scan    general     {0:8.4f}s'.format(general_secs)
+  print 'scan    fast path   {0:8.4f}s  ({1:.1f}x)'.format(
+      fast_secs, general_secs / fast_secs)
+
+
+def benchmark_dumper(num_bom_services, repeat):
+  """Compare the emitter's fast path with its general path on a BOM."""
+  class GeneralPathDumper(yaml.Dumper):
+    fast_path = False
+
+  bom = make_synthetic_bom(num_bom_services)
+  def dump(dumper):
+    yaml.dump(bom, Dumper=dumper, default_flow_style=False)
+
+  general_secs = best_secs(lambda: dump(GeneralPathDumper), repeat)
+  fast_secs = best_secs(lambda: dump(yaml.Dumper), repeat)
+  print 'dump    general     {0:8.4f}s'.format(general_secs)
+  print 'dump    fast path   {0:8.4f}s  ({1:.1f}x)'.format(
+      fast_secs, general_secs / fast_secs)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--bom_services', default=2000, type=int,
+      help='The number of services in the synthetic BOM.')
+  parser.add_argument(
+      '--repeat', default=5, type=int,
+      help='The number of times to repeat each measurement.')
+  options = parser.parse_args()
+
+  corpus = load_corpus(options.bom_services)
+  print 'Corpus is {count} documents with {size} bytes.'.format(
+      count=len(corpus), size=sum([len(text) for _, text in corpus]))
+  benchmark_loaders(corpus, options.repeat)
+  benchmark_scanner(corpus, options.repeat)
+  benchmark_dumper(options.bom_services, options.repeat)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
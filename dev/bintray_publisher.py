@@ -0,0 +1,424 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Publishes build artifacts to bintray.
+
+Package files are streamed from disk in chunks rather than read into memory,
+and all requests share a bounded pool of keep-alive connections so that
+publishing many modules does not pay for a new TLS handshake per request.
+"""
+
+import base64
+import collections
+import httplib
+import json
+import multiprocessing.pool
+import os
+import Queue
+import socket
+import threading
+import time
+
+
+# Size of each chunk sent while streaming a file body.
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Responses that indicate a transient server-side condition worth retrying.
+RETRYABLE_STATUS_CODES = frozenset([408, 429, 500, 502, 503, 504])
+
+
+BintrayUpload = collections.namedtuple(
+    'BintrayUpload', ['source', 'package', 'version', 'path', 'debian_tags'])
+
+
+class BintrayError(Exception):
+  """Denotes a bintray request that did not succeed."""
+
+  @property
+  def status(self):
+    return self.__status
+
+  def __init__(self, status, method, path, message):
+    self.__status = status
+    super(BintrayError, self).__init__(
+        '{status}: {method} {path} failed\n{message}'.format(
+            status=status, method=method, path=path, message=message))
+
+
+class HttpConnectionPool(object):
+  """A bounded pool of keep-alive HTTP(S) connections to a single host.
+
+  At most max_connections requests are in flight at once. Callers beyond
+  that block until a connection is returned to the pool.
+  """
+
+  @property
+  def host(self):
+    return self.__host
+
+  def __init__(self, host, port=None, use_ssl=True, max_connections=4,
+               timeout=300):
+    """Constructor.
+
+    Args:
+      host [string]: The host to connect to.
+      port [int]: The port to connect to, or None for the protocol default.
+      use_ssl [boolean]: Whether to use HTTPS rather than HTTP.
+      max_connections [int]: The maximum number of concurrent connections.
+      timeout [int]: Socket timeout in seconds for each connection.
+    """
+    self.__host = host
+    self.__port = port
+    self.__use_ssl = use_ssl
+    self.__timeout = timeout
+
+    # Connections are created lazily; None marks an unused slot.
+    self.__available = Queue.Queue()
+    for _ in range(max(1, max_connections)):
+      self.__available.put(None)
+
+  def request(self, method, path, headers=None, body=None, source=None):
+    """Issue a request on a pooled connection.
+
+    Args:
+      method [string]: The HTTP method.
+      path [string]: The request path including any query or parameters.
+      headers [dict]: Additional request headers.
+      body [string]: The request body, if any.
+      source [string]: The path to a file to stream as the request body.
+         This is mutually exclusive with body.
+
+    Returns:
+      The (status, content) of the response.
+    """
+    connection = self.__available.get()
+    if connection is None:
+      connection = self.__new_connection()
+
+    reusable = False
+    try:
+      connection.putrequest(method, path, skip_accept_encoding=True)
+      for name, value in (headers or {}).items():
+        connection.putheader(name, value)
+      if source is not None:
+        length = os.path.getsize(source)
+      else:
+        length = len(body or '')
+      connection.putheader('Content-Length', str(length))
+      connection.endheaders()
+
+      if source is not None:
+        with open(source, 'rb') as stream:
+          while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+              break
+            connection.send(chunk)
+      elif body:
+        connection.send(body)
+
+      response = connection.getresponse()
+      content = response.read()
+      reusable = not response.will_close
+      return response.status, content
+    finally:
+      if not reusable:
+        connection.close()
+        connection = None
+      self.__available.put(connection)
+
+  def close(self):
+    """Close the idle connections in the pool."""
+    connections = []
+    while True:
+      try:
+        connections.append(self.__available.get_nowait())
+      except Queue.Empty:
+        break
+    for connection in connections:
+      if connection is not None:
+        connection.close()
+      self.__available.put(None)
+
+  def __new_connection(self):
+    klass = (httplib.HTTPSConnection if self.__use_ssl
+             else httplib.HTTPConnection)
+    return klass(self.__host, self.__port, timeout=self.__timeout)
+
+
+class BintrayPublisher(object):
+  """Uploads package files into a bintray repository.
+
+  Failed requests are retried with exponential backoff. A 400 response is
+  taken to mean the package does not exist yet, so the package is created
+  before retrying. A 409 conflict is only retried if wipe_package_on_409,
+  in which case the existing file is deleted first.
+
+  Files can be staged by uploading them unpublished. The versions they were
+  added to are remembered until publish_staged() publishes or discards them
+  together.
+  """
+
+  @property
+  def subject(self):
+    return self.__subject
+
+  @property
+  def repo(self):
+    return self.__repo
+
+  def __init__(self, repository, user, key, pool=None,
+               max_retries=5, initial_backoff_secs=1.0, max_backoff_secs=60.0,
+               wipe_package_on_409=False):
+    """Constructor.
+
+    Args:
+      repository [string]: The bintray repository in the form <owner>/<repo>.
+      user [string]: The bintray user to authenticate as.
+      key [string]: The bintray API key for the user.
+      pool [HttpConnectionPool]: The connections to issue requests on.
+         If None then use a default pool to api.bintray.com.
+      max_retries [int]: The number of times to retry a failed request.
+      initial_backoff_secs [float]: The delay before the first retry.
+         This doubles on each subsequent retry up to max_backoff_secs.
+      max_backoff_secs [float]: The longest delay between retries.
+      wipe_package_on_409 [boolean]: Delete conflicting files and retry.
+    """
+    parts = repository.split('/')
+    if len(parts) != 2:
+      raise ValueError(
+          'Expected --bintray_repo to be in the form <owner>/<repo>')
+    self.__subject, self.__repo = parts[0], parts[1]
+    self.__pool = pool or HttpConnectionPool('api.bintray.com')
+    self.__max_retries = max_retries
+    self.__initial_backoff_secs = initial_backoff_secs
+    self.__max_backoff_secs = max_backoff_secs
+    self.__wipe_package_on_409 = wipe_package_on_409
+    self.__auth_header = 'Basic ' + base64.b64encode(
+        '{user}:{key}'.format(user=user, key=key))
+    self.__staged_lock = threading.Lock()
+    self.__staged_versions = set()
+
+  def publish(self, upload, stage=False):
+    """Write a file into the repository.
+
+    Args:
+      upload [BintrayUpload]: The file to upload and where to put it.
+      stage [boolean]: Upload the file unpublished, for publish_staged().
+    """
+    package = upload.package
+    pkg_filename = os.path.basename(upload.path)
+    if (pkg_filename.startswith('spinnaker-')
+        and not package.startswith('spinnaker')):
+      package = 'spinnaker-' + package
+
+    debian_tags = upload.debian_tags
+    if debian_tags and debian_tags[0] != ';':
+      debian_tags = ';' + debian_tags
+
+    url = ('/content/{subject}/{repo}/{package}/{version}/{path}'
+           '{debian_tags}'
+           ';publish={publish};override=1'
+           .format(subject=self.__subject, repo=self.__repo, package=package,
+                   version=upload.version, path=upload.path,
+                   debian_tags=debian_tags, publish=0 if stage else 1))
+
+    remedies = {400: lambda: self.__create_package(package)}
+    if self.__wipe_package_on_409:
+      remedies[409] = lambda: self.__delete_file(upload.path)
+
+    if stage:
+      with self.__staged_lock:
+        self.__staged_versions.add((package, upload.version))
+    self.__request_with_retries('PUT', url, remedies, source=upload.source)
+    print 'Wrote {source} to https://{host}{url}'.format(
+        source=upload.source, host=self.__pool.host, url=url)
+
+  def publish_all(self, uploads, concurrency=1, stage=False):
+    """Write all the files into the repository.
+
+    Every upload is attempted even if some fail.
+
+    Args:
+      uploads [list of BintrayUpload]: The files to upload.
+      concurrency [int]: The maximum number of uploads to run at once.
+      stage [boolean]: Upload the files unpublished, for publish_staged().
+
+    Raises:
+      The first error encountered, once all the uploads have finished.
+    """
+    if not uploads:
+      return
+
+    def publish_one(upload):
+      try:
+        self.publish(upload, stage=stage)
+        return None
+      except Exception as ex:
+        print 'Failed to publish {source}: {ex}'.format(
+            source=upload.source, ex=ex)
+        return ex
+
+    start_time = time.time()
+    concurrency = max(1, min(concurrency, len(uploads)))
+    if concurrency == 1:
+      errors = [publish_one(upload) for upload in uploads]
+    else:
+      pool = multiprocessing.pool.ThreadPool(processes=concurrency)
+      try:
+        errors = pool.map(publish_one, uploads)
+      finally:
+        pool.close()
+        pool.join()
+
+    errors = [error for error in errors if error is not None]
+    total_bytes = sum(os.path.getsize(upload.source) for upload in uploads)
+    print 'Published {count} file(s) ({mb:.1f} MB) in {secs:.1f} secs.'.format(
+        count=len(uploads) - len(errors), mb=total_bytes / (1024.0 * 1024.0),
+        secs=time.time() - start_time)
+    if errors:
+      raise errors[0]
+
+  def publish_staged(self, discard=False):
+    """Publish or discard all the files staged so far.
+
+    Every version is attempted even if some fail.
+
+    Args:
+      discard [boolean]: Discard the staged files rather than publishing them.
+
+    Raises:
+      The first error encountered, once all the versions have been handled.
+    """
+    with self.__staged_lock:
+      staged = sorted(self.__staged_versions)
+      self.__staged_versions = set()
+
+    body = json.dumps({'discard': True} if discard else {})
+    errors = []
+    for package, version in staged:
+      url = '/content/{subject}/{repo}/{package}/{version}/publish'.format(
+          subject=self.__subject, repo=self.__repo, package=package,
+          version=version)
+      try:
+        self.__request_with_retries(
+            'POST', url, body=body,
+            headers={'Content-Type': 'application/json'})
+        print '{action} {package} {version}'.format(
+            action='Discarded' if discard else 'Published',
+            package=package, version=version)
+      except BintrayError as ex:
+        print 'Failed to {action} {package} {version}: {ex}'.format(
+            action='discard' if discard else 'publish',
+            package=package, version=version, ex=ex)
+        errors.append(ex)
+    if errors:
+      raise errors[0]
+
+  def __request_with_retries(self, method, path, remedies=None, **kwargs):
+    """Issue a request, retrying with exponential backoff if it fails.
+
+    Args:
+      method [string]: The HTTP method.
+      path [string]: The request path.
+      remedies [dict]: Functions keyed by status code to call before
+         retrying a response with that status. Each is only used once.
+      kwargs [kwargs]: Additional arguments for HttpConnectionPool.request.
+
+    Returns:
+      The content of the successful response.
+    """
+    remedies = dict(remedies or {})
+    headers = dict(kwargs.pop('headers', {}))
+    headers['Authorization'] = self.__auth_header
+    backoff_secs = self.__initial_backoff_secs
+    attempt = 0
+    while True:
+      try:
+        status, content = self.__pool.request(
+            method, path, headers=headers, **kwargs)
+      except (httplib.HTTPException, socket.error) as ex:
+        status, content = None, str(ex)
+
+      if status is not None and status >= 200 and status < 300:
+        return content
+
+      remedy = remedies.pop(status, None)
+      if remedy is not None:
+        remedy()
+      elif status is not None and status not in RETRYABLE_STATUS_CODES:
+        raise BintrayError(status, method, path, content)
+
+      attempt += 1
+      if attempt > self.__max_retries:
+        raise BintrayError(status, method, path, content)
+
+      if remedy is None:
+        print 'Got {status} on {method} {path}. Retrying in {secs}s...'.format(
+            status=status or 'error', method=method, path=path,
+            secs=backoff_secs)
+        time.sleep(backoff_secs)
+        backoff_secs = min(backoff_secs * 2, self.__max_backoff_secs)
+
+  def __create_package(self, package):
+    """Create the package entry so that files can be added to it."""
+    pkg_url = '/packages/{subject}/{repo}'.format(
+        subject=self.__subject, repo=self.__repo)
+    print 'Creating an entry for {package} with {pkg_url}...'.format(
+        package=package, pkg_url=pkg_url)
+
+    # All the packages are from spinnaker so we'll hardcode it.
+    # Note spinnaker-monitoring is a github repo with two packages.
+    # Neither is "spinnaker-monitoring"; that's only the github repo.
+    gitname = (package.replace('spinnaker-', '')
+               if not package.startswith('spinnaker-monitoring')
+               else 'spinnaker-monitoring')
+    pkg_data = json.dumps({
+        'name': package,
+        'licenses': ['Apache-2.0'],
+        'vcs_url': 'https://github.com/spinnaker/{0}.git'.format(gitname),
+        'website_url': 'http://spinnaker.io',
+        'github_repo': 'spinnaker/{0}'.format(gitname),
+        'public_download_numbers': False,
+        'public_stats': False
+    })
+
+    # A concurrent upload to another module of the package may have
+    # already created it.
+    try:
+      self.__request_with_retries(
+          'POST', pkg_url, body=pkg_data,
+          headers={'Content-Type': 'application/json'})
+    except BintrayError as ex:
+      if ex.status != 409:
+        raise
+
+  def __delete_file(self, path):
+    """Delete an existing file so that it can be replaced.
+
+    The problem here is that BinTray does not allow packages to change once
+    they have been published (even though we are explicitly asking it to
+    override). Since we are building from source, we don't really have a
+    version yet, so we'll be heavy handed and remove the existing file.
+    """
+    delete_url = '/content/{subject}/{repo}/{path}'.format(
+        subject=self.__subject, repo=self.__repo, path=path)
+    print 'Attempt to delete url={url} then retry...'.format(url=delete_url)
+    try:
+      self.__request_with_retries('DELETE', delete_url)
+      print 'Deleted...'
+    except BintrayError as ex:
+      # Maybe it didn't exist. Try again anyway.
+      print 'Delete {url} got {ex}. Try again anyway.'.format(
+          url=delete_url, ex=ex)
@@ -0,0 +1,194 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local cache of build artifacts keyed by what they were built from.
+
+Each entry is a directory named by the hash of its key. It contains a
+metadata.json file describing the entry and a copy of the artifacts, stored
+by their path relative to the directory they were built in. The mtime of
+metadata.json records when the entry was last used for eviction purposes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+METADATA_FILENAME = 'metadata.json'
+ARTIFACT_DIRNAME = 'artifacts'
+
+
+class BuildCache(object):
+  """Remembers successful builds so unchanged components can skip them.
+
+  Entries are keyed by the component name, the commit hash it was built
+  from, and any flags that affect what gets built. When the cache grows
+  beyond max_bytes, the least recently used entries are evicted.
+  """
+
+  @property
+  def cache_dir(self):
+    return self.__cache_dir
+
+  @property
+  def hits(self):
+    return list(self.__hits)
+
+  @property
+  def misses(self):
+    return list(self.__misses)
+
+  def __init__(self, cache_dir, max_bytes):
+    """Constructor.
+
+    Args:
+      cache_dir [string]: The directory to keep the cache in.
+      max_bytes [int]: The maximum size of all the cached artifacts.
+    """
+    self.__cache_dir = cache_dir
+    self.__max_bytes = max_bytes
+    self.__lock = threading.Lock()
+    self.__hits = []
+    self.__misses = []
+
+  @staticmethod
+  def make_key(component, commit, **flags):
+    """Construct a cache key.
+
+    Args:
+      component [string]: The name of the component being built.
+      commit [string]: The commit hash the component is built from.
+      flags [kwargs]: Any other build parameters that affect the artifacts.
+
+    Returns:
+      A string key for the cache.
+    """
+    spec = dict(flags)
+    spec['component'] = component
+    spec['commit'] = commit
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True)).hexdigest()
+    return '{component}-{digest}'.format(component=component,
+                                         digest=digest[:32])
+
+  def lookup(self, key, dest_root):
+    """Restore the artifacts for a cached build.
+
+    The artifacts are always copied over whatever is already at their paths,
+    since a stale file left by an earlier build may look just like them.
+
+    Args:
+      key [string]: The cache key from make_key.
+      dest_root [string]: The directory to restore the artifacts into.
+
+    Returns:
+      The metadata dictionary for the entry, or None if the key is not cached.
+    """
+    entry_dir = os.path.join(self.__cache_dir, key)
+    metadata_path = os.path.join(entry_dir, METADATA_FILENAME)
+    try:
+      with open(metadata_path, 'r') as f:
+        metadata = json.loads(f.read())
+      for relpath in metadata['artifacts']:
+        source = os.path.join(entry_dir, ARTIFACT_DIRNAME, relpath)
+        dest = os.path.join(dest_root, relpath)
+        if not os.path.exists(os.path.dirname(dest)):
+          os.makedirs(os.path.dirname(dest))
+        shutil.copy2(source, dest)
+      os.utime(metadata_path, None)
+    except (IOError, OSError, ValueError, KeyError):
+      self.__record(self.__misses, key)
+      return None
+
+    self.__record(self.__hits, key)
+    return metadata
+
+  def store(self, key, source_root, artifacts, **metadata):
+    """Add a successful build to the cache.
+
+    Args:
+      key [string]: The cache key from make_key.
+      source_root [string]: The directory the artifacts were built in.
+      artifacts [list of string]: The artifact paths relative to source_root.
+      metadata [kwargs]: Additional information to remember about the build.
+    """
+    entry_dir = os.path.join(self.__cache_dir, key)
+    staging_dir = entry_dir + '.tmp'
+    try:
+      if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+      total_bytes = 0
+      for relpath in artifacts:
+        dest = os.path.join(staging_dir, ARTIFACT_DIRNAME, relpath)
+        if not os.path.exists(os.path.dirname(dest)):
+          os.makedirs(os.path.dirname(dest))
+        shutil.copy2(os.path.join(source_root, relpath), dest)
+        total_bytes += os.path.getsize(dest)
+      if not os.path.exists(staging_dir):
+        os.makedirs(staging_dir)
+
+      metadata = dict(metadata)
+      metadata.update({'key': key, 'artifacts': list(artifacts),
+                       'bytes': total_bytes, 'created': time.time()})
+      with open(os.path.join(staging_dir, METADATA_FILENAME), 'w') as f:
+        f.write(json.dumps(metadata, indent=2, sort_keys=True))
+
+      with self.__lock:
+        if os.path.exists(entry_dir):
+          shutil.rmtree(entry_dir)
+        os.rename(staging_dir, entry_dir)
+        self.__evict()
+    except (IOError, OSError) as ex:
+      print 'Could not cache build {key}: {ex}'.format(key=key, ex=ex)
+      shutil.rmtree(staging_dir, ignore_errors=True)
+
+  def summary(self):
+    """Returns a printable summary of the cache hits and misses."""
+    lines = ['Build cache: {hits} hit(s), {misses} miss(es).'.format(
+        hits=len(self.__hits), misses=len(self.__misses))]
+    for key in sorted(self.__hits):
+      lines.append('  HIT  {0}'.format(key))
+    for key in sorted(self.__misses):
+      lines.append('  MISS {0}'.format(key))
+    return '\n'.join(lines)
+
+  def __record(self, outcomes, key):
+    with self.__lock:
+      outcomes.append(key)
+
+  def __evict(self):
+    """Remove least recently used entries until the cache fits.
+
+    The caller must hold the lock.
+    """
+    entries = []
+    total_bytes = 0
+    for name in os.listdir(self.__cache_dir):
+      metadata_path = os.path.join(self.__cache_dir, name, METADATA_FILENAME)
+      try:
+        with open(metadata_path, 'r') as f:
+          size = json.loads(f.read()).get('bytes', 0)
+        entries.append((os.path.getmtime(metadata_path), size, name))
+        total_bytes += size
+      except (IOError, OSError, ValueError):
+        continue
+
+    for _, size, name in sorted(entries):
+      if total_bytes <= self.__max_bytes:
+        break
+      print 'Evicting {name} from build cache.'.format(name=name)
+      shutil.rmtree(os.path.join(self.__cache_dir, name), ignore_errors=True)
+      total_bytes -= size
@@ -42,7 +42,6 @@ Usage:
 """
 
 import argparse
-import base64
 import collections
 import datetime
 import fnmatch
@@ -57,12 +56,23 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import time
-import urllib2
-from urllib2 import HTTPError
 
 import refresh_source
 
+from build_cache import BuildCache
+from build_scheduler import (
+    BuildHistory,
+    BuildScheduler,
+    QuotaExceededError,
+    QUOTA_ERROR_RE,
+    TokenBucket)
+from bintray_publisher import (
+    BintrayPublisher,
+    BintrayUpload,
+    HttpConnectionPool)
+
 from google.cloud import pubsub
 from spinnaker.run import run_quick
 
@@ -112,6 +122,49 @@ def determine_package_version(platform, gradle_root):
     if re.match('-$', version): version = version + '0'
     return version
 
+def determine_package_artifacts(platform, gradle_root):
+  """Determine the package build artifacts for the current package version.
+
+  Returns:
+    A list of artifact paths relative to the gradle_root.
+  """
+  version = determine_package_version(platform, gradle_root)
+  if version is None:
+    return []
+
+  paths = []
+  if platform == 'debian':
+    for root in determine_modules_with_debians(gradle_root):
+      paths.append(os.path.join(root, 'build', 'debian', 'control'))
+      paths.extend(glob.glob(os.path.join(
+          root, 'build', 'distributions', '*_{0}_all.deb'.format(version))))
+  elif platform == 'redhat':
+    for root in determine_modules_with_redhats(gradle_root):
+      paths.extend(glob.glob(os.path.join(
+          root, 'build', 'distributions', '*-{0}.noarch.rpm'.format(version))))
+  return sorted(set(os.path.relpath(path, gradle_root) for path in paths))
+
+def raise_if_quota_error(name, logfile, cause):
+  """Raise a QuotaExceededError if the build log indicates a quota problem.
+
+  Args:
+    name [string]: The name of the component being built.
+    logfile [string]: The path to the build log.
+    cause [Exception]: The error the build failed with.
+  """
+  try:
+    with open(logfile, 'r') as f:
+      f.seek(0, os.SEEK_END)
+      f.seek(max(0, f.tell() - 64 * 1024))
+      tail = f.read()
+  except IOError:
+    return
+  match = QUOTA_ERROR_RE.search(tail)
+  if match:
+    raise QuotaExceededError(
+        'Building {name} hit "{reason}": {cause}'.format(
+            name=name, reason=match.group(1), cause=cause))
+
 def run_shell_and_log(cmd_list, logfile, cwd=None):
   for cmd in cmd_list:
     parsed = shlex.split(cmd)
@@ -150,6 +203,7 @@ class Builder(object):
       self.__background_processes = []
 
       os.environ['NODE_ENV'] = os.environ.get('NODE_ENV', 'dev')
+      self.__build_number_is_default = not (build_number or os.environ.get('BUILD_NUMBER'))
       self.__build_number = build_number or os.environ.get('BUILD_NUMBER') or '{:%Y%m%d%H%M%S}'.format(datetime.datetime.utcnow())
       self.__gcb_service_account = options.gcb_service_account
       self.__options = options
@@ -160,8 +214,36 @@ class Builder(object):
       if options.bintray_repo and options.build:
         self.__verify_bintray()
 
+      self.__bintray_publisher = None
+      if options.bintray_repo:
+        # The pool size bounds the uploads across all the subsystems
+        # being copied concurrently, not just within each one.
+        pool = HttpConnectionPool(
+            'api.bintray.com',
+            max_connections=options.bintray_upload_concurrency)
+        self.__bintray_publisher = BintrayPublisher(
+            options.bintray_repo,
+            os.environ.get('BINTRAY_USER', ''),
+            os.environ.get('BINTRAY_KEY', ''),
+            pool=pool,
+            max_retries=options.bintray_max_retries,
+            wipe_package_on_409=options.wipe_package_on_409)
+
       self.__project_dir = determine_project_root()
       self.__sync_branch = sync_branch
+      self.__container_builder = container_builder
+
+      self.__build_cache = None
+      if options.build_cache:
+        self.__build_cache = BuildCache(
+            options.build_cache_dir,
+            max_bytes=options.build_cache_max_mb * 1024 * 1024)
+
+      self.__build_history = BuildHistory(options.build_history_path)
+
+  @property
+  def build_cache(self):
+    return self.__build_cache
 
   def determine_gradle_root(self, name):
       if self.__options.platform == "debian":
@@ -235,8 +317,7 @@ class Builder(object):
     if options.gradle_cache_path:
       extra_args.append('--gradle-user-home={}'.format(options.gradle_cache_path))
 
-    if (not options.run_unit_tests or
-            (name == 'deck' and not 'CHROME_BIN' in os.environ)):
+    if cls.__should_skip_tests(name, options):
       extra_args.append('-x test')
 
     if name == 'halyard':
@@ -310,8 +391,7 @@ class Builder(object):
     if options.gradle_cache_path:
       extra_args.append('--gradle-user-home={}'.format(options.gradle_cache_path))
 
-    if (not options.run_unit_tests or
-            (name == 'deck' and not 'CHROME_BIN' in os.environ)):
+    if cls.__should_skip_tests(name, options):
       extra_args.append('-x test')
 
     # Currently spinnaker is in a separate location
@@ -380,7 +460,11 @@ class Builder(object):
     logfile = '{name}-gcb-build.log'.format(name=name)
     if os.path.exists(logfile):
       os.remove(logfile)
-    run_shell_and_log(cmds, logfile, cwd=gradle_root)
+    try:
+      run_shell_and_log(cmds, logfile, cwd=gradle_root)
+    except subprocess.CalledProcessError as ex:
+      raise_if_quota_error(name, logfile, ex)
+      raise
 
   @classmethod
   def __gcb_trigger_build(cls, name, gradle_root, gcb_service_account, gcb_service_account_json, gcb_project, mirror_base_url, sync_branch):
@@ -395,6 +479,11 @@ class Builder(object):
       'git remote add mirror {base_url}/{name}.git'.format(base_url=mirror_base_url, name=name),
       'git fetch mirror'
     ]
+    remotes = run_quick('git -C {name} remote'.format(name=name),
+                        echo=False).stdout.split()
+    if 'mirror' in remotes:
+      # We are retrying a build so the mirror is already configured.
+      add_mirror_cmds = add_mirror_cmds[1:]
     run_shell_and_log(add_mirror_cmds, logfile, cwd=gradle_root)
 
     all_remote_branches = run_quick('git -C {name} branch -r'.format(name=name),
@@ -465,7 +554,10 @@ class Builder(object):
                 log.write('\n---\nFinished fetching GCB build logs')
 
                 if status == 'FAILURE':
-                  raise Exception('Triggered GCB build for {name} failed.'.format(name=comp_name))
+                  failure = 'Triggered GCB build for {name} failed.'.format(name=comp_name)
+                  if QUOTA_ERROR_RE.search(build_log):
+                    raise QuotaExceededError(failure)
+                  raise Exception(failure)
         time_elapsed = (datetime.datetime.now() - start_time).seconds
       if time_elapsed >= GCB_BUILD_STATUS_TIMEOUT:
         raise Exception('GCB triggered build for {} timed out'.format(name))
@@ -497,115 +589,8 @@ class Builder(object):
     run_shell_and_log(cmds, logfile, cwd=gradle_root)
 
   def publish_to_bintray(self, source, package, version, path, debian_tags=''):
-    bintray_key = os.environ['BINTRAY_KEY']
-    bintray_user = os.environ['BINTRAY_USER']
-    parts = self.__options.bintray_repo.split('/')
-    if len(parts) != 2:
-      raise ValueError(
-          'Expected --bintray_repo to be in the form <owner>/<repo>')
-    subject, repo = parts[0], parts[1]
-
-    pkg_filename = os.path.basename(path)
-    if (pkg_filename.startswith('spinnaker-')
-        and not package.startswith('spinnaker')):
-      package = 'spinnaker-' + package
-
-    if debian_tags and debian_tags[0] != ';':
-      debian_tags = ';' + debian_tags
-
-    url = ('https://api.bintray.com/content'
-           '/{subject}/{repo}/{package}/{version}/{path}'
-           '{debian_tags}'
-           ';publish=1;override=1'
-           .format(subject=subject, repo=repo, package=package,
-                   version=version, path=path,
-                   debian_tags=debian_tags))
-
-    with open(source, 'r') as f:
-        data = f.read()
-        put_request = urllib2.Request(url)
-        encoded_auth = base64.encodestring('{user}:{pwd}'.format(
-            user=bintray_user, pwd=bintray_key))[:-1]  # strip eoln
-
-        put_request.add_header('Authorization', 'Basic ' + encoded_auth)
-        put_request.get_method = lambda: 'PUT'
-        try:
-            result = urllib2.urlopen(put_request, data)
-        except HTTPError as put_error:
-            if put_error.code == 409 and self.__options.wipe_package_on_409:
-              # The problem here is that BinTray does not allow packages to change once
-              # they have been published (even though we are explicitly asking it to
-              # override). PATCH wont work either.
-              # Since we are building from source, we don't really have a version
-              # yet, since we are still modifying the code. Either we need to generate a new
-              # version number every time or we don't want to publish these.
-              # Ideally we could control whether or not to publish. However,
-              # if we do not publish, then the repository will not be visible without
-              # credentials, and adding conditional credentials into the packer scripts
-              # starts getting even more complex.
-              #
-              # We cannot seem to delete individual versions either (at least not for
-              # InstallSpinnaker.sh, which is where this problem seems to occur),
-              # so we'll be heavy handed and wipe the entire package.
-              print 'Got 409 on {url}.'.format(url=url)
-              delete_url = ('https://api.bintray.com/content'
-                            '/{subject}/{repo}/{path}'
-                            .format(subject=subject, repo=repo, path=path))
-              print 'Attempt to delete url={url} then retry...'.format(url=delete_url)
-              delete_request = urllib2.Request(delete_url)
-              delete_request.add_header('Authorization', 'Basic ' + encoded_auth)
-              delete_request.get_method = lambda: 'DELETE'
-              try:
-                urllib2.urlopen(delete_request)
-                print 'Deleted...'
-              except HTTPError as ex:
-                # Maybe it didn't exist. Try again anyway.
-                print 'Delete {url} got {ex}. Try again anyway.'.format(url=url, ex=ex)
-              print 'Retrying {url}'.format(url=url)
-              result = urllib2.urlopen(put_request, data)
-              print 'SUCCESS'
-
-            elif put_error.code != 400:
-              raise
-
-            else:
-              # Try creating the package and retrying.
-              pkg_url = os.path.join('https://api.bintray.com/packages',
-                                     subject, repo)
-              print 'Creating an entry for {package} with {pkg_url}...'.format(
-                  package=package, pkg_url=pkg_url)
-
-              # All the packages are from spinnaker so we'll hardcode it.
-              # Note spinnaker-monitoring is a github repo with two packages.
-              # Neither is "spinnaker-monitoring"; that's only the github repo.
-              gitname = (package.replace('spinnaker-', '')
-                         if not package.startswith('spinnaker-monitoring')
-                         else 'spinnaker-monitoring')
-              pkg_data = """{{
-                "name": "{package}",
-                "licenses": ["Apache-2.0"],
-                "vcs_url": "https://github.com/spinnaker/{gitname}.git",
-                "website_url": "http://spinnaker.io",
-                "github_repo": "spinnaker/{gitname}",
-                "public_download_numbers": false,
-                "public_stats": false
-              }}'""".format(package=package, gitname=gitname)
-
-              pkg_request = urllib2.Request(pkg_url)
-              pkg_request.add_header('Authorization', 'Basic ' + encoded_auth)
-              pkg_request.add_header('Content-Type', 'application/json')
-              pkg_request.get_method = lambda: 'POST'
-              pkg_result = urllib2.urlopen(pkg_request, pkg_data)
-              pkg_code = pkg_result.getcode()
-              if pkg_code >= 200 and pkg_code < 300:
-                  result = urllib2.urlopen(put_request, data)
-
-        code = result.getcode()
-        if code < 200 or code >= 300:
-          raise ValueError('{code}: Could not add version to {url}\n{msg}'
-                           .format(code=code, url=url, msg=result.read()))
-
-    print 'Wrote {source} to {url}'.format(source=source, url=url)
+    self.__bintray_publisher.publish(
+        BintrayUpload(source, package, version, path, debian_tags))
 
   def publish_install_script(self, source):
     gradle_root = self.determine_gradle_root('spinnaker')
@@ -620,15 +605,33 @@ class Builder(object):
     Args:
       source [string]: The path to the source to copy must be local.
     """
-    path = os.path.basename(source)
+    self.publish_files([(source, package)], version)
+
+  def publish_files(self, sources, version, stage=False):
+    """Write files to the bintray repository in parallel.
+
+    Args:
+      sources [list of (string, string)]: The local (path, package) to copy.
+      version [string]: The version of the packages being published.
+      stage [boolean]: Upload the files unpublished until publish_staged().
+    """
     debian_tags = ''
     if self.__options.platform == 'debian':
       debian_tags = ';'.join(['deb_component=spinnaker',
                               'deb_distribution=trusty,utopic,vivid,wily',
                               'deb_architecture=all'])
 
-    self.publish_to_bintray(source, package=package, version=version,
-                            path=path, debian_tags=debian_tags)
+    uploads = [BintrayUpload(source, package, version,
+                             os.path.basename(source), debian_tags)
+               for source, package in sources]
+    self.__bintray_publisher.publish_all(
+        uploads, concurrency=self.__options.bintray_upload_concurrency,
+        stage=stage)
+
+  def publish_staged(self, discard=False):
+    """Publish or discard the files staged by publish_files."""
+    if self.__bintray_publisher:
+      self.__bintray_publisher.publish_staged(discard=discard)
 
   def start_copy_debian_target(self, name):
       """Copies the debian package for the specified subsystem.
@@ -642,6 +645,7 @@ class Builder(object):
       if version is None:
         return []
 
+      sources = []
       for root in determine_modules_with_debians(gradle_root):
         deb_dir = '{root}/build/distributions'.format(root=root)
 
@@ -669,9 +673,10 @@ class Builder(object):
         self.__package_list.append(from_path)
         basename = os.path.basename(from_path)
         module_name = basename[0:basename.find('_')]
-        if self.__options.bintray_repo:
-          self.publish_file(from_path, module_name, version)
+        sources.append((from_path, module_name))
 
+      if self.__options.bintray_repo:
+        self.publish_files(sources, version, stage=True)
       return pids
 
   def start_copy_redhat_target(self, name):
@@ -686,6 +691,7 @@ class Builder(object):
       if version is None:
         return []
 
+      sources = []
       for root in determine_modules_with_redhats(gradle_root):
         rpm_dir = '{root}/build/distributions'.format(root=root)
 
@@ -713,38 +719,148 @@ class Builder(object):
         self.__package_list.append(from_path)
         basename = os.path.basename(from_path)
         module_name = re.search("^(.*)-{}.noarch.rpm$".format(version), basename).group(1)
-        if self.__options.bintray_repo:
-          self.publish_file(from_path, module_name, version)
+        sources.append((from_path, module_name))
 
+      if self.__options.bintray_repo:
+        self.publish_files(sources, version, stage=True)
       return pids
 
+  @staticmethod
+  def __should_skip_tests(name, options):
+    """Determine whether the subsystem's unit tests are skipped in its build.
+
+    Deck's tests need a browser, so are skipped without one.
+    """
+    return (not options.run_unit_tests or
+            (name == 'deck' and not 'CHROME_BIN' in os.environ))
+
+  def __determine_build_cache_key(self, kind, name):
+    """Determine the build cache key for a subsystem.
+
+    Args:
+      kind [string]: The kind of build (package, container or jar).
+      name [string]: The name of the subsystem repository.
+
+    Only package builds that leave their artifacts locally for the copy
+    step are cached. Nebula package builds, containers and jars publish as
+    part of the build itself, so skipping one would silently skip publishing
+    it under the new build number and version.
+
+    Builds from a work tree with uncommitted changes are not cached since
+    the commit does not describe them. Redhat packages embed the build
+    number, so they are only cached when it is given explicitly rather than
+    defaulting to the time of the run. In practice the cache is for
+    --nonebula debian builds.
+
+    Returns:
+      The cache key, or None if the build should not be cached.
+    """
+    options = self.__options
+    if self.__build_cache is None or kind != 'package' or options.nebula:
+      return None
+
+    if options.platform == 'redhat' and self.__build_number_is_default:
+      return None
+
+    gradle_root = self.determine_gradle_root(name)
+    commit = run_quick('git -C {root} rev-parse HEAD'.format(root=gradle_root),
+                       echo=False)
+    if commit.returncode != 0:
+      return None
+
+    status = run_quick('git -C {root} status --porcelain'.format(
+        root=gradle_root), echo=False)
+    if status.returncode != 0 or status.stdout.strip():
+      print 'Not caching {name} because it has uncommitted changes.'.format(
+          name=name)
+      return None
+
+    # The package version comes from the last tag, which can move to a new
+    # version without the commit changing.
+    tag = run_quick('git -C {root} describe --tags --abbrev=0'.format(
+        root=gradle_root), echo=False)
+    if tag.returncode != 0:
+      return None
+
+    version_inputs = {'tag': tag.stdout.strip()}
+    if options.platform == 'redhat':
+      version_file = '{0}-rpm-version.txt'.format(
+          os.path.basename(os.path.normpath(gradle_root)))
+      if not os.path.exists(version_file):
+        return None
+      with open(version_file, 'r') as f:
+        version_inputs['rpm_version'] = f.read().strip()
+      version_inputs['build_number'] = self.__build_number
+
+    return BuildCache.make_key(
+        name, commit.stdout.strip(), kind=kind, platform=options.platform,
+        skip_tests=self.__should_skip_tests(name, options), **version_inputs)
+
+  def __build_unless_cached(self, kind, name, build_func, artifact_func=None):
+    """Run a subsystem build unless an identical build is already cached.
+
+    Args:
+      kind [string]: The kind of build (package, container or jar).
+      name [string]: The name of the subsystem repository.
+      build_func [callable]: Builds the named subsystem.
+      artifact_func [callable]: Given the gradle root, returns the artifacts
+         to cache relative to it. None if the build has no local artifacts,
+         in which case it is never cached.
+
+    Returns:
+      True if the build ran, False if it was skipped.
+    """
+    key = self.__determine_build_cache_key(kind, name)
+    gradle_root = self.determine_gradle_root(name)
+    if key is not None and self.__build_cache.lookup(key, gradle_root):
+      print 'Skipping {kind} build of {name}: cached as {key}.'.format(
+          kind=kind, name=name, key=key)
+      return False
+
+    start_time = time.time()
+    build_func(name)
+    self.__build_history.record(name, kind, time.time() - start_time)
+    if key is not None and artifact_func is not None:
+      artifacts = artifact_func(gradle_root)
+      if not artifacts:
+        return True
+      self.__build_cache.store(key, gradle_root, artifacts,
+                               component=name, kind=kind)
+    return True
+
   def __do_jar_build(self, subsys):
     if self.__options.do_jar_build:
       try:
-        self.start_jar_build(subsys)
+        self.__build_unless_cached('jar', subsys, self.start_jar_build)
       except Exception as ex:
         self.__build_failures.append(BuildFailure(subsys, ex))
 
   def __do_build(self, subsys):
-    if self.__options.platform == 'debian':
+    """Build the subsystem's package.
+
+    Returns:
+      True if the package is available, False if the build failed.
+    """
+    platform = self.__options.platform
+    artifact_func = lambda root: determine_package_artifacts(platform, root)
+    if platform == 'debian':
       try:
-        self.start_deb_build(subsys)
+        self.__build_unless_cached(
+            'package', subsys, self.start_deb_build, artifact_func)
       except Exception as ex:
         self.__build_failures.append(BuildFailure(subsys, ex))
-    elif self.__options.platform == 'redhat':
+        return False
+    elif platform == 'redhat':
       try:
-        self.start_rpm_build(subsys)
+        self.__build_unless_cached(
+            'package', subsys, self.start_rpm_build, artifact_func)
       except Exception as ex:
         self.__build_failures.append(BuildFailure(subsys, ex))
+        return False
+    return True
 
   def __do_container_build(self, subsys):
-    try:
-      # HACK: Space out the container builds to address scalability concerns.
-      full_subsystem_list = SUBSYSTEM_LIST + ADDITIONAL_SUBSYSTEMS
-      time.sleep(2 * full_subsystem_list.index(subsys))
-      self.start_container_build(subsys)
-    except Exception as ex:
-      self.__build_failures.append(BuildFailure(subsys, ex))
+    self.__build_unless_cached('container', subsys, self.start_container_build)
 
   def __check_build_failures(self, subsystems):
     if self.__build_failures:
@@ -768,10 +884,22 @@ class Builder(object):
     subsystems.append('spinnaker-monitoring')
 
     if self.__options.container_builder:
-      weighted_processes = self.__options.cpu_ratio * multiprocessing.cpu_count()
-      pool = multiprocessing.pool.ThreadPool(
-        processes=int(max(1, weighted_processes)))
-      pool.map(self.__do_container_build, subsystems)
+      options = self.__options
+      bucket = TokenBucket(rate=options.container_builds_per_minute / 60.0,
+                           capacity=options.container_build_burst)
+      scheduler = BuildScheduler(
+          bucket, max_in_flight=options.max_container_builds_in_flight,
+          max_retries=options.container_build_max_retries)
+      ordered = self.__build_history.order_longest_first(
+          subsystems, ['container'])
+      try:
+        timings = scheduler.run(ordered, self.__do_container_build)
+      finally:
+        self.__build_history.save()
+      for timing in timings:
+        if timing.error:
+          self.__build_failures.append(BuildFailure(timing.name, timing.error))
+      print BuildScheduler.format_timings(timings)
 
     self.__check_build_failures(subsystems)
 
@@ -794,32 +922,73 @@ class Builder(object):
       all_subsystems.extend(SUBSYSTEM_LIST)
       all_subsystems.extend(ADDITIONAL_SUBSYSTEMS)
 
-      if self.__options.build:
+      # Nebula publishes the packages as part of the build.
+      copying = not self.__options.nebula
+      phases = ['package', 'copy'] if copying else ['package']
+      ordered = self.__build_history.order_longest_first(
+          all_subsystems, phases)
+
+      # Each package is copied as soon as its own build finishes rather
+      # than waiting for all the builds. The copies only stage the packages
+      # in bintray. They are not published until all the required subsystems
+      # have built, so a failed release does not leave a partial one behind.
+      # The copies are mostly waiting on the network so do not count against
+      # the build pool, but are bounded so the longest builds copy first.
+      # Once a required subsystem fails to build, the release is going to
+      # fail, so no more packages are copied.
+      copy_pool = None
+      copy_results = []
+      required_build_failed = threading.Event()
+      if copying:
+        copy_pool = multiprocessing.pool.ThreadPool(
+            processes=max(1, self.__options.bintray_upload_concurrency))
+
+      def build_then_copy(subsys):
+        if self.__options.build and not self.__do_build(subsys):
+          if subsys in SUBSYSTEM_LIST:
+            required_build_failed.set()
+          return
+        if copy_pool is None:
+          return
+        if required_build_failed.is_set():
+          print 'Not copying {0} because a required build failed.'.format(
+              subsys)
+          return
+        copy_results.append(copy_pool.apply_async(self.__do_copy, [subsys]))
+
+      try:
         # Build in parallel using half available cores
         # to keep load in check.
         weighted_processes = self.__options.cpu_ratio * multiprocessing.cpu_count()
         pool = multiprocessing.pool.ThreadPool(
             processes=int(max(1, weighted_processes)))
-        pool.map(self.__do_build, all_subsystems)
-
-      self.__check_build_failures(SUBSYSTEM_LIST)
-
-      if self.__options.nebula:
-        return
+        pool.map(build_then_copy, ordered)
+
+        if copy_pool is not None:
+          copy_pool.close()
+          copy_pool.join()
+          if not copy_results and not required_build_failed.is_set():
+            print 'Nothing to copy.'
+          for result in copy_results:
+            result.get()
+        self.__check_build_failures(SUBSYSTEM_LIST)
+      except:
+        if copying:
+          try:
+            self.publish_staged(discard=True)
+          except Exception as ex:
+            print 'Could not discard the staged packages: {0}'.format(ex)
+        raise
+      finally:
+        self.__build_history.save()
 
-      # Do not choke if there is nothing to copy
-      failed_components = [failure.component for failure in self.__build_failures]
-      wait_on = set(all_subsystems).difference(set(failed_components))
-      if len(wait_on) > 0:
-        pool = multiprocessing.pool.ThreadPool(processes=len(wait_on))
-        print 'Copying packages...'
-        pool.map(self.__do_copy, wait_on)
-      else:
-        print 'Nothing to copy.'
+      if copying:
+        self.publish_staged()
       return
 
   def __do_copy(self, subsys):
     print 'Starting to copy {0}...'.format(subsys)
+    start_time = time.time()
     if self.__options.platform == 'debian':
       pids = self.start_copy_debian_target(subsys)
 
@@ -828,6 +997,7 @@ class Builder(object):
 
     for p in pids:
       p.check_wait()
+    self.__build_history.record(subsys, 'copy', time.time() - start_time)
     print 'Finished copying {0}.'.format(subsys)
 
   @classmethod
@@ -879,6 +1049,14 @@ class Builder(object):
       parser.add_argument(
           '--nowipe_package_on_409', dest='wipe_package_on_409',
           action='store_false')
+      parser.add_argument(
+          '--bintray_upload_concurrency', type=int, default=4,
+          help='The maximum number of concurrent uploads to bintray.'
+               ' This is also the number of keep-alive connections used.')
+      parser.add_argument(
+          '--bintray_max_retries', type=int, default=5,
+          help='The number of times to retry a failed bintray request,'
+               ' backing off exponentially between attempts.')
 
       parser.add_argument(
           '--nebula', default=True, action='store_true',
@@ -905,6 +1083,47 @@ class Builder(object):
           '--do_jar_build', type=bool, default=True,
           help='Build & publish jars independently to GCS.')
 
+      parser.add_argument(
+          '--container_builds_per_minute', type=float, default=12,
+          help='The sustained rate that container builds are submitted at.'
+               ' This is halved whenever the builder reports a quota error.')
+      parser.add_argument(
+          '--container_build_burst', type=int, default=3,
+          help='The number of container builds that can be submitted at once'
+               ' before --container_builds_per_minute applies.')
+      parser.add_argument(
+          '--max_container_builds_in_flight', type=int, default=6,
+          help='The maximum number of container builds running at once.')
+      parser.add_argument(
+          '--container_build_max_retries', type=int, default=3,
+          help='The number of times to retry a container build rejected'
+               ' for quota or rate limiting reasons.')
+
+      parser.add_argument(
+          '--build_history_path',
+          default=os.path.join(os.environ.get('HOME', ''), '.cache',
+                               'spinnaker-build-history.json'),
+          help='A file recording how long recent builds took, used to start'
+               ' the longest expected builds first.')
+
+      parser.add_argument(
+          '--build_cache', default=True, action='store_true',
+          help='Skip building packages whose commit, version and build flags'
+               ' match a previously cached build. Only builds that are copied'
+               ' to bintray afterwards are cached; builds that publish'
+               ' directly (--nebula, containers and jars) always run.')
+      parser.add_argument(
+          '--no_build_cache', dest='build_cache', action='store_false',
+          help='Rebuild every component regardless of the build cache.')
+      parser.add_argument(
+          '--build_cache_dir',
+          default=os.path.join(os.environ.get('HOME', ''), '.cache',
+                               'spinnaker-build'),
+          help='The directory to keep the build cache in.')
+      parser.add_argument(
+          '--build_cache_max_mb', type=int, default=10240,
+          help='Evict the least recently used builds beyond this size.')
+
   def __verify_bintray(self):
     if not os.environ.get('BINTRAY_KEY', None):
       raise ValueError('BINTRAY_KEY environment variable not defined')
@@ -938,6 +1157,9 @@ class Builder(object):
       print "Starting container build..."
       builder.build_container_images()
 
+    if builder.build_cache:
+      print builder.build_cache.summary()
+
     if options.build and options.bintray_repo:
       fd, temp_path = tempfile.mkstemp()
       with open(os.path.join(determine_project_root(), 'InstallSpinnaker.sh'),
@@ -0,0 +1,284 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Schedules builds and the work that follows them."""
+
+import collections
+import json
+import multiprocessing.pool
+import os
+import re
+import threading
+import time
+
+
+# Matches build output indicating the backend refused the build for quota
+# or rate limiting reasons rather than because the build itself failed.
+# These are only the rejections reported by gcloud and the Google APIs
+# (status, error reason and HTTP status line) since build and test output
+# routinely mentions quotas, rate limits and the number 429 on its own.
+QUOTA_ERROR_RE = re.compile(
+    r'(\bRESOURCE_EXHAUSTED\b'
+    r'|Quota exceeded for quota (?:metric|group|limit)'
+    r'|\brateLimitExceeded\b'
+    r'|\bHTTP(?:/\d(?:\.\d)?| ?Error)? 429\b'
+    r'|\b429 Too Many Requests\b)')
+
+
+BuildTiming = collections.namedtuple(
+    'BuildTiming', ['name', 'queue_secs', 'run_secs', 'attempts', 'error'])
+
+
+class QuotaExceededError(Exception):
+  """Denotes a build rejected by the backend due to quota or rate limits."""
+  pass
+
+
+class TokenBucket(object):
+  """A thread-safe token bucket limiting how often builds are submitted.
+
+  The bucket adapts to the backend: each penalize() halves the refill rate
+  (down to min_rate) and each reward() recovers part of it again.
+  """
+
+  @property
+  def rate(self):
+    return self.__rate
+
+  def __init__(self, rate, capacity, min_rate=None,
+               clock=time.time, sleep=time.sleep):
+    """Constructor.
+
+    Args:
+      rate [float]: The number of tokens added per second.
+      capacity [float]: The maximum number of tokens, allowing bursts.
+      min_rate [float]: The slowest rate that penalize() will go down to.
+      clock [callable]: Returns the current time in seconds.
+      sleep [callable]: Sleeps for the given number of seconds.
+    """
+    self.__max_rate = float(rate)
+    self.__min_rate = float(min_rate or rate / 8.0)
+    self.__rate = float(rate)
+    self.__capacity = float(capacity)
+    self.__tokens = float(capacity)
+    self.__clock = clock
+    self.__sleep = sleep
+    self.__last_refill = clock()
+    self.__lock = threading.Lock()
+
+  def acquire(self):
+    """Take a token, blocking until one is available.
+
+    Returns:
+      The number of seconds spent waiting.
+    """
+    waited = 0.0
+    while True:
+      with self.__lock:
+        now = self.__clock()
+        self.__tokens = min(
+            self.__capacity,
+            self.__tokens + (now - self.__last_refill) * self.__rate)
+        self.__last_refill = now
+        if self.__tokens >= 1:
+          self.__tokens -= 1
+          return waited
+        delay = (1 - self.__tokens) / self.__rate
+      self.__sleep(delay)
+      waited += delay
+
+  def penalize(self):
+    """Slow down after the backend rejected a submission."""
+    with self.__lock:
+      self.__rate = max(self.__min_rate, self.__rate / 2)
+      self.__tokens = min(self.__tokens, 0.0)
+
+  def reward(self):
+    """Speed back up after the backend accepted a submission."""
+    with self.__lock:
+      self.__rate = min(self.__max_rate,
+                        self.__rate + (self.__max_rate - self.__min_rate) / 4)
+
+
+class BuildScheduler(object):
+  """Runs builds with a bounded number in flight and a limited start rate.
+
+  Builds failing with a QuotaExceededError are retried after an exponential
+  backoff. Other errors fail the build immediately.
+  """
+
+  def __init__(self, bucket, max_in_flight, max_retries=3,
+               initial_backoff_secs=30, max_backoff_secs=300,
+               sleep=time.sleep):
+    """Constructor.
+
+    Args:
+      bucket [TokenBucket]: Limits the rate that builds are started.
+      max_in_flight [int]: The maximum number of concurrent builds.
+      max_retries [int]: The number of times to retry a rejected build.
+      initial_backoff_secs [float]: The delay before the first retry.
+      max_backoff_secs [float]: The longest delay between retries.
+      sleep [callable]: Sleeps for the given number of seconds.
+    """
+    self.__bucket = bucket
+    self.__max_in_flight = max(1, max_in_flight)
+    self.__max_retries = max_retries
+    self.__initial_backoff_secs = initial_backoff_secs
+    self.__max_backoff_secs = max_backoff_secs
+    self.__sleep = sleep
+
+  def run(self, names, build_func):
+    """Build each of the named components.
+
+    Args:
+      names [list of string]: The components to build, in submission order.
+      build_func [callable]: Builds the component with the given name.
+
+    Returns:
+      A list of BuildTiming in the same order as names.
+    """
+    if not names:
+      return []
+
+    submit_time = time.time()
+    pool = multiprocessing.pool.ThreadPool(
+        processes=min(self.__max_in_flight, len(names)))
+    try:
+      return pool.map(lambda name: self.__run_one(name, build_func,
+                                                  submit_time),
+                      names)
+    finally:
+      pool.close()
+      pool.join()
+
+  def __run_one(self, name, build_func, submit_time):
+    queue_secs = time.time() - submit_time
+    run_secs = 0.0
+    backoff_secs = self.__initial_backoff_secs
+    attempts = 0
+    while True:
+      queue_secs += self.__bucket.acquire()
+      attempts += 1
+      start_time = time.time()
+      try:
+        build_func(name)
+        run_secs += time.time() - start_time
+        self.__bucket.reward()
+        return BuildTiming(name, queue_secs, run_secs, attempts, None)
+      except QuotaExceededError as ex:
+        run_secs += time.time() - start_time
+        self.__bucket.penalize()
+        if attempts > self.__max_retries:
+          return BuildTiming(name, queue_secs, run_secs, attempts, ex)
+        print ('{name} build was rejected ({ex}).'
+               ' Retrying in {secs}s...'.format(
+                   name=name, ex=ex, secs=backoff_secs))
+        self.__sleep(backoff_secs)
+        queue_secs += backoff_secs
+        backoff_secs = min(backoff_secs * 2, self.__max_backoff_secs)
+      except Exception as ex:
+        run_secs += time.time() - start_time
+        return BuildTiming(name, queue_secs, run_secs, attempts, ex)
+
+  @staticmethod
+  def format_timings(timings):
+    """Returns a printable table of where each build spent its time."""
+    lines = ['{0:<24} {1:>9} {2:>9} {3:>8}  {4}'.format(
+        'BUILD', 'QUEUED', 'RAN', 'ATTEMPTS', 'RESULT')]
+    for timing in timings:
+      lines.append('{0:<24} {1:>8.1f}s {2:>8.1f}s {3:>8}  {4}'.format(
+          timing.name, timing.queue_secs, timing.run_secs, timing.attempts,
+          'FAILED' if timing.error else 'OK'))
+    return '\n'.join(lines)
+
+
+class BuildHistory(object):
+  """Remembers how long recent builds of each component took.
+
+  The history is a JSON file mapping '<component>/<phase>' to the most
+  recent durations in seconds. It is used to start the builds expected to
+  take longest first so that they do not stretch out the wall clock time.
+  validate_bom__test keeps its own history of test durations the same way.
+  """
+
+  # The number of recent durations to remember for each component phase.
+  MAX_SAMPLES = 5
+
+  def __init__(self, path):
+    """Constructor.
+
+    Args:
+      path [string]: The path to the history file, which need not exist.
+    """
+    self.__path = path
+    self.__lock = threading.Lock()
+    try:
+      with open(path, 'r') as f:
+        self.__durations = json.loads(f.read())
+    except (IOError, ValueError):
+      self.__durations = {}
+
+  def expected_secs(self, component, phase):
+    """Returns the expected duration, or None if there is no history."""
+    with self.__lock:
+      samples = sorted(self.__durations.get(
+          '{0}/{1}'.format(component, phase), []))
+    if not samples:
+      return None
+    return samples[len(samples) / 2]
+
+  def record(self, component, phase, secs):
+    """Add a duration to the history."""
+    key = '{0}/{1}'.format(component, phase)
+    with self.__lock:
+      samples = self.__durations.setdefault(key, [])
+      samples.append(round(secs, 1))
+      del samples[:-self.MAX_SAMPLES]
+
+  def order_longest_first(self, components, phases):
+    """Sort components by their total expected duration, longest first.
+
+    Components without any history are put first since they might be long.
+    Phases missing from an otherwise known component are assumed to be quick.
+
+    Args:
+      components [list of string]: The components to order.
+      phases [list of string]: The phases to add up for each component.
+
+    Returns:
+      A new list of the components.
+    """
+    def expected_total(component):
+      known = [secs for secs in [self.expected_secs(component, phase)
+                                 for phase in phases]
+               if secs is not None]
+      return sum(known) if known else float('inf')
+
+    return sorted(components, key=expected_total, reverse=True)
+
+  def save(self):
+    """Write the history file."""
+    with self.__lock:
+      content = json.dumps(self.__durations, indent=2, sort_keys=True)
+    try:
+      parent = os.path.dirname(self.__path)
+      if parent and not os.path.exists(parent):
+        os.makedirs(parent)
+      temp_path = self.__path + '.tmp'
+      with open(temp_path, 'w') as f:
+        f.write(content)
+      os.rename(temp_path, self.__path)
+    except (IOError, OSError) as ex:
+      print 'Could not write build history {path}: {ex}'.format(
+          path=self.__path, ex=ex)
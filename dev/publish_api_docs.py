@@ -29,6 +29,7 @@ import time
 import yaml
 
 from spinnaker.run import check_run_quick
+from spinnaker.yaml_util import load_yaml
 
 class ApiDocsPublisher():
 
@@ -51,7 +52,7 @@ class ApiDocsPublisher():
 
     with open(bom_file, 'r') as stream:
       try:
-        bom = yaml.load(stream)
+        bom = load_yaml(stream)
         return bom['services']['gate']['version']
       except yaml.YAMLError as err:
         print 'Failed to load Gate version from BOM.'
@@ -18,7 +18,6 @@ import argparse
 import datetime
 import os
 import sys
-import yaml
 
 from github import Github
 from github.Gist import Gist
@@ -26,6 +25,7 @@ from github.InputFileContent import InputFileContent
 
 from generate_bom import BomGenerator
 from spinnaker.run import check_run_quick, run_quick
+from spinnaker.yaml_util import load_yaml
 
 SERVICES = 'services'
 VERSION = 'version'
@@ -88,7 +88,7 @@ class BomPublisher(BomGenerator):
     bom_yaml_string = run_quick('hal version bom {0} --color false --quiet'
                                 .format(self.__rc_version), echo=False).stdout.strip()
     print 'bom yaml string pulled by hal: \n\n{0}\n\n'.format(bom_yaml_string)
-    self.__bom_dict = yaml.load(bom_yaml_string)
+    self.__bom_dict = load_yaml(bom_yaml_string)
     print self.__bom_dict
 
   def publish_release_bom(self):
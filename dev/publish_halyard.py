@@ -34,12 +34,12 @@ import argparse
 import datetime
 import os
 import sys
-import yaml
 
 from annotate_source import Annotator
 from build_release import run_shell_and_log
 from publish_bom import format_stable_branch
 from spinnaker.run import check_run_quick
+from spinnaker.yaml_util import load_yaml
 
 
 class HalyardPublisher(object):
@@ -79,7 +79,7 @@ class HalyardPublisher(object):
     nightly_commit_file = '{0}/nightly-version-commits.yml'.format(local_bucket_name)
     nightly_commit_dict = {}
     with open(nightly_commit_file, 'r') as ncf:
-      nightly_commit_dict = yaml.load(ncf.read())
+      nightly_commit_dict = load_yaml(ncf.read())
 
     # Check Halyard out at the correct commit.
     commit_to_build = nightly_commit_dict.get(self.__nightly_version, None)
@@ -16,9 +16,9 @@
 
 import argparse
 import sys
-import yaml
 
 from spinnaker.run import check_run_quick
+from spinnaker.yaml_util import load_yaml
 
 COMPONENTS = [
   'clouddriver',
@@ -52,7 +52,7 @@ class SourceReconstructor(object):
     bom_yaml_string = check_run_quick('hal version bom {0} --color false --quiet'
                                       .format(self.__bom_version), echo=False).stdout.strip()
     print 'bom yaml string pulled by hal: \n\n{0}\n\n'.format(bom_yaml_string)
-    self.__bom_dict = yaml.load(bom_yaml_string)
+    self.__bom_dict = load_yaml(bom_yaml_string)
 
   def __checkout_components(self):
     git_prefix = self.__bom_dict['artifactSources']['gitPrefix']
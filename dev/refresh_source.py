@@ -18,6 +18,11 @@ import argparse
 import collections
 import os
 import sys
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+from StringIO import StringIO
 
 from spinnaker.run import check_run_and_monitor
 from spinnaker.run import check_run_quick
@@ -52,6 +57,59 @@ class SourceRepository(
   pass
 
 
+class RefreshResult(
+          collections.namedtuple('RefreshResult',
+                                 ['repository', 'error', 'secs', 'output'])):
+  """Denotes the outcome of refreshing a repository.
+
+  Attributes:
+    repository: The SourceRepository that was refreshed.
+    error: The exception raised while refreshing, or None if it succeeded.
+    secs: The number of seconds spent refreshing the repository.
+    output: The output captured while refreshing, if it was captured.
+  """
+  pass
+
+
+class RefreshInterrupted(Exception):
+  """Carries a KeyboardInterrupt from a refresh thread to the main thread.
+
+  The thread pool's workers do not survive a KeyboardInterrupt, so it is
+  passed back as an ordinary exception and raised again from there.
+  """
+  pass
+
+
+class ThreadOutputRouter(object):
+  """A stream that lets individual threads capture what they write to it.
+
+  This is used in place of sys.stdout and sys.stderr so that concurrent
+  refreshes do not interleave their output.
+  """
+
+  def __init__(self, stream):
+    self.__stream = stream
+    self.__local = threading.local()
+
+  def __getattr__(self, name):
+    return getattr(self.__stream, name)
+
+  def capture(self, buffer):
+    """Redirect writes from the current thread into buffer until released."""
+    self.__local.buffer = buffer
+
+  def release(self):
+    self.__local.buffer = None
+
+  def write(self, text):
+    buffer = getattr(self.__local, 'buffer', None)
+    (buffer or self.__stream).write(text)
+
+  def flush(self):
+    if getattr(self.__local, 'buffer', None) is None:
+      self.__stream.flush()
+
+
 class Refresher(object):
   """Provides branch management capabilities across Spinnaker repositories.
 
@@ -352,15 +410,127 @@ class Refresher(object):
                                 dir=repository_dir, branch=self.push_branch),
                             echo=True)
 
+  def __refresh_repository(self, func, repository, capture):
+      """Apply func to the repository, noting how it went.
+
+      Args:
+        func [callable]: The function taking the repository to refresh.
+        repository [SourceRepository]: The repository to refresh.
+        capture [bool]: Whether to capture the output from this thread
+            rather than writing it out as it happens.
+
+      Returns:
+        RefreshResult
+      """
+      output = StringIO() if capture else None
+      if capture:
+        sys.stdout.capture(output)
+        sys.stderr.capture(output)
+
+      start_time = time.time()
+      error = None
+      try:
+        func(repository)
+      except KeyboardInterrupt:
+        raise
+      except BaseException as ex:
+        # Catch SystemExit too, since that is how a missing required
+        # repository is reported and it should not kill the worker thread.
+        if not capture:
+          raise
+        error = ex
+      finally:
+        if capture:
+          sys.stdout.release()
+          sys.stderr.release()
+
+      return RefreshResult(repository, error, time.time() - start_time,
+                           output.getvalue() if capture else '')
+
+  def refresh_all_repositories(self, func):
+      """Apply func to all the repositories.
+
+      If --refresh_concurrency is more than 1, then the repositories are
+      refreshed concurrently with each one's output written out together
+      once it finishes. In that case, all the repositories are attempted
+      before raising the error from the first one (if any) that failed.
+      Otherwise the repositories are processed in turn and an error is raised
+      immediately. Either way a summary of the repositories refreshed is
+      written out at the end.
+
+      Args:
+        func [callable]: The function taking the repository to refresh.
+
+      Returns:
+        list of RefreshResult for the repositories in order.
+      """
+      all_repos = self.__REQUIRED_REPOSITORIES + self.__extra_repositories
+      concurrency = min(self.__options.refresh_concurrency, len(all_repos))
+      if concurrency <= 1:
+        results = []
+        try:
+          for repository in all_repos:
+            results.append(
+                self.__refresh_repository(func, repository, False))
+        finally:
+          self.print_refresh_summary(results)
+        return results
+
+      original_stdout = sys.stdout
+      original_stderr = sys.stderr
+      sys.stdout = ThreadOutputRouter(original_stdout)
+      sys.stderr = ThreadOutputRouter(original_stderr)
+      output_lock = threading.Lock()
+
+      def refresh_and_report(repository):
+        try:
+          result = self.__refresh_repository(func, repository, True)
+        except KeyboardInterrupt:
+          raise RefreshInterrupted()
+        with output_lock:
+          original_stdout.write(
+              '----- {name} ({secs:.1f}s) -----\n{output}'.format(
+                  name=repository.name, secs=result.secs,
+                  output=result.output))
+          original_stdout.flush()
+        return result
+
+      pool = ThreadPool(concurrency)
+      try:
+        # Waiting with a timeout keeps the main thread interruptible.
+        results = pool.map_async(refresh_and_report, all_repos).get(
+            sys.maxint)
+      except RefreshInterrupted:
+        raise KeyboardInterrupt()
+      finally:
+        pool.terminate()
+        sys.stdout = original_stdout
+        sys.stderr = original_stderr
+
+      self.print_refresh_summary(results)
+      for result in results:
+        if result.error is not None:
+          raise result.error
+      return results
+
+  @staticmethod
+  def print_refresh_summary(results):
+      """Write out how the refresh of each repository went."""
+      print 'Repository refresh summary:'
+      for result in results:
+        print '  {name:<24} {status:<7} {secs:6.1f}s{error}'.format(
+            name=result.repository.name,
+            status='OK' if result.error is None else 'FAILED',
+            secs=result.secs,
+            error='' if result.error is None else '  {0}'.format(result.error))
+
   def push_all_to_origin_if_target_branch(self):
     """Push all the local repositories current target branch to origin.
 
     This will skip any local repositories that are not currently in the
     target branch.
     """
-    all_repos = self.__REQUIRED_REPOSITORIES + self.__extra_repositories
-    for repository in all_repos:
-        self.push_to_origin_if_target_branch(repository)
+    self.refresh_all_repositories(self.push_to_origin_if_target_branch)
 
   def pull_all_from_upstream_if_master(self):
     """Pull all the upstream master branches into their local repository.
@@ -368,9 +538,21 @@ class Refresher(object):
     This will skip any local repositories that are not currently in the master
     branch.
     """
-    all_repos = self.__REQUIRED_REPOSITORIES + self.__extra_repositories
-    for repository in all_repos:
-        self.pull_from_upstream_if_master(repository)
+    self.refresh_all_repositories(self.pull_from_upstream_if_master)
+
+  def __pull_from_origin_unless_missing_optional(self, repository):
+    """Pull the repository, ignoring failures if it is optional and missing."""
+    try:
+      self.pull_from_origin(repository)
+    except RuntimeError as ex:
+      if repository in self.__extra_repositories and not os.path.exists(
+          get_repository_dir(repository)):
+          sys.stderr.write(
+               'IGNORING error "{msg}" in optional repository {name}'
+               ' because the local repository does not yet exist.\n'
+                   .format(msg=ex.message, name=repository.name))
+      else:
+          raise
 
   def pull_all_from_origin(self):
     """Pull all the origin target branches into their local repository.
@@ -378,19 +560,8 @@ class Refresher(object):
     This will skip any local repositories that are not currently in the
     target branch.
     """
-    all_repos = self.__REQUIRED_REPOSITORIES + self.__extra_repositories
-    for repository in all_repos:
-        try:
-          self.pull_from_origin(repository)
-        except RuntimeError as ex:
-          if repository in self.__extra_repositories and not os.path.exists(
-              get_repository_dir(repository)):
-              sys.stderr.write(
-                   'IGNORING error "{msg}" in optional repository {name}'
-                   ' because the local repository does not yet exist.\n'
-                       .format(msg=ex.message, name=repository.name))
-          else:
-              raise
+    self.refresh_all_repositories(
+        self.__pull_from_origin_unless_missing_optional)
 
   def __determine_spring_config_location(self):
     root = '{dir}/config'.format(
@@ -539,6 +710,11 @@ bash -c "(./start.sh >> '$LOG_DIR/{name}.log') 2>&1\
                                ' If the user is "default" then use the'
                                ' authoritative (upstream) repository.')
 
+      parser.add_argument('--refresh_concurrency', default=1, type=int,
+                          help='The number of repositories to refresh at'
+                               ' once. Output from concurrent refreshes is'
+                               ' written out as each repository finishes.')
+
       parser.add_argument('--update_run_scripts', default=True,
                           action='store_true',
                           help='Update the run script for each component.')
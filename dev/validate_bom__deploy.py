@@ -19,12 +19,18 @@ It is responsible for deploying spinnaker (via Halyard) remotely.
 
 from multiprocessing.pool import ThreadPool
 
+import atexit
 import distutils
 import json
 import logging
 import os
+import pipes
+import re
+import shutil
 import stat
+import subprocess
 import tempfile
+import threading
 import time
 import traceback
 
@@ -103,6 +109,303 @@ def write_script_to_path(script, path=None):
       '\n'.join(data), path=path, is_script=True)
 
 
+class SshControlConnection(object):
+  """A multiplexed ssh connection to a remote instance.
+
+  connect() starts a background ssh ControlMaster process. All the commands
+  made by this class reuse it through its control socket, so they do not
+  each pay for a new connection and key exchange. If the master is not
+  running then those commands fall back to connecting on their own.
+  """
+
+  @property
+  def control_path(self):
+    """The path to the master's control socket."""
+    return self.__control_path
+
+  def __init__(self, user, host, key_path, port=None,
+               ssh_binary='ssh', scp_binary='scp', control_dir=None):
+    """Constructor.
+
+    Args:
+      user: [string] The user to login as.
+      host: [string] The host or IP address of the instance.
+      key_path: [string] The path to the private key to login with.
+      port: [int] The ssh port if not the default.
+      ssh_binary: [string] The ssh program to run.
+      scp_binary: [string] The scp program to run.
+      control_dir: [string] The directory for the control socket.
+         If None then use a new temporary directory, removed by close().
+    """
+    self.__user = user
+    self.__host = host
+    self.__key_path = key_path
+    self.__port = port
+    self.__ssh_binary = ssh_binary
+    self.__scp_binary = scp_binary
+    # Unix socket paths are limited to about 100 characters, so keep it short.
+    self.__owned_control_dir = (None if control_dir
+                                else tempfile.mkdtemp(prefix='ssh'))
+    self.__control_path = os.path.join(
+        control_dir or self.__owned_control_dir, 'master')
+    self.__close_registered = False
+
+  def __make_options(self):
+    options = [
+        '-i', self.__key_path,
+        '-o', 'StrictHostKeyChecking=no',
+        '-o', 'UserKnownHostsFile=/dev/null',
+        '-o', 'ControlPath={0}'.format(self.__control_path)
+    ]
+    return options
+
+  def __make_ssh_prefix(self):
+    command = [self.__ssh_binary] + self.__make_options()
+    if self.__port:
+      command.extend(['-p', str(self.__port)])
+    return command
+
+  def __destination(self):
+    return '{user}@{host}'.format(user=self.__user, host=self.__host)
+
+  def is_connected(self):
+    """Determine whether the master connection is running."""
+    command = self.__make_ssh_prefix() + ['-O', 'check', self.__destination()]
+    return run_quick(' '.join(command), echo=False).returncode == 0
+
+  def connect(self, timeout=120, initial_backoff=0.5, max_backoff=8):
+    """Start the master connection, waiting for the instance to accept it.
+
+    Args:
+      timeout: [float] How long to wait for the instance to accept ssh.
+      initial_backoff: [float] Seconds to wait before the first retry.
+      max_backoff: [float] The longest time to wait between retries.
+
+    Raises:
+      RuntimeError if the connection could not be made in time.
+    """
+    if self.is_connected():
+      return
+    if self.__owned_control_dir and not os.path.exists(
+        self.__owned_control_dir):
+      # We were closed before.
+      os.mkdir(self.__owned_control_dir, 0700)
+
+    # -f backgrounds the master only once it has authenticated.
+    command = ' '.join(
+        self.__make_ssh_prefix()
+        + ['-o', 'ControlMaster=yes', '-o', 'ControlPersist=yes',
+           '-o', 'ConnectTimeout=10', '-o', 'BatchMode=yes',
+           '-f', '-N', self.__destination()])
+    end_time = time.time() + timeout
+    backoff = initial_backoff
+    logging.info('Waiting for ssh to %s...', self.__destination())
+    while True:
+      result = run_quick(command, echo=False)
+      if result.returncode == 0:
+        logging.info('ssh is ready.')
+        if not self.__close_registered:
+          self.__close_registered = True
+          atexit.register(self.close)
+        return
+      if time.time() + backoff > end_time:
+        raise RuntimeError('Could not ssh to {dest}: {error}'.format(
+            dest=self.__destination(), error=result.stdout.strip()))
+      logging.info('ssh not yet ready. Retrying in %.1fs...', backoff)
+      time.sleep(backoff)
+      backoff = min(backoff * 2, max_backoff)
+
+  def close(self):
+    """Stop the master connection if it is running.
+
+    This also removes the control directory if we created it.
+    """
+    command = self.__make_ssh_prefix() + ['-O', 'exit', self.__destination()]
+    run_quick(' '.join(command), echo=False)
+    if self.__owned_control_dir:
+      shutil.rmtree(self.__owned_control_dir, ignore_errors=True)
+
+  def make_ssh_command(self, remote_command=None):
+    """Returns the shell command string to run a command on the instance.
+
+    Args:
+      remote_command: [string] The shell command to run remotely, if any.
+    """
+    command = self.__make_ssh_prefix() + [self.__destination()]
+    if remote_command:
+      command.append(pipes.quote(remote_command))
+    return ' '.join(command)
+
+  def __make_scp_prefix(self):
+    command = [self.__scp_binary] + self.__make_options()
+    if self.__port:
+      command.extend(['-P', str(self.__port)])
+    return command
+
+  def make_scp_command(self, local_paths, remote_dir='~'):
+    """Returns the shell command string to copy files to the instance."""
+    command = self.__make_scp_prefix() + list(local_paths)
+    command.append('{dest}:{dir}'.format(dest=self.__destination(),
+                                         dir=remote_dir))
+    return ' '.join(command)
+
+  def make_scp_fetch_command(self, remote_path, local_dir):
+    """Returns the shell command string to copy a file from the instance."""
+    command = self.__make_scp_prefix()
+    command.extend(['{dest}:{path}'.format(dest=self.__destination(),
+                                           path=remote_path),
+                    local_dir])
+    return ' '.join(command)
+
+  def make_port_forward_command(self, local_port, remote_port,
+                                poll_interval=5):
+    """Returns the command argument list to forward a local port.
+
+    The master connection does the forwarding, so the command needs it to
+    be running. The command keeps running for as long as the port is
+    forwarded. It exits if the master does, and cancels the forwarding
+    if it is terminated.
+
+    Args:
+      local_port: [int] The local port to forward.
+      remote_port: [int] The port on the instance to forward to.
+      poll_interval: [float] Seconds between checks that the master
+         is still running.
+    """
+    def master_command(operation):
+      return ' '.join(
+          self.__make_ssh_prefix()
+          + ['-O', operation,
+             '-L', '{local_port}:localhost:{remote_port}'.format(
+                 local_port=local_port, remote_port=remote_port),
+             self.__destination()])
+
+    check = ' '.join(
+        self.__make_ssh_prefix() + ['-O', 'check', self.__destination()])
+    script = [
+        '{forward} || exit'.format(forward=master_command('forward')),
+        'trap {cancel} TERM INT HUP'.format(
+            cancel=pipes.quote(master_command('cancel') + '; exit 0')),
+        # Wait on sleep in the background so the trap runs without delay.
+        'while {check} 2>/dev/null; do sleep {interval} & wait $!; done'
+        .format(check=check, interval=poll_interval)
+    ]
+    return ['bash', '-c', '\n'.join(script)]
+
+
+class KubernetesPodInventory(object):
+  """A cached snapshot of the pods in a namespace, indexed by service.
+
+  All the pods are fetched with a single request and the snapshot is reused
+  for lookups until it is older than the ttl or explicitly invalidated.
+  """
+
+  # Matches pod names like "spin-gate-v000-abcde" capturing "gate".
+  POD_NAME_RE = re.compile(r'^(?:spin-)?(.+?)-v\d+-[^-]+$')
+
+  def __init__(self, fetch_pods_json, ttl_secs=60, clock=time.time):
+    """Constructor.
+
+    Args:
+      fetch_pods_json: [callable] Returns the JSON text from
+         "kubectl get pods -o json" for the namespace.
+      ttl_secs: [float] How long a snapshot can be used for.
+      clock: [callable] Returns the current time in seconds.
+    """
+    self.__fetch_pods_json = fetch_pods_json
+    self.__ttl_secs = ttl_secs
+    self.__clock = clock
+    self.__lock = threading.Lock()
+    self.__pods_by_service = None
+    self.__expire_time = 0
+
+  @classmethod
+  def get_pod_service(cls, pod):
+    """Determine which service a pod from "kubectl get pods" belongs to.
+
+    Returns:
+      The service name or None.
+    """
+    metadata = pod.get('metadata', {})
+    cluster = metadata.get('labels', {}).get('cluster', '')
+    if cluster.startswith('spin-'):
+      return cluster[len('spin-'):]
+    match = cls.POD_NAME_RE.match(metadata.get('name', ''))
+    return match.group(1) if match else None
+
+  def invalidate(self):
+    """Discard the snapshot so the next lookup fetches a new one."""
+    with self.__lock:
+      self.__pods_by_service = None
+
+  def get_pod_name(self, service):
+    """Returns the name of the pod running the service, or None."""
+    with self.__lock:
+      if (self.__pods_by_service is None
+          or self.__clock() >= self.__expire_time):
+        self.__pods_by_service = self.__index_pods(
+            json.JSONDecoder().decode(self.__fetch_pods_json()))
+        self.__expire_time = self.__clock() + self.__ttl_secs
+      return self.__pods_by_service.get(service)
+
+  def __index_pods(self, pod_list):
+    """Map each service to its best pod: running ones first, then newest."""
+    best = {}
+    for pod in pod_list.get('items', []):
+      service = self.get_pod_service(pod)
+      if service is None:
+        continue
+      rank = (pod.get('status', {}).get('phase') == 'Running',
+              pod['metadata'].get('creationTimestamp', ''))
+      if service not in best or rank > best[service][0]:
+        best[service] = (rank, pod['metadata']['name'])
+    return {service: entry[1] for service, entry in best.items()}
+
+
+# The number of leading bytes of a log that identify it, so that a log
+# replaced by a new one can be told apart even once it has grown larger.
+LOG_HEAD_BYTES = 256
+
+
+def make_incremental_gzip_script(path, offset, head_checksum=None):
+  """Make a shell script that writes the new tail of a file as gzip data.
+
+  The script writes the bytes of the file after the offset to stdout as a
+  gzip member. The last line written to stderr is
+  "<start> <size> <head_checksum>", where start is the offset the data
+  begins at, size is the new offset to resume from and head_checksum
+  identifies the file for the next call.
+
+  If the file is now smaller than the offset, or its head no longer matches
+  head_checksum, then it was replaced, so the data starts at 0 instead.
+
+  Args:
+    path: [string] The path to the file on the machine running the script.
+    offset: [int] The number of bytes already collected.
+    head_checksum: [string] The head_checksum reported when offset was
+       collected, or None to only detect replacement by the size.
+
+  Returns:
+    The script as a single shell command string.
+  """
+  head = ('$(head -c $(($n < {max} ? $n : {max})) {path} | cksum'
+          ' | cut -d" " -f1)').format(path=pipes.quote(path),
+                                      max=LOG_HEAD_BYTES)
+  replaced = '[ "$size" -lt "$start" ]'
+  if offset and head_checksum is not None:
+    replaced += ' || [ "{head}" != {checksum} ]'.format(
+        head=head.replace('$n', '$start'),
+        checksum=pipes.quote(str(head_checksum)))
+  return ('size=$(stat -c %s {path})'
+          ' && start={offset}'
+          ' && if {replaced}; then start=0; fi'
+          ' && tail -c +$((start + 1)) {path} | head -c $((size - start))'
+          ' | gzip -c'
+          ' && echo "$start $size {head}" >&2'
+          .format(path=pipes.quote(path), offset=int(offset),
+                  replaced=replaced, head=head.replace('$n', '$size')))
+
+
 class BaseValidateBomDeployer(object):
   """Base class/interface for Deployer that uses Halyard to deploy Spinnaker.
 
@@ -131,6 +434,10 @@ class BaseValidateBomDeployer(object):
     return self.__spinnaker_deployer.do_make_port_forward_command(
         service, local_port, remote_port)
 
+  def notify_port_forward_failed(self, service):
+    """Note that a port forward made earlier to the service has failed."""
+    self.__spinnaker_deployer.do_notify_port_forward_failed(service)
+
   def deploy(self, config_script, files_to_upload):
     """Deploy and configure spinnaker.
 
@@ -186,20 +493,49 @@ class BaseValidateBomDeployer(object):
     logging.info('Finished undeploying from %s', platform)
 
   def collect_logs(self):
-    """Collect all the microservice log files."""
-    log_dir = os.path.join(self.options.log_dir, 'service_logs')
+    """Collect all the microservice log files.
+
+    With --deploy_incremental_logs, each log is collected as gzip data,
+    appending only what was added since the previous collection into the
+    same log_dir. Either way a manifest.json records what was collected.
+    """
+    options = self.options
+    log_dir = os.path.join(options.log_dir, 'service_logs')
     if not os.path.exists(log_dir):
       os.makedirs(log_dir)
 
+    manifest_path = os.path.join(log_dir, 'manifest.json')
+    try:
+      with open(manifest_path, 'r') as stream:
+        manifest = json.JSONDecoder().decode(stream.read())
+    except (IOError, ValueError):
+      manifest = {}
+
     def fetch_service_log(service):
+      start_time = time.time()
+      entry = dict(manifest.get(service, {}))
+      entry.pop('error', None)
       try:
         logging.debug('Fetching logs for "%s"...', service)
         deployer = (self if service in HALYARD_SERVICES
                     else self.__spinnaker_deployer)
-        deployer.do_fetch_service_log_file(service, log_dir)
+        if options.deploy_incremental_logs:
+          if not os.path.exists(os.path.join(log_dir, service + '.log.gz')):
+            # Whatever the manifest says was collected is no longer here
+            # (e.g. from a run that was not incremental), so start over.
+            entry.pop('offset', None)
+            entry.pop('head_checksum', None)
+          entry.update(self.__fetch_service_log_increment(
+              deployer, service, log_dir, entry.get('offset', 0),
+              entry.get('head_checksum')))
+        else:
+          deployer.do_fetch_service_log_file(service, log_dir)
+          path = os.path.join(log_dir, service + '.log')
+          entry = {'path': path, 'bytes': os.path.getsize(path)}
       except Exception as ex:
         message = 'Error fetching log for service "{service}": {ex}'.format(
             service=service, ex=ex)
+        entry['error'] = message
         if ex.message.find('No such file') >= 0:
           message += '\n    Perhaps the service never started.'
           # dont log since the error was already captured.
@@ -208,16 +544,78 @@ class BaseValidateBomDeployer(object):
           message += '\n{trace}'.format(
               trace=traceback.format_exc())
 
-        write_data_to_secure_path(
-            message, os.path.join(log_dir, service + '.log'))
+        if not options.deploy_incremental_logs:
+          write_data_to_secure_path(
+              message, os.path.join(log_dir, service + '.log'))
+
+      entry['fetch_secs'] = round(time.time() - start_time, 1)
+      return service, entry
 
-    logging.info('Collecting server log files into "%s"', log_dir)
     all_services = list(SPINNAKER_SERVICES)
     all_services.extend(HALYARD_SERVICES)
-    thread_pool = ThreadPool(len(all_services))
-    thread_pool.map(fetch_service_log, all_services)
+    logging.info('Collecting server log files into "%s" (concurrency=%d)',
+                 log_dir, options.deploy_log_concurrency)
+    thread_pool = ThreadPool(
+        max(1, min(len(all_services), options.deploy_log_concurrency)))
+    manifest.update(thread_pool.map(fetch_service_log, all_services))
     thread_pool.terminate()
 
+    with open(manifest_path, 'w') as stream:
+      stream.write(json.JSONEncoder(indent=2, sort_keys=True).encode(manifest))
+
+  @staticmethod
+  def __fetch_service_log_increment(deployer, service, log_dir, offset,
+                                    head_checksum):
+    """Append the new part of a service's log to its compressed log file.
+
+    Args:
+      deployer: [BaseValidateBomDeployer] The deployer running the service.
+      service: [string] The service whose log to collect.
+      log_dir: [string] The directory to write the log into.
+      offset: [int] The number of bytes of the log already collected.
+      head_checksum: [string] Identifies the log collected so far.
+
+    Returns:
+      The manifest entry describing the log file.
+    """
+    path = os.path.join(log_dir, service + '.log.gz')
+    part_path = path + '.part'
+    command = deployer.do_make_incremental_log_command(
+        service, offset, head_checksum, log_dir)
+    with open(part_path, 'wb') as stream:
+      process = subprocess.Popen(command, shell=True, stdout=stream,
+                                 stderr=subprocess.PIPE, close_fds=True)
+      stderr = process.communicate()[1]
+
+    lines = stderr.strip().split('\n')
+    try:
+      if process.returncode != 0:
+        raise RuntimeError(stderr.strip())
+      start, size, head_checksum = lines[-1].split()
+      start, size = int(start), int(size)
+    except (RuntimeError, ValueError):
+      os.remove(part_path)
+      raise RuntimeError(stderr.strip() or 'No log data returned.')
+
+    if start == 0:
+      # Either this is the first collection or the log was replaced.
+      os.rename(part_path, path)
+    elif not os.path.exists(path):
+      # Without the start of the log, the increment cannot be appended.
+      os.remove(part_path)
+      raise RuntimeError('{path} is missing the first {start} bytes.'
+                         .format(path=path, start=start))
+    else:
+      # Concatenated gzip members decompress as one stream.
+      with open(path, 'ab') as stream:
+        with open(part_path, 'rb') as part:
+          shutil.copyfileobj(part, stream)
+      os.remove(part_path)
+
+    return {'path': path, 'offset': size, 'head_checksum': head_checksum,
+            'new_bytes': size - start,
+            'compressed_bytes': os.path.getsize(path)}
+
   def do_make_port_forward_command(self, service, local_port, remote_port):
     """Hook for concrete platforms to return the port forwarding command.
 
@@ -226,6 +624,25 @@ class BaseValidateBomDeployer(object):
     """
     raise NotImplementedError(self.__class__.__name__)
 
+  def do_notify_port_forward_failed(self, service):
+    """Hook for concrete platforms to discard state about the service."""
+    pass
+
+  def do_make_incremental_log_command(self, service, offset, head_checksum,
+                                      log_dir):
+    """Hook for concrete platforms to return an incremental log command.
+
+    Args:
+      service: [string] The service whose log to collect.
+      offset: [int] The number of bytes of the log already collected.
+      head_checksum: [string] Identifies the log collected so far.
+      log_dir: [string] The local directory the log is collected into.
+
+    Returns:
+      A shell command behaving like make_incremental_gzip_script().
+    """
+    raise NotImplementedError(self.__class__.__name__)
+
   def do_deploy(self, script, files_to_upload):
     """Hook for specialized platforms to implement the concrete deploy()."""
     # pylint: disable=unused-argument
@@ -293,6 +710,8 @@ class KubernetesValidateBomDeployer(BaseValidateBomDeployer):
   """
   def __init__(self, options, **kwargs):
     super(KubernetesValidateBomDeployer, self).__init__(options, **kwargs)
+    self.__pod_inventory = KubernetesPodInventory(
+        self.__fetch_pods_json, ttl_secs=options.deploy_k8s_pod_cache_ttl)
 
   @classmethod
   def init_platform_argument_parser(cls, parser):
@@ -304,6 +723,10 @@ class KubernetesValidateBomDeployer(BaseValidateBomDeployer):
         '--deploy_k8s_namespace',
         default='spinnaker',
         help='Namespace for the account Spinnaker is deployed into.')
+    parser.add_argument(
+        '--deploy_k8s_pod_cache_ttl', default=60, type=int,
+        help='Seconds to reuse the list of pods in the namespace before'
+             ' fetching it again.')
 
   @classmethod
   def validate_options_helper(cls, options):
@@ -323,34 +746,36 @@ class KubernetesValidateBomDeployer(BaseValidateBomDeployer):
                        .format(options.injected_deploy_spinnaker_account))
     options.injected_deploy_spinnaker_account = options.k8s_account_name
 
-  def __get_pod_name(self, k8s_namespace, service):
-    """Determine the pod name for the deployed service."""
+  def __fetch_pods_json(self):
+    """Returns the JSON listing all the pods in the namespace."""
     options = self.options
     response = check_run_quick(
-        'kubectl {context} get pods --namespace {namespace}'
-        ' | gawk -F "[[:space:]]+" "/{service}-v/ {{print \\$1}}" | tail -1'
+        'kubectl {context} get pods --namespace {namespace} -o json'
         .format(context=('--context {0}'.format(options.k8s_account_context)
                          if options.k8s_account_context
                          else ''),
-                namespace=k8s_namespace,
-                service=service))
-    pod = response.stdout.strip()
+                namespace=options.deploy_k8s_namespace),
+        echo=False, dup_stderr_to_stdout=False)
+    return response.stdout
+
+  def __get_pod_name(self, k8s_namespace, service):
+    """Determine the pod name for the deployed service."""
+    pod = self.__pod_inventory.get_pod_name(service)
     if not pod:
       message = 'There is no pod for "{service}" in {namespace}'.format(
           service=service, namespace=k8s_namespace)
       logging.error(message)
       raise ValueError(message)
 
-    if response.returncode != 0:
-      message = 'Could not find pod for "{service}".: {error}'.format(
-          service=service,
-          error=response.stdout.strip())
-      logging.error(message)
-      raise ValueError(message)
-    else:
-      print '{0} -> "{1}"'.format(service, response.stdout)
+    print '{0} -> "{1}"'.format(service, pod)
+    return pod
 
-    return response.stdout.strip()
+  def do_notify_port_forward_failed(self, service):
+    """Implements interface.
+
+    The pod may have been replaced, so look the pods up again next time.
+    """
+    self.__pod_inventory.invalidate()
 
   def do_make_port_forward_command(self, service, local_port, remote_port):
     """Implements interface."""
@@ -378,6 +803,34 @@ class KubernetesValidateBomDeployer(BaseValidateBomDeployer):
     super(KubernetesValidateBomDeployer, self).do_undeploy()
     # kubectl delete namespace spinnaker
 
+  def do_make_incremental_log_command(self, service, offset, head_checksum,
+                                      log_dir):
+    """Implements the BaseBomValidateDeployer interface.
+
+    Unlike the VM deployments, this does not save any bandwidth. The
+    services log to the container's stdout, so there is no log file in the
+    pod to run make_incremental_gzip_script against, and the log served by
+    the kubernetes API cannot be read from a byte offset. The whole log is
+    fetched into a temporary file on each collection and only the new part
+    is compressed from there, so only the local copy is incremental.
+    """
+    options = self.options
+    k8s_namespace = options.deploy_k8s_namespace
+    service_pod = self.__get_pod_name(k8s_namespace, service)
+    temp_path = os.path.join(log_dir, service + '.log.tmp')
+    return (
+        'kubectl -n {namespace} -c {container} {context} logs {pod}'
+        ' > {temp} && ({script}); status=$?; rm -f {temp}; exit $status'
+        .format(namespace=k8s_namespace,
+                container='spin-{service}'.format(service=service),
+                context=('--context {0}'.format(options.k8s_account_context)
+                         if options.k8s_account_context
+                         else ''),
+                pod=service_pod,
+                temp=pipes.quote(temp_path),
+                script=make_incremental_gzip_script(
+                    temp_path, offset, head_checksum)))
+
   def do_fetch_service_log_file(self, service, log_dir):
     """Retrieve log file for the given service's pod.
 
@@ -417,6 +870,10 @@ class GenericVmValidateBomDeployer(BaseValidateBomDeployer):
 
   def set_instance_ip(self, value):
     """Sets the underlying IP address for the deployed instance."""
+    if value != self.__instance_ip and self.__ssh_connection is not None:
+      # The connection is to the old address.
+      self.__ssh_connection.close()
+      self.__ssh_connection = None
     self.__instance_ip = value
 
   @property
@@ -434,24 +891,31 @@ class GenericVmValidateBomDeployer(BaseValidateBomDeployer):
     """Returns the Halyard User within the deployment VM."""
     return self.__hal_user
 
+  @property
+  def ssh_connection(self):
+    """The multiplexed SshControlConnection to the deployed instance."""
+    if self.__ssh_connection is None:
+      self.__ssh_connection = SshControlConnection(
+          self.hal_user, self.instance_ip, self.ssh_key_path)
+    return self.__ssh_connection
+
   def __init__(self, options, **kwargs):
     super(GenericVmValidateBomDeployer, self).__init__(options, **kwargs)
     self.__instance_ip = None
+    self.__ssh_connection = None
     self.__hal_user = options.deploy_hal_user
     logging.info('hal_user="%s"', self.__hal_user)
     self.__ssh_key_path = os.path.join(os.environ['HOME'], '.ssh',
                                        '{0}_empty_key'.format(self.__hal_user))
 
   def do_make_port_forward_command(self, service, local_port, remote_port):
-    """Implements interface."""
-    return [
-        'ssh', '-i', self.__ssh_key_path,
-        '-o', 'StrictHostKeyChecking=no',
-        '-o', 'UserKnownHostsFile=/dev/null',
-        '{user}@{ip}'.format(user=self.hal_user, ip=self.instance_ip),
-        '-L', '{local_port}:localhost:{remote_port}'.format(
-            local_port=local_port, remote_port=remote_port),
-        '-N']
+    """Implements interface.
+
+    The forwarding needs the master connection, which may have exited.
+    """
+    self.ssh_connection.connect()
+    return self.ssh_connection.make_port_forward_command(
+        local_port, remote_port)
 
   def do_determine_instance_ip(self):
     """Hook for determining the ip address of the hal instance."""
@@ -486,28 +950,13 @@ class GenericVmValidateBomDeployer(BaseValidateBomDeployer):
     try:
       self.do_create_vm(options)
 
-      copy_files = (
-          'scp'
-          ' -i {ssh_key_path}'
-          ' -o StrictHostKeyChecking=no'
-          ' -o UserKnownHostsFile=/dev/null'
-          ' {files}'
-          ' {user}@{ip}:~'
-          .format(ssh_key_path=self.__ssh_key_path,
-                  files=' '.join(files_to_upload),
-                  user=self.hal_user,
-                  ip=self.instance_ip))
-      logging.info('Copying files %s', copy_files)
-
-      # pylint: disable=unused-variable
-      for retry in range(0, 10):
-        result = run_quick(copy_files)
-        if result.returncode == 0:
-          break
-        time.sleep(2)
+      # Every ssh and scp from here on reuses this connection.
+      ssh = self.ssh_connection
+      ssh.connect(timeout=options.deploy_ssh_timeout)
 
-      if result.returncode != 0:
-        check_run_quick(copy_files)
+      copy_files = ssh.make_scp_command(sorted(files_to_upload))
+      logging.info('Copying files %s', copy_files)
+      check_run_quick(copy_files)
     except Exception as ex:
       logging.error('Caught %s', ex)
       raise
@@ -515,41 +964,9 @@ class GenericVmValidateBomDeployer(BaseValidateBomDeployer):
       os.remove(script_path)
 
     try:
-      logging.info('Waiting for ssh...')
-      end_time = time.time() + 30
-      logging.info('Entering while %f < %f', time.time(), end_time)
-      while time.time() < end_time:
-        logging.info('Running quick...')
-        ready_response = run_quick(
-            'ssh'
-            ' -i {ssh_key}'
-            ' -o StrictHostKeyChecking=no'
-            ' -o UserKnownHostsFile=/dev/null'
-            ' {user}@{ip}'
-            ' "exit 0"'
-            .format(user=self.hal_user,
-                    ip=self.instance_ip,
-                    ssh_key=self.__ssh_key_path),
-            echo=False)
-        logging.info('got %s', ready_response)
-        if ready_response.returncode == 0:
-          logging.info('ssh is ready.')
-          break
-        logging.info('ssh not yet ready...')
-        time.sleep(1)
-
       logging.info('Running install script')
-      check_run_and_monitor(
-          'ssh'
-          ' -i {ssh_key}'
-          ' -o StrictHostKeyChecking=no'
-          ' -o UserKnownHostsFile=/dev/null'
-          ' {user}@{ip}'
-          ' ./{script_name}'
-          .format(user=self.hal_user,
-                  ip=self.instance_ip,
-                  ssh_key=self.__ssh_key_path,
-                  script_name=os.path.basename(script_path)))
+      check_run_and_monitor(ssh.make_ssh_command(
+          './{script_name}'.format(script_name=os.path.basename(script_path))))
     except RuntimeError as error:
       logging.error('Caught runtime error: %s', error)
       raise RuntimeError('Halyard deployment failed.')
@@ -558,21 +975,23 @@ class GenericVmValidateBomDeployer(BaseValidateBomDeployer):
       logging.exception('Unexpected exception: %s', ex)
       raise
 
+  def do_make_incremental_log_command(self, service, offset, head_checksum,
+                                      log_dir):
+    """Implements the BaseBomValidateDeployer interface.
+
+    The log is compressed on the instance before it is transferred.
+    """
+    script = make_incremental_gzip_script(
+        '/var/log/spinnaker/{service}/{service}.log'.format(service=service),
+        offset, head_checksum)
+    return self.ssh_connection.make_ssh_command(script)
+
   def do_fetch_service_log_file(self, service, log_dir):
     """Implements the BaseBomValidateDeployer interface."""
     write_data_to_secure_path('', os.path.join(log_dir, service + '.log'))
-    check_run_quick(
-        'scp'
-        ' -i {ssh_key}'
-        ' -o StrictHostKeyChecking=no'
-        ' -o UserKnownHostsFile=/dev/null'
-        ' {user}@{ip}:/var/log/spinnaker/{service}/{service}.log'
-        ' {log_dir}'
-        .format(user=self.hal_user,
-                ip=self.instance_ip,
-                ssh_key=self.ssh_key_path,
-                service=service,
-                log_dir=log_dir))
+    check_run_quick(self.ssh_connection.make_scp_fetch_command(
+        '/var/log/spinnaker/{service}/{service}.log'.format(service=service),
+        log_dir))
 
 
 class AwsValidateBomDeployer(GenericVmValidateBomDeployer):
@@ -747,27 +1166,19 @@ class AwsValidateBomDeployer(GenericVmValidateBomDeployer):
     self.set_instance_ip(info.get('PublicIpAddress'))
     # attempt to ssh into it so we know we're accepting connections when
     # we return. It takes time to start
+    # The master connection it starts is reused by the deployment.
     logging.info('Checking if it is ready for ssh...')
-    check = run_quick(
-        'ssh'
-        ' -i {ssh_key}'
-        ' -o StrictHostKeyChecking=no'
-        ' -o UserKnownHostsFile=/dev/null'
-        ' {user}@{ip}'
-        ' "exit 0"'
-        .format(user=self.hal_user,
-                ip=self.instance_ip,
-                ssh_key=self.ssh_key_path),
-        echo=False)
-    if check.returncode == 0:
-      logging.info('READY')
-      return True
+    try:
+      self.ssh_connection.connect(timeout=0)
+    except RuntimeError as error:
+      # Sometimes ssh accepts but authentication still fails
+      # for a while. If this is the case, then try again
+      # though the whole loop to distinguish VM going away.
+      logging.info('%s\nNot yet ready...', error)
+      return False
 
-    # Sometimes ssh accepts but authentication still fails
-    # for a while. If this is the case, then try again
-    # though the whole loop to distinguish VM going away.
-    logging.info('%s\nNot yet ready...', check.stdout.strip())
-    return False
+    logging.info('READY')
+    return True
 
   def do_undeploy(self):
     """Implements the BaseBomValidateDeployer interface."""
@@ -888,15 +1299,8 @@ class AzureValidateBomDeployer(GenericVmValidateBomDeployer):
     """Implements the BaseBomValidateDeployer interface."""
     options = self.options
     if options.deploy_spinnaker_type == 'distributed':
-      run_and_monitor(
-          'ssh'
-          ' -i {ssh_key}'
-          ' -o StrictHostKeyChecking=no'
-          ' -o UserKnownHostsFile=/dev/null'
-          ' {user}@{ip} sudo hal -q --log=info deploy clean'
-          .format(user=self.hal_user,
-                  ip=self.instance_ip,
-                  ssh_key=self.ssh_key_path))
+      run_and_monitor(self.ssh_connection.make_ssh_command(
+          'sudo hal -q --log=info deploy clean'))
     check_run_and_monitor(
         'az vm delete -y'
         ' --name {name}'
@@ -1062,15 +1466,8 @@ class GoogleValidateBomDeployer(GenericVmValidateBomDeployer):
     """Implements the BaseBomValidateDeployer interface."""
     options = self.options
     if options.deploy_spinnaker_type == 'distributed':
-      run_and_monitor(
-          'ssh'
-          ' -i {ssh_key}'
-          ' -o StrictHostKeyChecking=no'
-          ' -o UserKnownHostsFile=/dev/null'
-          ' {user}@{ip} sudo hal -q --log=info deploy clean'
-          .format(user=self.hal_user,
-                  ip=self.instance_ip,
-                  ssh_key=self.ssh_key_path))
+      run_and_monitor(self.ssh_connection.make_ssh_command(
+          'sudo hal -q --log=info deploy clean'))
 
     check_run_and_monitor(
         'gcloud -q compute instances delete'
@@ -1198,6 +1595,21 @@ def init_argument_parser(parser):
       help='Always collect logs.'
            'By default logs are only collected when deploy_undeploy is True.')
 
+  parser.add_argument(
+      '--deploy_ssh_timeout', default=300, type=int,
+      help='Seconds to wait for a new instance to accept ssh connections.')
+
+  parser.add_argument(
+      '--deploy_incremental_logs', default=False,
+      type=make_bool_value,
+      help='Collect service logs as gzip files, compressed before they are'
+           ' transferred where possible. Collecting again into the same'
+           ' --log_dir only fetches what was added since the last time.')
+
+  parser.add_argument(
+      '--deploy_log_concurrency', default=4, type=int,
+      help='The maximum number of service logs to collect at once.')
+
   AwsValidateBomDeployer.init_platform_argument_parser(parser)
   AzureValidateBomDeployer.init_platform_argument_parser(parser)
   GoogleValidateBomDeployer.init_platform_argument_parser(parser)
@@ -68,9 +68,13 @@ test execution for these resources. Unrestricted resources wont rate-limit.
 If the cost bigger than the total semaphore capacity then the test will
 be given all the quota once all is available.
 
-There is an overall rate-limiting semaphore on --test_concurrency for
-how many tests can run at a time. This is enforced at the point of execution,
-after all the setup and filtering has taken place.
+There is an overall limit of --test_concurrency for how many tests can run
+at a time. This is the number of workers executing tests, after all the setup
+and filtering has taken place. Workers prefer the tests that took longest in
+previous runs (see --test_history_path), then the tests with the largest quota
+cost, and only start tests whose quota is available. A test that keeps being
+passed over for others eventually holds back the tests after it needing the
+same quota until it can run.
 """
 
 # pylint: disable=broad-except
@@ -79,6 +83,8 @@ from multiprocessing.pool import ThreadPool
 
 import atexit
 import collections
+import gzip
+import json
 import logging
 import os
 import re
@@ -89,13 +95,26 @@ import threading
 import time
 import traceback
 import urllib2
-import yaml
+import uuid
 
 from spinnaker.run import run_and_monitor
+from spinnaker.yaml_util import load_yaml
+
+from build_scheduler import BuildHistory
 
 
 ForwardedPort = collections.namedtuple('ForwardedPort', ['child', 'port'])
 
+# A test ready to run once its quota is available.
+# The priority orders the tests within the scheduler's queue.
+ScheduledTest = collections.namedtuple(
+    'ScheduledTest', ['priority', 'name', 'command', 'quota', 'ready_time'])
+
+# When a test started relative to the start of the test phase,
+# how long it waited to start once it was ready, and how long it ran.
+TestTiming = collections.namedtuple(
+    'TestTiming', ['name', 'start_secs', 'queue_secs', 'run_secs'])
+
 
 def _unused_port():
   """Find a port that is not currently in use."""
@@ -125,26 +144,6 @@ class QuotaTracker(object):
     self.__max_counts = dict(max_counts)
     self.__condition_variable = threading.Condition()
 
-  def acquire_all_safe(self, who, quota):
-    """Acquire the desired quota, if any.
-
-    This is thread-safe and will block until it can be satisified.
-
-    Args:
-      who: [string] Who is asking, for logging purposes.
-      quota: [dict] The desired quota for each keyed resource, if any.
-    Returns:
-      The quota acquired.
-    """
-    got = None
-    with self.__condition_variable:
-      got = self.acquire_all_or_none_unsafe(who, quota)
-      while got is None:
-        logging.info('"%s" waiting on quota %s', who, quota)
-        self.__condition_variable.wait()
-        got = self.acquire_all_or_none_unsafe(who, quota)
-    return got
-
   def acquire_all_or_none_safe(self, who, quota):
     """Acquire the desired quota, if any.
 
@@ -172,7 +171,7 @@ class QuotaTracker(object):
     """
     if not quota:
       return {}
-    logging.info('"%s" attempting to acquire quota %s', who, quota)
+    logging.debug('"%s" attempting to acquire quota %s', who, quota)
     acquired = {}
     for key, value in quota.items():
       got = self.__acquire_resource_or_none(key, value)
@@ -234,9 +233,9 @@ class QuotaTracker(object):
                       name, max_count, count)
       self.__counts[name] = 0
       return have
-    logging.warning('Quota %s has %d remaining, but %d are needed.'
-                    ' Rejecting the request for now.',
-                    name, have, count)
+    logging.debug('Quota %s has %d remaining, but %d are needed.'
+                  ' Rejecting the request for now.',
+                  name, have, count)
     return 0
 
   def __release_resource(self, name, count):
@@ -246,76 +245,388 @@ class QuotaTracker(object):
       self.__counts[name] = have + count
 
 
-class CommandOutputMediator(object):
-  """Mediate output from forked commands to our own log files."""
-
-  def __init__(self, label):
-    self.__label = label
-    self.__buffered_stdout = []
-    self.__buffered_stderr = []
-
-  def capture_stdout(self, fragments):
-    """Callback for adding text fragments from stdout."""
-    self.__buffered_stdout = self.capture_helper(
-        fragments, self.__buffered_stdout, logging.info)
-
-  def capture_stderr(self, fragments):
-    """Callback for adding text from stderr."""
-    # Display this as info because python unittest.main is printing
-    # normal status to stderr but we want it to show up here as info, not error
-    self.__buffered_stderr = self.capture_helper(
-        fragments, self.__buffered_stderr, logging.info)
-
-  def capture_helper(self, fragments, remaining, method):
-    """Helper function managing the buffers and logging."""
-    text = ''.join(fragments)
-    eoln = text.rfind('\n')
-    if eoln < 0:
-      remaining.append(text)
-      return remaining
-
-    remaining.append(text[:eoln])
-    extra = [text[eoln + 1:]]
-    self.write(remaining, extra, method)
-    return extra
-
-  def write(self, fragments, still_buffered, method):
-    """Write fragments to the logging method."""
-    buffered_text = ('' if not still_buffered
-                     else ''.join(still_buffered).strip())
-    joined_text = ''.join(fragments)
-    if not buffered_text and not joined_text.strip():
+class TestOutputSink(object):
+  """Streams the output from a forked test command into its own log file.
+
+  Only a bounded tail of the output is kept in memory so that it can be
+  reported if the test fails. Output is written as it arrives rather than
+  passing through the shared logging module.
+  """
+
+  @property
+  def path(self):
+    """The path of the file that the output is written to."""
+    return self.__path
+
+  @property
+  def num_bytes(self):
+    """The total number of bytes of output received."""
+    return self.__num_bytes
+
+  def __init__(self, path, compress=False, max_tail_bytes=4096):
+    """Constructor.
+
+    Args:
+      path: [string] The path of the file to write, excluding any .gz suffix.
+      compress: [bool] Whether to gzip the file.
+      max_tail_bytes: [int] The amount of trailing output to keep in memory.
+    """
+    self.__path = path + '.gz' if compress else path
+    self.__stream = (gzip.open(self.__path, 'wb') if compress
+                     else open(self.__path, 'w'))
+    self.__max_tail_bytes = max_tail_bytes
+    self.__tail = collections.deque()
+    self.__tail_bytes = 0
+    self.__num_bytes = 0
+
+  def write(self, fragments):
+    """Callback for adding text fragments from stdout or stderr."""
+    for text in fragments:
+      self.__stream.write(text)
+      self.__num_bytes += len(text)
+      self.__tail.append(text)
+      self.__tail_bytes += len(text)
+    while (len(self.__tail) > 1
+           and self.__tail_bytes - len(self.__tail[0]) >= self.__max_tail_bytes):
+      self.__tail_bytes -= len(self.__tail.popleft())
+
+  def get_tail(self):
+    """Returns at most the last max_tail_bytes of output."""
+    return ''.join(self.__tail)[-self.__max_tail_bytes:]
+
+  def close(self):
+    """Close the file."""
+    self.__stream.close()
+
+
+class ServiceHealthMonitor(object):
+  """Owns the tunnels to the deployed services and monitors their health.
+
+  A monitor thread schedules a probe of each service's /health endpoint
+  through its tunnel, running each probe in its own thread so that a
+  service that is slow to respond does not delay the others. Services not
+  yet healthy are probed frequently, backing off up to max_interval.
+  Healthy services are probed every max_interval, which also keeps idle
+  tunnels (e.g. kubectl port-forward) open.
+
+  Tests wait on the readiness of the services they need rather than
+  polling them. If a tunnel process dies, it is restarted on a new
+  local port rather than failing the tests waiting on it.
+  """
+
+  # Service states
+  WAITING = 'WAITING'
+  READY = 'READY'
+  FAILED = 'FAILED'
+
+  # How long close() waits for the tunnels to exit before killing them.
+  CLOSE_GRACE_SECS = 5
+
+  class _Service(object):
+    """The monitor's state for an individual service."""
+    # pylint: disable=too-few-public-methods
+    def __init__(self, interval):
+      self.forwarding = None  # Until the first tunnel is established.
+      self.state = ServiceHealthMonitor.WAITING
+      self.error = None
+      self.interval = interval
+      self.next_probe_time = 0
+      self.probing = False
+      self.restarts = 0
+
+  @staticmethod
+  def probe_health(port, timeout):
+    """Request /health from a service tunneled to the local port.
+
+    Raises:
+      urllib2.HTTPError if the service responded but is not healthy,
+      or some other exception if it did not respond.
+    """
+    # localhost is hardcoded here because we are port forwarding.
+    urllib2.urlopen('http://localhost:{port}/health'.format(port=port),
+                    timeout=timeout)
+
+  def __init__(self, forward_port_func, min_interval=1, max_interval=20,
+               probe_timeout=5, max_restarts=3, probe_func=None,
+               clock=time.time):
+    """Constructor.
+
+    Args:
+      forward_port_func: [callable] Given a service name, starts a tunnel
+         to it and returns the ForwardedPort. Calls are serialized.
+      min_interval: [float] Seconds between the initial probes of a service.
+      max_interval: [float] Seconds between probes of a healthy service.
+      probe_timeout: [float] Seconds to wait on an individual probe.
+      max_restarts: [int] How many times to restart a service's tunnel.
+      probe_func: [callable] Given a local port and timeout, probes the
+         service as probe_health does. Defaults to probe_health.
+      clock: [callable] Returns the current time in seconds.
+    """
+    self.__forward_port_func = forward_port_func
+    self.__min_interval = min_interval
+    self.__max_interval = max_interval
+    self.__probe_timeout = probe_timeout
+    self.__max_restarts = max_restarts
+    self.__probe_func = probe_func or self.probe_health
+    self.__clock = clock
+    self.__services = {}
+    self.__condition = threading.Condition()
+    self.__thread = None
+    self.__closed = False
+
+    # Serializes starting tunnels. This is separate from the condition so
+    # that the services can be probed and waited on while a tunnel starts.
+    self.__forward_lock = threading.Lock()
+
+  def get_forwarded_port(self, service_name):
+    """Returns the current ForwardedPort to the service."""
+    with self.__condition:
+      return self.__services[service_name].forwarding
+
+  def wait_until_ready(self, service_name, timeout):
+    """Wait for the service to become ready, tunneling to it if needed.
+
+    Args:
+      service_name: [string] The service to wait on.
+      timeout: [int] How much time to wait before giving up.
+
+    Returns:
+      The ForwardedPort entry for this service.
+    """
+    end_time = self.__clock() + timeout
+    with self.__condition:
+      service = self.__services.get(service_name)
+      if service is None:
+        # Claim the service so other waiters wait on our tunnel rather
+        # than starting their own. The monitor does not probe it until
+        # it has a tunnel.
+        service = self._Service(self.__min_interval)
+        self.__services[service_name] = service
+        forward = True
+      else:
+        forward = False
+
+    if forward:
+      try:
+        forwarding = self.__forward_port(service_name)
+      except Exception as ex:
+        logging.exception(
+            'Exception while attempting to forward ports to "%s"',
+            service_name)
+        with self.__condition:
+          # Let a later caller try again.
+          del self.__services[service_name]
+          service.state = self.FAILED
+          service.error = ex
+          self.__condition.notify_all()
+        raise
+      with self.__condition:
+        closed = self.__closed
+        if closed:
+          service.state = self.FAILED
+          service.error = 'The monitor was closed.'
+        else:
+          service.forwarding = forwarding
+          self.__ensure_thread_unsafe()
+        self.__condition.notify_all()
+      if closed:
+        # Nothing else will terminate this tunnel now.
+        self.__stop_forwardings([forwarding])
+        raise RuntimeError('Closed while forwarding to {0}'.format(
+            service_name))
+
+    with self.__condition:
+      logging.info('Waiting on "%s..."', service_name)
+      while service.state == self.WAITING:
+        remaining = end_time - self.__clock()
+        if remaining <= 0:
+          logging.error('Timing out waiting for %s', service_name)
+          raise RuntimeError(
+              'Timed out waiting for {0}: {1}'.format(
+                  service_name, service.error))
+        self.__condition.wait(remaining)
+
+      if service.state == self.FAILED:
+        raise RuntimeError('It appears that {0} failed: {1}'.format(
+            service_name, service.error))
+      return service.forwarding
+
+  def close(self):
+    """Stop monitoring and terminate all the tunnels.
+
+    This waits for the probes in flight to finish so that none of them
+    restarts a tunnel after the others have been terminated. Any probe
+    still running after CLOSE_GRACE_SECS terminates its own new tunnel.
+    """
+    end_time = time.time() + self.CLOSE_GRACE_SECS
+    with self.__condition:
+      self.__closed = True
+      self.__condition.notify_all()
+      while True:
+        remaining = end_time - time.time()
+        if (remaining <= 0
+            or not [service for service in self.__services.values()
+                    if service.probing]):
+          break
+        self.__condition.wait(remaining)
+      forwardings = [service.forwarding
+                     for service in self.__services.values()
+                     if service.forwarding is not None]
+    self.__stop_forwardings(forwardings)
+
+  def __stop_forwardings(self, forwardings):
+    """Terminate the tunnel processes, killing those that do not exit."""
+    # Terminate rather than kill so the children can cancel their
+    # forwarding on the shared ssh master before they exit.
+    for forwarding in forwardings:
+      try:
+        forwarding.child.terminate()
+      except Exception as ex:
+        logging.error('Error terminating child: %s', ex)
+
+    end_time = time.time() + self.CLOSE_GRACE_SECS
+    for forwarding in forwardings:
+      child = forwarding.child
+      while child.poll() is None and time.time() < end_time:
+        time.sleep(0.1)
+      if child.poll() is None:
+        logging.warning('Killing child %d that did not terminate.', child.pid)
+        try:
+          child.kill()
+        except Exception as ex:
+          logging.error('Error killing child: %s', ex)
+
+  def __forward_port(self, service_name):
+    with self.__forward_lock:
+      return self.__forward_port_func(service_name)
+
+  def __ensure_thread_unsafe(self):
+    if self.__thread is None:
+      self.__thread = threading.Thread(target=self.__monitor_loop)
+      self.__thread.setDaemon(True)
+      self.__thread.start()
+
+  def __monitor_loop(self):
+    """The thread that starts probing the services when they are due."""
+    with self.__condition:
+      while not self.__closed:
+        now = self.__clock()
+        pending = [(name, service)
+                   for name, service in self.__services.items()
+                   if service.state != self.FAILED
+                   and service.forwarding is not None
+                   and not service.probing]
+        due = [(name, service) for name, service in pending
+               if service.next_probe_time <= now]
+        if not due:
+          next_time = min([service.next_probe_time
+                           for _, service in pending] or [now + 60])
+          self.__condition.wait(max(0.1, next_time - now))
+          continue
+
+        for name, service in due:
+          service.probing = True
+          thread = threading.Thread(target=self.__probe, args=[name, service])
+          thread.setDaemon(True)
+          thread.start()
+
+  def __probe(self, name, service):
+    """Probe an individual service and update its state."""
+    try:
+      self.__do_probe(name, service)
+    finally:
+      with self.__condition:
+        service.probing = False
+        self.__condition.notify_all()
+
+  def __do_probe(self, name, service):
+    forwarding = service.forwarding
+    if forwarding.child.poll() is not None:
+      self.__restart_tunnel(name, service)
       return
 
-    if buffered_text:
-      more_text = '<still buffering line>: %s\n' % buffered_text
-    else:
-      more_text = ''
-
-    lines = joined_text.split('\n')
-    indented_text = '  %s' % '\n  '.join(lines)
-    method('<begin from %s>:\n'
-           '%s\n'
-           '%s'
-           '<end from %s>\n',
-           self.__label,
-           indented_text,
-           more_text,
-           self.__label)
-
-  def flush(self):
-    """Flush any buffered output."""
-    if self.__buffered_stdout:
-      self.write(self.__buffered_stdout, None, logging.info)
-      self.__buffered_stdout = []
-    if self.__buffered_stderr:
-      self.write(self.__buffered_stderr, None, logging.error)
-      self.__buffered_stderr = []
+    healthy = False
+    try:
+      self.__probe_func(forwarding.port, self.__probe_timeout)
+      healthy = True
+      error = None
+    except urllib2.HTTPError as ex:
+      # The service is up, but unhealthy. Let tests run against it anyway
+      # in case they are testing unhealthy service situations.
+      if service.state != self.READY:
+        logging.warning('%s got %s. Ignoring that for now.', name, ex)
+      healthy = True
+      error = ex
+    except Exception as ex:
+      error = ex
+
+    with self.__condition:
+      service.error = error
+      if healthy:
+        if service.state != self.READY:
+          logging.info('"%s" is ready on port %d', name, forwarding.port)
+        service.state = self.READY
+        service.interval = self.__max_interval
+      else:
+        if service.state == self.READY:
+          logging.warning('"%s" is no longer responding: %s', name, error)
+          service.interval = self.__min_interval
+        else:
+          service.interval = min(service.interval * 2, self.__max_interval)
+        service.state = self.WAITING
+      service.next_probe_time = self.__clock() + service.interval
+
+  def __restart_tunnel(self, name, service):
+    """Replace the tunnel to a service whose tunnel process has died."""
+    if service.restarts >= self.__max_restarts:
+      logging.error('It appears %s is no longer available.'
+                    ' Giving up after %d tunnel restarts.',
+                    name, service.restarts)
+      with self.__condition:
+        service.state = self.FAILED
+        service.error = 'The tunnel to {0} keeps closing.'.format(name)
+      return
+
+    with self.__condition:
+      if self.__closed:
+        return
+      service.restarts += 1
+      service.state = self.WAITING
+    logging.warning('The tunnel to %s closed. Restarting it.', name)
+
+    # The tunnel can take a while to start, so do not hold up the
+    # other services while it does.
+    try:
+      forwarding = self.__forward_port(name)
+      error = None
+    except Exception as ex:
+      logging.exception('Exception while restarting tunnel to "%s"', name)
+      forwarding = None
+      error = ex
+
+    with self.__condition:
+      closed = self.__closed
+      if forwarding is not None and not closed:
+        service.forwarding = forwarding
+      service.error = error
+      service.interval = self.__min_interval
+      service.next_probe_time = self.__clock() + service.interval
+    if closed and forwarding is not None:
+      # close() gave up waiting on us, so nothing else will terminate it.
+      self.__stop_forwardings([forwarding])
 
 
 class ValidateBomTestController(object):
   """The test controller runs integration tests against a deployment."""
 
+  # How many times a test waiting on quota can be passed over for tests
+  # after it before it reserves the quota it is waiting on.
+  MAX_TIMES_PASSED_OVER = 3
+
+  # Rescrape the configuration snapshots this often. This is well within
+  # spinnaker_testing.scrape_spring_config.CONFIG_SNAPSHOT_MAX_AGE_SECS.
+  CONFIG_SNAPSHOT_REFRESH_SECS = 60 * 60
+
   @property
   def test_suite(self):
     """Returns the main test suite loaded from --test_suite."""
@@ -346,13 +657,6 @@ class ValidateBomTestController(object):
     """Determine final exit code for all tests."""
     return -1 if self.failed else 0
 
-  def __close_forwarded_ports(self):
-    for forwarding in self.__forwarded_ports.values():
-      try:
-        forwarding[0].kill()
-      except Exception as ex:
-        logging.error('Error terminating child: %s', ex)
-
   def __init__(self, deployer):
     options = deployer.options
     quota_spec = {parts[0]: int(parts[1])
@@ -368,7 +672,7 @@ class ValidateBomTestController(object):
     self.__passed = []  # Resulted in success
     self.__failed = []  # Resulted in failure
     self.__skipped = []  # Will not run at all
-    self.__test_suite = yaml.safe_load(file(options.test_profiles, 'r'))
+    self.__test_suite = load_yaml(file(options.test_profiles, 'r'), safe=True)
     self.__extra_test_bindings = (
         self.__load_bindings(options.test_extra_profile_bindings)
         if options.test_extra_profile_bindings
@@ -376,13 +680,37 @@ class ValidateBomTestController(object):
     )
 
     num_concurrent = len(self.__test_suite.get('tests')) or 1
-    num_concurrent = int(min(num_concurrent,
-                             options.test_concurrency or num_concurrent))
-    self.__semaphore = threading.Semaphore(num_concurrent)
-
-    # dictionary of service -> ForwardedPort
-    self.__forwarded_ports = {}
-    atexit.register(self.__close_forwarded_ports)
+    self.__num_workers = int(min(num_concurrent,
+                                 options.test_concurrency or num_concurrent))
+
+    # Guards the scheduler's queue of tests awaiting quota, and the names
+    # of the tests already reported as waiting on their quota.
+    self.__schedule_condition = threading.Condition()
+    self.__waiting_on_quota = set()
+    self.__schedule_start_time = None
+    self.__timeline = []
+    self.__times_passed_over = collections.Counter()
+    # The test durations are recorded as the 'test' phase of each test.
+    self.__test_history = BuildHistory(options.test_history_path)
+
+    # Tests load the services' resolved configuration from snapshots taken
+    # once here rather than each scraping the same service themselves.
+    # Each snapshot is keyed by the deployment and service it was scraped
+    # from, and records them so tests ignore snapshots from other
+    # deployments, e.g. left in the log directory by an earlier run.
+    # The lock guards the snapshots and the per-snapshot locks held while
+    # scraping, so only the tests needing the same snapshot wait on it.
+    self.__deployment_id = uuid.uuid4().hex
+    self.__config_snapshot_lock = threading.Lock()
+    self.__config_snapshots = {}
+    self.__config_snapshot_locks = collections.defaultdict(threading.Lock)
+
+    # Owns the ForwardedPort tunnel to each service.
+    # Services we have forwarded to before are being restarted after failing.
+    self.__forwarded_services = set()
+    self.__health_monitor = ServiceHealthMonitor(
+        self.__forward_port_to_service)
+    atexit.register(self.__health_monitor.close)
 
     # Map of service names to native ports.
     self.__service_port_map = {
@@ -410,10 +738,14 @@ class ValidateBomTestController(object):
   def __forward_port_to_service(self, service_name):
     """Forward ports to the deployed service.
 
-    This is private to ensure that it is called with the lock.
-    The lock is needed to mitigate a race condition. See the
-    inline comment around the Popen call.
+    This is private to ensure that it is only called by the health monitor,
+    which serializes the calls. That is needed to mitigate a race condition.
+    See the inline comment around the Popen call.
     """
+    if service_name in self.__forwarded_services:
+      self.__deployer.notify_port_forward_failed(service_name)
+    self.__forwarded_services.add(service_name)
+
     local_port = _unused_port()
     remote_port = self.__service_port_map[service_name]
 
@@ -427,32 +759,13 @@ class ValidateBomTestController(object):
     # Not sure if it is gcloud or python.
     # Locking the individual calls seems to work around it.
     #
-    # We dont need to lock because this function is called from within
-    # the lock already.
+    # We dont need to lock because the health monitor already serializes
+    # the calls to this function.
     logging.debug('RUNNING %s', ' '.join(command))
 
     # Redirect stdout to prevent buffer overflows (at least in k8s)
-    # but keep errors for failures.
-    class KeepAlive(threading.Thread):
-      def run(self):
-        while True:
-          try:
-            logging.info('KeepAlive %s polling', service_name)
-            got = urllib2.urlopen('http://localhost:{port}/health'
-                                  .format(port=local_port))
-            logging.info('KeepAlive %s -> %s', service_name, got.getcode())
-          except Exception as ex:
-            logging.info('KeepAlive %s -> %s', service_name, ex)
-
-          time.sleep(20)
-
-    if self.options.deploy_spinnaker_type == 'distributed':
-      # For now, distributed deployments are k8s
-      # and K8s port forwarding with kubectl requires keep alive.
-      hack = KeepAlive()
-      hack.setDaemon(True)
-      hack.start()
-
+    # but keep errors for failures. K8s port forwarding with kubectl
+    # closes idle tunnels, but the health monitor keeps probing them.
     child = subprocess.Popen(
         command,
         stderr=sys.stderr.fileno(),
@@ -473,10 +786,23 @@ class ValidateBomTestController(object):
     if options.test_disable:
       return 'No test output: testing was disabled.', 0
 
-    summary = ['\nSummary:']
+    summary = []
+    if self.__timeline:
+      summary.append('\nTimeline:')
+      for timing in sorted(self.__timeline, key=lambda t: t.start_secs):
+        summary.append(
+            '  +{start:6.1f}s  {name:<40} queued {queued:6.1f}s'
+            '  ran {ran:6.1f}s'.format(
+                start=timing.start_secs, name=timing.name,
+                queued=timing.queue_secs, ran=timing.run_secs))
+
+    summary.append('\nSummary:')
     append_list_summary(summary, 'SKIPPED', self.skipped)
     append_list_summary(summary, 'PASSED', self.passed)
     append_list_summary(summary, 'FAILED', self.failed)
+    for name, reason in self.failed:
+      summary.append('\n{0} FAILED:\n  {1}'.format(
+          name, '\n  '.join(reason.rstrip().split('\n'))))
 
     num_skipped = len(self.skipped)
     num_passed = len(self.passed)
@@ -496,72 +822,19 @@ class ValidateBomTestController(object):
 
     Args:
       service_name: [string] The service name we we are waiting on.
-      port: [int] The remote port the service is at.
+      port: [int] Unused. The tunnel determines the port.
       timeout: [int] How much time to wait before giving up.
 
     Returns:
       The ForwardedPort entry for this service.
     """
-    try:
-      with self.__lock:
-        forwarding = self.__forwarded_ports.get(service_name)
-        if forwarding is None:
-          forwarding = self.__forward_port_to_service(service_name)
-        self.__forwarded_ports[service_name] = forwarding
-    except Exception as ex:
-      logging.exception('Exception while attempting to forward ports to "%s"',
-                        service_name)
-      raise
-
-    end_time = time.time() + timeout
-    logging.info('Waiting on "%s..."', service_name)
-    if port is None:
-      port = self.__service_port_map[service_name]
-
-    # It seems we have a race condition in the poll
-    # where it thinks the jobs have terminated.
-    # I've only seen this happen once.
-    time.sleep(1)
-
-    threadid = hex(threading.current_thread().ident)
-    count = 0
-    while forwarding.child.poll() is None:
-      try:
-        # localhost is hardcoded here because we are port forwarding.
-        # timeout=20 is to appease kubectl port forwarding, which will close
-        #            if left idle for 30s
-        logging.info('WaitOn polling %s | %s', service_name, threadid)
-        urllib2.urlopen('http://localhost:{port}/health'
-                        .format(port=forwarding.port),
-                        timeout=20)
-        logging.info('"%s" is ready on port %d | %s',
-                     service_name, forwarding.port, threadid)
-        return forwarding
-      except urllib2.HTTPError as error:
-        logging.warning('%s got %s. Ignoring that for now.',
-                        service_name, error)
-        return forwarding
-
-      except (urllib2.URLError, Exception) as error:
-        if count % 5 == 0:
-          # poll every two seconds but only report every 10
-          logging.info('WaitOn got %s | %s', error, threadid)
-        count += 1
-        if time.time() >= end_time:
-          logging.error('Timing out waiting for %s | %s', service_name, threadid)
-          raise error
-        time.sleep(2.0)
-
-    logging.error('It appears %s is no longer available.'
-                  ' Perhaps the tunnel closed.',
-                  service_name)
-    raise RuntimeError('It appears that {0} failed'.format(service_name))
+    # pylint: disable=unused-argument
+    return self.__health_monitor.wait_until_ready(service_name, timeout)
 
   def run_tests(self):
     """The actual controller that coordinates and runs the tests.
 
-    This attempts to process all the tests concurrently across
-    seperate threads, where each test will:
+    This first prepares all the tests concurrently, where each test will:
        (1) Determine whether or not the test is a candidate
            (passes the --test_include / --test_exclude criteria)
 
@@ -580,11 +853,16 @@ class ValidateBomTestController(object):
            (c) If there is an error or the service takes too long then
                outright FAIL the test.
 
-        (3) Acquire the quota that the test requires.
+        (3) Add the test to a priority queue. Tests that took the longest
+            in prior runs come first, followed by those with the largest
+            quota cost. Tests without any history are assumed to be long.
+
+    Then a pool of --test_concurrency workers (default all) runs the queue.
+    Each worker repeatedly:
+        (4) Takes the first test in the queue whose quota is available now.
 
-            * If the quota is not currently available, then block the
-              thread until it is. Since each test is in its own thread, this
-              will not impact other tests.
+            * If no queued test has its quota available, then the worker
+              waits until another test finishes and releases its quota.
 
             * Quota are only internal resources within the controller.
               This is used for purposes of rate limiting, etc. It does not
@@ -594,12 +872,9 @@ class ValidateBomTestController(object):
               a resource without a known quota, then the quota is assumed
               to be infinite.
 
-        (4) Grab a semaphore used to rate limit running tests.
-            This is controlled by --test_concurrency, which defaults to all.
-
         (5) Run the test.
 
-        (6) Release the quota and semaphore to unblock other tests.
+        (6) Release the quota to unblock other tests.
 
         (7) Record the outcome as PASS or FAIL
 
@@ -617,35 +892,55 @@ class ValidateBomTestController(object):
         'Running tests (concurrency=%s).',
         options.test_concurrency or 'infinite')
 
-    thread_pool = ThreadPool(len(all_test_profiles))
-    thread_pool.map(self.__run_or_skip_test_profile_entry_wrapper,
-                    all_test_profiles.items())
+    thread_pool = ThreadPool(self.__num_workers)
+    queue = thread_pool.map(self.__prepare_test_profile_entry_wrapper,
+                            all_test_profiles.items())
     thread_pool.terminate()
+    queue = sorted([entry for entry in queue if entry is not None])
+
+    self.__schedule_start_time = time.time()
+    workers = [threading.Thread(target=self.__run_scheduled_tests,
+                                args=[queue])
+               for _ in range(min(self.__num_workers, len(queue)))]
+    for worker in workers:
+      worker.setDaemon(True)
+      worker.start()
+    for worker in workers:
+      worker.join()
+    self.__test_history.save()
 
     logging.info('Finished running tests.')
 
-  def __run_or_skip_test_profile_entry_wrapper(self, args):
-    """Outer wrapper for running tests
+  def __prepare_test_profile_entry_wrapper(self, args):
+    """Outer wrapper for preparing tests
 
     Args:
       args: [dict entry] The name and spec tuple from the mapped element.
+
+    Returns:
+      The ScheduledTest or None if the test will not be run.
     """
     test_name = args[0]
     spec = args[1]
     try:
-      self.__run_or_skip_test_profile_entry(test_name, spec)
+      return self.__prepare_test_profile_entry(test_name, spec)
     except Exception as ex:
       logging.error('%s threw an exception:\n%s',
                     test_name, traceback.format_exc())
       with self.__lock:
         self.__failed.append((test_name, 'Caught exception {0}'.format(ex)))
+      return None
 
-  def __run_or_skip_test_profile_entry(self, test_name, spec):
-    """Runs a test from within the thread-pool map() function.
+  def __prepare_test_profile_entry(self, test_name, spec):
+    """Prepares a test from within the thread-pool map() function.
 
     Args:
       test_name: [string] The name of the test.
       spec: [dict] The test profile specification.
+            This argument will be pruned as values are consumed from it.
+
+    Returns:
+      The ScheduledTest or None if the test is skipped.
     """
     options = self.options
     if not re.search(options.test_include, test_name):
@@ -653,18 +948,97 @@ class ValidateBomTestController(object):
                 ' --test_include criteria "{criteria}".'
                 .format(name=test_name, criteria=options.test_include))
       logging.warning(reason)
-      self.__skipped.append((test_name, reason))
-      return
+      with self.__lock:
+        self.__skipped.append((test_name, reason))
+      return None
     if options.test_exclude and re.search(options.test_exclude, test_name):
       reason = ('Skipped test "{name}" because it matches explicit'
                 ' --test_exclude criteria "{criteria}".'
                 .format(name=test_name, criteria=options.test_exclude))
       logging.warning(reason)
-      self.__skipped.append((test_name, reason))
-      return
+      with self.__lock:
+        self.__skipped.append((test_name, reason))
+      return None
 
+    quota = spec.pop('quota', {})
     # This can raise an exception
-    self.run_test_profile_helper(test_name, spec)
+    command = self.make_test_command_or_none(test_name, spec)
+    if command is None:
+      return None
+
+    expected_secs = self.__test_history.expected_secs(test_name, 'test')
+    if expected_secs is None:
+      expected_secs = float('inf')
+    priority = (-expected_secs, -sum(quota.values()), test_name)
+    return ScheduledTest(priority, test_name, command, quota, time.time())
+
+  def __pop_runnable_test_unsafe(self, queue):
+    """Remove the first queued test whose quota can be acquired now.
+
+    A test that has been passed over MAX_TIMES_PASSED_OVER times reserves
+    the quota it needs, so that later tests needing the same quota wait for
+    it to run rather than keep taking that quota as it frees up.
+
+    This is not thread-safe so should be called with the schedule condition.
+
+    Args:
+      queue: [list] The ScheduledTest entries in priority order.
+
+    Returns:
+      The ScheduledTest and its acquired quota, or (None, None).
+    """
+    reserved = set()
+    for index, entry in enumerate(queue):
+      if reserved.intersection(entry.quota):
+        continue
+      acquired = self.__quota_tracker.acquire_all_or_none_safe(
+          entry.name, entry.quota)
+      if acquired is not None:
+        for waiting in queue[:index]:
+          self.__times_passed_over[waiting.name] += 1
+        del queue[index]
+        return entry, acquired
+      if entry.name not in self.__waiting_on_quota:
+        # Every rescan retries the whole queue, so only report this once.
+        self.__waiting_on_quota.add(entry.name)
+        logging.info('"%s" waiting on quota %s', entry.name, entry.quota)
+      if (self.__times_passed_over[entry.name]
+          >= self.MAX_TIMES_PASSED_OVER):
+        reserved.update(entry.quota)
+    return None, None
+
+  def __run_scheduled_tests(self, queue):
+    """The worker thread loop running tests until the queue is empty.
+
+    Args:
+      queue: [list] The ScheduledTest entries in priority order, shared by
+         the workers.
+    """
+    while True:
+      with self.__schedule_condition:
+        entry, acquired = self.__pop_runnable_test_unsafe(queue)
+        while entry is None and queue:
+          # Another worker will notify us after it releases its quota.
+          self.__schedule_condition.wait()
+          entry, acquired = self.__pop_runnable_test_unsafe(queue)
+      if entry is None:
+        return
+
+      if acquired:
+        logging.info('"%s" acquired quota %s', entry.name, acquired)
+      try:
+        self.run_scheduled_test(entry)
+      except Exception as ex:
+        logging.error('%s threw an exception:\n%s',
+                      entry.name, traceback.format_exc())
+        with self.__lock:
+          self.__failed.append((entry.name,
+                                'Caught exception {0}'.format(ex)))
+      finally:
+        if acquired:
+          self.__quota_tracker.release_all_safe(entry.name, acquired)
+        with self.__schedule_condition:
+          self.__schedule_condition.notify_all()
 
   def validate_test_requirements(self, test_name, spec):
     """Determine whether or not the test requirements are satisfied.
@@ -785,88 +1159,157 @@ class ValidateBomTestController(object):
         os.path.join(os.path.dirname(__file__), '..', 'testing'))
     test_path = os.path.join(testing_root_dir, test_rel_path)
 
-    citest_log_dir = os.path.join(options.log_dir, 'citest_logs')
-    if not os.path.exists(citest_log_dir):
-      try:
-        os.makedirs(citest_log_dir)
-      except:
-        # check for race condition
-        if not os.path.exists(citest_log_dir):
-          raise
+    citest_log_dir = self.__ensure_citest_log_dir()
 
+    port = self.__health_monitor.get_forwarded_port(microservice_api).port
     command = [
         'python', test_path,
         '--log_dir', citest_log_dir,
         '--log_filebase', test_name,
         '--native_host', 'localhost',
-        '--native_port', str(self.__forwarded_ports[microservice_api].port)
+        '--native_port', str(port)
     ]
+    snapshot_path = (None if options.test_disable_config_snapshot
+                     else self.__get_config_snapshot(microservice_api, port))
+    if snapshot_path:
+      command.extend(['--spring_config_snapshot', snapshot_path,
+                      '--spring_config_snapshot_deployment_id',
+                      self.__deployment_id])
     if options.test_stack:
       command.extend(['--test_stack', options.test_stack])
 
     self.add_extra_arguments(test_name, args, command)
     return command
 
-  def run_test_profile_helper(self, test_name, spec):
-    """Helper function for running an individual test.
+  def __get_config_snapshot(self, service_name, port):
+    """Returns the path to a snapshot of the service's resolved config.
 
-    The caller wraps this to trap and handle exceptions.
+    The service is scraped the first time it is asked for, and written with
+    spinnaker_testing.scrape_spring_config so that the tests can load it.
+    It is scraped again once the snapshot is CONFIG_SNAPSHOT_REFRESH_SECS
+    old, well before the tests would consider it stale.
 
-    Args:
-      test_name: The test being run.
-      spec: The test specification profile.
-            This argument will be pruned as values are consumed from it.
+    Returns:
+      The path to the snapshot or None if it could not be taken.
     """
-    quota = spec.pop('quota', {})
-    command = self.make_test_command_or_none(test_name, spec)
-    if command is None:
-      return
-    capture = CommandOutputMediator(test_name)
+    key = (self.__deployment_id, service_name)
+
+    def get_current_unsafe():
+      path, timestamp = self.__config_snapshots.get(key, (None, None))
+      if (timestamp is not None
+          and time.time() - timestamp < self.CONFIG_SNAPSHOT_REFRESH_SECS):
+        return path, True
+      return None, False
+
+    with self.__config_snapshot_lock:
+      path, found = get_current_unsafe()
+      if found:
+        return path
+      snapshot_lock = self.__config_snapshot_locks[key]
+
+    with snapshot_lock:
+      with self.__config_snapshot_lock:
+        path, found = get_current_unsafe()
+        if found:
+          return path
+      timestamp = time.time()
+      url = 'http://localhost:{port}/resolvedEnv'.format(port=port)
+      path = self.__take_config_snapshot(service_name, url, timestamp)
+      with self.__config_snapshot_lock:
+        self.__config_snapshots[key] = (path, timestamp)
+      return path
+
+  def __take_config_snapshot(self, service_name, url, timestamp):
+    """Scrape the service's resolved config and save it for the tests."""
+    try:
+      # This is only available when testing/citest is on the PYTHONPATH,
+      # as validate_bom.sh arranges for the tests.
+      from spinnaker_testing import scrape_spring_config
+    except ImportError as ex:
+      logging.warning('Not taking configuration snapshots: %s.'
+                      ' Tests will scrape it themselves.', ex)
+      return None
+
+    path = os.path.join(self.__ensure_citest_log_dir(),
+                        '{0}.resolved_env.json'.format(service_name))
+    try:
+      config = scrape_spring_config.scrape_spring_config(url, timeout=30)
+      scrape_spring_config.save_config_snapshot(
+          path, url, config, self.__deployment_id, timestamp=timestamp)
+    except (IOError, OSError, ValueError) as ex:
+      logging.warning('Could not snapshot %s configuration: %s.'
+                      ' Tests will scrape it themselves.', service_name, ex)
+      return None
+    logging.info('Snapshot %s configuration into %s', service_name, path)
+    return path
+
+  def __ensure_citest_log_dir(self):
+    """Returns the directory for the test logs, creating it if needed."""
+    citest_log_dir = os.path.join(self.options.log_dir, 'citest_logs')
+    if not os.path.exists(citest_log_dir):
+      try:
+        os.makedirs(citest_log_dir)
+      except:
+        # check for race condition
+        if not os.path.exists(citest_log_dir):
+          raise
+    return citest_log_dir
+
+  def run_scheduled_test(self, entry):
+    """Helper function for running an individual test.
 
-    logging.info('Acquiring quota for test "%s"...', test_name)
-    quota_tracker = self.__quota_tracker
-    acquired_quota = quota_tracker.acquire_all_safe(test_name, quota)
-    if acquired_quota:
-      logging.info('"%s" acquired quota %s', test_name, acquired_quota)
+    The caller has already acquired the test's quota and wraps this
+    to trap and handle exceptions.
 
-    execute_time = None
-    start_time = time.time()
+    Args:
+      entry: [ScheduledTest] The test to run.
+    """
+    test_name = entry.name
+    command = entry.command
+    options = self.options
+    sink = TestOutputSink(
+        os.path.join(self.__ensure_citest_log_dir(),
+                     '{0}.output.log'.format(test_name)),
+        compress=options.test_output_compress,
+        max_tail_bytes=options.test_failure_tail_bytes)
+
+    execute_time = time.time()
+    queue_secs = execute_time - max(entry.ready_time,
+                                    self.__schedule_start_time)
+    wait_time = int(queue_secs + 0.5)
+    if wait_time > 1:
+      logging.info('"%s" waited %d secs for a worker and quota.',
+                   test_name, wait_time)
     try:
-      logging.info('Scheduling "%s"...', test_name)
-
-      # This will block. Note that we already acquired quota, thus
-      # we are blocking holding onto that quota. However since we are
-      # blocked awaiting a thread, nobody else can execute either,
-      # so it doesnt matter that we might be starving them of quota.
-      self.__semaphore.acquire(True)
-      execute_time = time.time()
-      wait_time = int(execute_time - start_time + 0.5)
-      if wait_time > 1:
-        logging.info('"%s" had a semaphore contention for %d secs.',
-                     test_name, wait_time)
       logging.info('Executing "%s"...', test_name)
       logging.debug('Running %s', ' '.join(command))
       result = run_and_monitor(' '.join(command),
-                               echo=False,
-                               observe_stdout=capture.capture_stdout,
-                               observe_stderr=capture.capture_stderr)
+                               echo=False, capture=False,
+                               observe_stdout=sink.write,
+                               observe_stderr=sink.write)
     finally:
-      logging.info('Finished executing "%s"...', test_name)
-      self.__semaphore.release()
-      if acquired_quota:
-        quota_tracker.release_all_safe(test_name, acquired_quota)
+      sink.close()
 
-    capture.flush()
     end_time = time.time()
     delta_time = int(end_time - execute_time + 0.5)
+    self.__test_history.record(test_name, 'test', end_time - execute_time)
 
     with self.__lock:
+      self.__timeline.append(TestTiming(
+          test_name,
+          start_secs=execute_time - self.__schedule_start_time,
+          queue_secs=queue_secs,
+          run_secs=end_time - execute_time))
       if result.returncode == 0:
-        logging.info('%s PASSED after %d secs', test_name, delta_time)
-        self.__passed.append((test_name, result.stdout))
+        logging.info('%s PASSED after %d secs (%d bytes of output in %s)',
+                     test_name, delta_time, sink.num_bytes, sink.path)
+        self.__passed.append((test_name, sink.path))
       else:
-        logging.info('FAILED %s after %d secs', test_name, delta_time)
-        self.__failed.append((test_name, result.stderr))
+        logging.info('FAILED %s after %d secs (%d bytes of output in %s)',
+                     test_name, delta_time, sink.num_bytes, sink.path)
+        self.__failed.append(
+            (test_name, 'Exited with {code}. Output ends with:\n{tail}'
+             .format(code=result.returncode, tail=sink.get_tail())))
 
 
 def init_argument_parser(parser):
@@ -885,6 +1328,22 @@ def init_argument_parser(parser):
       '--test_concurrency', default=None, type=int,
       help='Limits how many tests to run at a time. Default is unbounded')
 
+  parser.add_argument(
+      '--test_output_compress', default=False, action='store_true',
+      help='Gzip the output files captured from each test.')
+
+  parser.add_argument(
+      '--test_failure_tail_bytes', default=4096, type=int,
+      help='How much of the end of a failed test\'s output to include in'
+           ' the summary.')
+
+  parser.add_argument(
+      '--test_history_path',
+      default=os.path.join(os.environ.get('HOME', ''), '.cache',
+                           'spinnaker-validate-bom-history.json'),
+      help='A file recording how long recent runs of each test took, used to'
+           ' start the longest expected tests first.')
+
   parser.add_argument(
       '--test_default_quota',
       default='google_backend_services=3,google_forwarding_rules=3,google_ssl_certificates=2,google_cpu=20,appengine_deployment=1',
@@ -898,6 +1357,11 @@ def init_argument_parser(parser):
       '--test_disable', default=False, action='store_true',
       help='If true then dont run the testing phase.')
 
+  parser.add_argument(
+      '--test_disable_config_snapshot', default=False, action='store_true',
+      help='If true then have each test scrape its service\'s resolved'
+           ' configuration itself rather than sharing a snapshot of it.')
+
   parser.add_argument(
       '--test_include', default='.*',
       help='Regular expression of tests to run or None for all.')
@@ -200,8 +200,7 @@ class CassandraChanger(object):
           yml = f.read()
 
         stat = os.stat(path)
-        yml = self._do_change_yml(yml, path, _ECHO_KEYS)
-        yml = self._do_change_yml(yml, path, _FRONT50_KEYS)
+        yml = self._do_change_yml(yml, path, _ECHO_KEYS + _FRONT50_KEYS)
         f = os.open(path, os.O_WRONLY | os.O_TRUNC, 0600)
         os.write(f, yml)
         os.close(f)
@@ -239,6 +238,12 @@ class CassandraChanger(object):
     if not yml:
      return yml
 
+    try:
+      return self.__bindings.transform_yaml_source_keys(yml, keys)
+    except KeyError:
+      pass
+
+    # Apply the keys individually so we know which ones are not there.
     for key in keys:
       try:
         yml = self.__bindings.transform_yaml_source(yml, key)
@@ -0,0 +1,188 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keeps track of the running spinnaker subsystem processes."""
+
+import os
+import re
+
+
+class ProcessRegistry(object):
+  """Tracks the java processes running spinnaker subsystems using pidfiles.
+
+  Each subsystem has a <run_dir>/<subsystem>.pid file. A pidfile is only
+  trusted if /proc/<pid>/cmdline is still the java process for that
+  subsystem. When any pidfile is stale, when there are no pidfiles, or when
+  a subsystem the caller expects has no pidfile (e.g. it was started by hand
+  or by an older runner), all the pidfiles are rebuilt from a single scan of
+  /proc.
+
+  A pidfile may initially contain the pid of the process that launched the
+  subsystem. This is stale by definition, so the next lookup will find the
+  actual java process and record it instead. Until the java process appears,
+  the pidfile is kept for as long as the launcher is still running.
+  """
+
+  PIDFILE_SUFFIX = '.pid'
+
+  @property
+  def run_dir(self):
+    return self.__run_dir
+
+  @staticmethod
+  def is_supported(proc_dir='/proc'):
+    """Determine if this platform provides the /proc filesystem we need."""
+    return os.path.exists(os.path.join(proc_dir, str(os.getpid()), 'cmdline'))
+
+  def __init__(self, run_dir, subsystem_root_dir, proc_dir='/proc'):
+    """Constructor.
+
+    Args:
+      run_dir [string]: The directory to keep pidfiles in.
+      subsystem_root_dir [string]: The directory the subsystems are
+         installed into, used to recognize them by their classpath.
+      proc_dir [string]: The path to the /proc filesystem.
+    """
+    self.__run_dir = run_dir
+    self.__proc_dir = proc_dir
+    self.__re_main_class = re.compile(r'\bcom\.netflix\.spinnaker\.([^\.]+)\.')
+    self.__re_classpath = re.compile(
+        '-(?:classpath|cp) {install_root}/([^/]+)/'
+        .format(install_root=re.escape(subsystem_root_dir.rstrip('/'))))
+
+  def get_jobs(self, expected=None):
+    """Look up all the running subsystems.
+
+    Args:
+      expected [list of string]: The subsystems the caller is interested in.
+         If any of these has no pidfile then the pidfiles might not be
+         complete, so /proc is scanned to find it.
+
+    Returns:
+       dictionary keyed by subsystem name with pid values.
+    """
+    try:
+      filenames = os.listdir(self.__run_dir)
+    except OSError:
+      return self.refresh()
+
+    jobs = {}
+    for filename in filenames:
+      if not filename.endswith(self.PIDFILE_SUFFIX):
+        continue
+      subsystem = filename[:-len(self.PIDFILE_SUFFIX)]
+      pid = self.__read_pidfile(subsystem)
+      if pid is None or self.get_subsystem_for_pid(pid) != subsystem:
+        return self.refresh()
+      jobs[subsystem] = pid
+
+    if not jobs or [name for name in expected or [] if name not in jobs]:
+      return self.refresh()
+    return jobs
+
+  def refresh(self):
+    """Rebuild all the pidfiles from the processes currently running.
+
+    Returns:
+       dictionary keyed by subsystem name with pid values.
+    """
+    jobs = {}
+    for entry in os.listdir(self.__proc_dir):
+      if not entry.isdigit():
+        continue
+      pid = int(entry)
+      subsystem = self.get_subsystem_for_pid(pid)
+      if subsystem is not None and subsystem not in jobs:
+        jobs[subsystem] = pid
+
+    try:
+      if not os.path.exists(self.__run_dir):
+        os.makedirs(self.__run_dir)
+      for filename in os.listdir(self.__run_dir):
+        subsystem = filename[:-len(self.PIDFILE_SUFFIX)]
+        if (not filename.endswith(self.PIDFILE_SUFFIX)
+            or subsystem in jobs):
+          continue
+        # Keep the pidfile if its launcher is still running since the
+        # java process might not have been started yet.
+        pid = self.__read_pidfile(subsystem)
+        if pid is None or subsystem not in self.__read_cmdline(pid):
+          os.remove(os.path.join(self.__run_dir, filename))
+      for subsystem, pid in jobs.items():
+        self.__write_pidfile(subsystem, pid)
+    except (IOError, OSError):
+      # We cannot maintain the registry (e.g. we are not root),
+      # but the jobs we found are still correct.
+      pass
+
+    return jobs
+
+  def record_launch(self, subsystem, pid):
+    """Note that we just launched the subsystem.
+
+    Args:
+      subsystem [string]: The name of the subsystem.
+      pid [int]: The process id of the launched process, which might be
+         a parent of the eventual java process.
+    """
+    try:
+      if not os.path.exists(self.__run_dir):
+        os.makedirs(self.__run_dir)
+      self.__write_pidfile(subsystem, pid)
+    except (IOError, OSError):
+      pass
+
+  def forget(self, subsystem):
+    """Remove the pidfile for a subsystem that is no longer running."""
+    try:
+      os.remove(self.__pidfile_path(subsystem))
+    except OSError:
+      pass
+
+  def get_subsystem_for_pid(self, pid):
+    """Determine which subsystem, if any, the process is running.
+
+    Returns:
+      The subsystem name or None if the process is not a subsystem's java
+      process (or is not running at all).
+    """
+    command_line = self.__read_cmdline(pid)
+    if os.path.basename(command_line.split(' ', 1)[0]) != 'java':
+      return None
+
+    match = (self.__re_classpath.search(command_line)
+             or self.__re_main_class.search(command_line))
+    return match.group(1) if match else None
+
+  def __read_cmdline(self, pid):
+    """Returns the space-separated command line for pid, or '' if none."""
+    try:
+      with open(os.path.join(self.__proc_dir, str(pid), 'cmdline'), 'r') as f:
+        return f.read().replace('\0', ' ')
+    except IOError:
+      return ''
+
+  def __pidfile_path(self, subsystem):
+    return os.path.join(self.__run_dir, subsystem + self.PIDFILE_SUFFIX)
+
+  def __read_pidfile(self, subsystem):
+    try:
+      with open(self.__pidfile_path(subsystem), 'r') as f:
+        return int(f.read().strip())
+    except (IOError, ValueError):
+      return None
+
+  def __write_pidfile(self, subsystem, pid):
+    with open(self.__pidfile_path(subsystem), 'w') as f:
+      f.write('{pid}\n'.format(pid=pid))
@@ -17,10 +17,12 @@
 """Provides support functions for running shell commands."""
 
 import collections
-import fcntl
+import errno
 import os
+import select
 import subprocess
 import sys
+import tempfile
 
 
 class RunResult(collections.namedtuple('RunResult',
@@ -32,48 +34,109 @@ class RunResult(collections.namedtuple('RunResult',
   pass
 
 
-def __collect_from_stream(stream, buffer, echo_stream, observe_data):
-  """Read all the input from a stream.
-
-  Args:
-    stream [File]: The file to read() from.
-    buffer [list of string]: The buffer to append the collected data to.
-       This will write a single chunk if any data was read.
-    echo_stream [stream]: If not None, the File to write() for logging
-       the stream.
-
-  Returns:
-    Number of additional bytes added to the buffer.
-  """
-  collected = []
-  try:
-    while True:
-      got = os.read(stream.fileno(), 1)
-      if not got:
-        break
-      collected.append(got)
-      if echo_stream:
-        echo_stream.write(got)
-        echo_stream.flush()
-  except OSError:
-    pass
-
-  # Chunk together all the data we just received.
-  if collected:
-      buffer.append(''.join(collected))
-  if observe_data:
-    observe_data(collected)
-  return len(collected)
+# The most we will read from a pipe at a time.
+_READ_CHUNK_SIZE = 64 * 1024
+
+# Captured output beyond this many bytes is spilled to a temporary file.
+MAX_BUFFERED_OUTPUT_BYTES = 16 * 1024 * 1024
+
+# Partial lines longer than this are passed to observers without waiting
+# for the rest of the line.
+_MAX_OBSERVED_LINE_BYTES = 64 * 1024
+
+# How often to check whether the process exited while waiting on output,
+# in case something it forked is holding its output pipes open.
+_EXIT_POLL_INTERVAL_SECS = 0.25
+
+
+class _StreamCollector(object):
+  """Collects the output from one of a subprocess's pipes."""
+
+  def __init__(self, stream, echo_stream, observe_data, capture=True):
+    """Constructor.
+
+    Args:
+      stream [File]: The pipe to read from.
+      echo_stream [stream]: If not None, the File to write() for logging
+         the stream.
+      observe_data [callable]: If not None, called with a list of text
+         fragments each time one or more complete lines is received.
+      capture [bool]: Whether to keep the data to return from finish().
+    """
+    self.__fd = stream.fileno()
+    self.__echo_stream = echo_stream
+    self.__observe_data = observe_data
+    self.__partial_line = ''
+    self.__captured = (tempfile.SpooledTemporaryFile(
+        max_size=MAX_BUFFERED_OUTPUT_BYTES) if capture else None)
+
+  def fileno(self):
+    return self.__fd
+
+  def read(self):
+    """Read the data currently available from the stream.
+
+    Returns:
+      False if the stream has been closed.
+    """
+    try:
+      got = os.read(self.__fd, _READ_CHUNK_SIZE)
+    except OSError as error:
+      if error.errno in (errno.EAGAIN, errno.EINTR):
+        return True
+      got = ''
+
+    if not got:
+      return False
+
+    if self.__captured is not None:
+      self.__captured.write(got)
+    if self.__echo_stream:
+      self.__echo_stream.write(got)
+      self.__echo_stream.flush()
+
+    if self.__observe_data:
+      text = self.__partial_line + got
+      eoln = text.rfind('\n')
+      if eoln < 0 and len(text) < _MAX_OBSERVED_LINE_BYTES:
+        self.__partial_line = text
+      elif eoln < 0:
+        self.__partial_line = ''
+        self.__observe_data([text])
+      else:
+        self.__partial_line = text[eoln + 1:]
+        self.__observe_data([text[:eoln + 1]])
+    return True
+
+  def finish(self):
+    """Finish collecting, returning all the data collected or None."""
+    if self.__partial_line:
+      self.__observe_data([self.__partial_line])
+      self.__partial_line = ''
+
+    if self.__captured is None:
+      return None
+    self.__captured.seek(0)
+    result = self.__captured.read()
+    self.__captured.close()
+    return result
 
 
 def run_and_monitor(command, echo=True, input=None,
-                    observe_stdout=None, observe_stderr=None):
+                    observe_stdout=None, observe_stderr=None, capture=True):
   """Run the provided command in a subprocess shell.
 
   Args:
     command [string]: The shell command to execute.
     echo [bool]: If True then echo the command and output to stdout.
     input [string]: If non-empty then feed this to stdin.
+    observe_stdout [callable]: If not None then this is called with a list
+       of text fragments as lines are written to stdout. Each call ends on a
+       line boundary unless the command wrote an excessively long line or
+       this is the final trailing text.
+    observe_stderr [callable]: Like observe_stdout but for stderr.
+    capture [bool]: If False then do not keep the output in the result.
+       This is for output that is large and entirely handled by observers.
 
   Returns:
     RunResult with result code and output from running the command.
@@ -88,30 +151,35 @@ def run_and_monitor(command, echo=True, input=None,
       stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=stdin,
       shell=True, close_fds=True)
 
-  # Setup for nonblocking reads
-  fl = fcntl.fcntl(process.stdout, fcntl.F_GETFL)
-  fcntl.fcntl(process.stdout, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-  fl = fcntl.fcntl(process.stderr, fcntl.F_GETFL)
-  fcntl.fcntl(process.stderr, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-
   if stdin:
       process.stdin.write(input)
       process.stdin.close()
 
-  out = []
-  err = []
-  echo_out = sys.stdout if echo else None
-  echo_err = sys.stderr if echo else None
-  while (__collect_from_stream(process.stdout, out, echo_out, observe_stdout)
-         or  __collect_from_stream(process.stderr, err, echo_err, observe_stderr)
-         or process.poll() is None):
-      pass
-
-  # Get any trailing data from termination race condition
-  __collect_from_stream(process.stdout, out, echo_out, observe_stdout)
-  __collect_from_stream(process.stderr, err, echo_err, observe_stderr)
-
-  return RunResult(process.returncode, ''.join(out), ''.join(err))
+  out = _StreamCollector(process.stdout, sys.stdout if echo else None,
+                         observe_stdout, capture=capture)
+  err = _StreamCollector(process.stderr, sys.stderr if echo else None,
+                         observe_stderr, capture=capture)
+  open_streams = [out, err]
+  while open_streams:
+    # Once the process has exited, just drain whatever is already there.
+    exited = process.poll() is not None
+    try:
+      readable = select.select(
+          open_streams, [], [],
+          0 if exited else _EXIT_POLL_INTERVAL_SECS)[0]
+    except select.error as error:
+      if error.args[0] == errno.EINTR:
+        continue
+      raise
+
+    if not readable and exited:
+      break
+    for collector in readable:
+      if not collector.read():
+        open_streams.remove(collector)
+
+  process.wait()
+  return RunResult(process.returncode, out.finish(), err.finish())
 
 
 def run_quick(command, echo=True, dup_stderr_to_stdout=True):
@@ -15,16 +15,17 @@
 # limitations under the License.
 
 import argparse
+import errno
 import os
 import re
 import resource
+import select
 import shutil
 import signal
 import socket
 import subprocess
 import sys
 import time
-import yaml
 
 import yaml_util
 
@@ -34,6 +35,7 @@ from fetch import check_fetch
 from fetch import get_google_project
 from fetch import is_google_instance
 from fetch import GOOGLE_METADATA_URL
+from process_registry import ProcessRegistry
 from run import check_run_quick
 from run import run_quick
 
@@ -61,6 +63,84 @@ def is_local(ip):
   return __ifconfig_lines.find(ip) >= 0
 
 
+class _ReadinessProbe(object):
+  """Tracks non-blocking connection attempts to a subsystem's port.
+
+  Attributes:
+    subsystem [string]: The name of the subsystem being probed.
+    pid [int]: The process id of the subsystem or Runner.EXTERNAL_PID.
+    sock [socket]: The socket with a connection attempt in progress, or None.
+    next_attempt [float]: The time at which to start the next attempt.
+  """
+
+  # How long to wait before retrying after the first failed attempt.
+  INITIAL_BACKOFF_SECS = 0.1
+
+  # How long a single connection attempt may remain in progress.
+  CONNECT_TIMEOUT_SECS = 5
+
+  def __init__(self, subsystem, pid, host, port, max_backoff_secs):
+    self.subsystem = subsystem
+    self.pid = pid
+    self.sock = None
+    self.next_attempt = 0
+    self.__address = (host, port)
+    self.__backoff_secs = self.INITIAL_BACKOFF_SECS
+    self.__max_backoff_secs = max_backoff_secs
+    self.__attempt_started = None
+
+  def fileno(self):
+    return self.sock.fileno()
+
+  def start_attempt(self, now):
+    """Begin a new connection attempt.
+
+    Returns:
+      True if the connection was established immediately.
+    """
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.sock.setblocking(0)
+    self.__attempt_started = now
+    try:
+      code = self.sock.connect_ex(self.__address)
+    except socket.error:
+      code = errno.ECONNREFUSED
+
+    if code == 0:
+      return True
+    if code not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+      self.attempt_failed(now)
+    return False
+
+  def finish_attempt(self, now):
+    """Determine the outcome of the attempt once its socket is writable.
+
+    Returns:
+      True if the connection was established.
+    """
+    if self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+      return True
+    self.attempt_failed(now)
+    return False
+
+  def expire_attempt(self, now):
+    """Abandon the attempt in progress if it has been going on too long."""
+    if (self.sock is not None
+        and now - self.__attempt_started > self.CONNECT_TIMEOUT_SECS):
+      self.attempt_failed(now)
+
+  def attempt_failed(self, now):
+    """Schedule the next attempt, backing off exponentially."""
+    self.close()
+    self.next_attempt = now + self.__backoff_secs
+    self.__backoff_secs = min(self.__backoff_secs * 2, self.__max_backoff_secs)
+
+  def close(self):
+    if self.sock is not None:
+      self.sock.close()
+      self.sock = None
+
+
 class Runner(object):
   """Provides routines for starting / stopping Spinnaker subsystems."""
 
@@ -72,6 +152,27 @@ class Runner(object):
   INDEPENDENT_SUBSYSTEM_LIST=['clouddriver', 'front50', 'orca', 'rosco',
                               'echo']
 
+  # The subsystems that need to be accepting requests before the keyed
+  # subsystem is started. Subsystems whose dependencies are all satisfied
+  # are started together.
+  SUBSYSTEM_DEPENDENCIES = {
+      'igor': INDEPENDENT_SUBSYSTEM_LIST,
+      'fiat': INDEPENDENT_SUBSYSTEM_LIST,
+      'gate': INDEPENDENT_SUBSYSTEM_LIST + ['igor', 'fiat']
+  }
+
+  # The longest we will wait between attempts to connect to a subsystem
+  # while waiting for it to start.
+  MAX_READINESS_BACKOFF_SECS = 2.0
+
+  # How often to report the subsystems we are still waiting on to start.
+  # Those still not up by the first report have their logs shown, so keep
+  # this short enough that a subsystem failing to start is noticed promptly.
+  READINESS_STATUS_SECS = 5
+
+  # How long to wait for subsystems to go away after killing them.
+  KILL_WAIT_SECS = 5
+
   # Denotes a process running on an external host
   EXTERNAL_PID = -123
 
@@ -130,10 +231,20 @@ class Runner(object):
   def configurator(self):
     return self.__configurator
 
+  @property
+  def process_registry(self):
+    """The ProcessRegistry tracking subsystem pids, or None if unsupported."""
+    return self.__process_registry
+
   def __init__(self, installation_parameters=None):
     self.__configurator = Configurator(installation_parameters)
     self.__bindings = self.__configurator.bindings
     self.__installation = self.__configurator.installation
+    self.__process_registry = None
+    if ProcessRegistry.is_supported():
+      self.__process_registry = ProcessRegistry(
+          os.path.join(self.__installation.LOG_DIR, 'run'),
+          self.__installation.SUBSYSTEM_ROOT_DIR)
 
     local_yml_path = os.path.join(self.__installation.USER_CONFIG_DIR,
                                   'spinnaker-local.yml')
@@ -153,6 +264,7 @@ class Runner(object):
     result.extend(['fiat'])
 
     # Gate is started after everything else is up and available.
+    # See SUBSYSTEM_DEPENDENCIES.
     result.append('gate')
 
     # deck is not included here because it is run within apache.
@@ -215,7 +327,10 @@ class Runner(object):
           subsystem=subsystem, host=host)
       return self.EXTERNAL_PID
 
-    return self.start_subsystem(subsystem, environ)
+    pid = self.start_subsystem(subsystem, environ)
+    if self.__process_registry and pid:
+      self.__process_registry.record_launch(subsystem, pid)
+    return pid
 
   def start_subsystem(self, subsystem, environ=None):
     """Start the specified subsystem.
@@ -278,18 +393,42 @@ class Runner(object):
         return self.start_subsystem_if_local(
               subsystem, environ=self.get_subsystem_environ(subsystem))
 
-  def start_spinnaker_subsystems(self, jobs):
-    started_list = []
-    for subsys in self.INDEPENDENT_SUBSYSTEM_LIST:
-        pid = self.maybe_start_job(jobs, subsys)
-        if pid:
-          started_list.append((subsys, pid))
+  @classmethod
+  def get_startup_levels(cls, subsystems):
+    """Partition subsystems into the order they should be started in.
+
+    Dependencies on subsystems that are not being started are ignored.
+
+    Args:
+      subsystems [list of string]: The names of the subsystems to start.
+
+    Returns:
+      list of lists of subsystem names. The subsystems in each list can be
+      started together once those in all the preceding lists are ready.
+    """
+    remaining = list(subsystems)
+    scheduled = set()
+    levels = []
+    while remaining:
+      level = [name for name in remaining
+               if all(dependency in scheduled or dependency not in subsystems
+                      for dependency
+                      in cls.SUBSYSTEM_DEPENDENCIES.get(name, []))]
+      if not level:
+        raise ValueError('Cyclic dependencies between subsystems {0}'
+                         .format(', '.join(remaining)))
+      levels.append(level)
+      scheduled.update(level)
+      remaining = [name for name in remaining if name not in scheduled]
+    return levels
+
+  def get_enabled_subsystem_names(self):
+    """Determine which subsystems should be run given the configuration."""
+    result = list(self.INDEPENDENT_SUBSYSTEM_LIST)
 
     fiat_enabled = self.__bindings.get('services.fiat.enabled')
     if fiat_enabled:
-      pid = self.maybe_start_job(jobs, 'fiat')
-      if pid:
-        started_list.append(('fiat', pid))
+      result.append('fiat')
 
     jenkins_address = self.__bindings.get(
         'services.jenkins.defaultMaster.baseUrl')
@@ -311,19 +450,47 @@ class Runner(object):
               address=jenkins_address))
 
     if igor_enabled:
-      pid = self.maybe_start_job(jobs, 'igor')
-      if pid:
-        started_list.append(('igor', pid))
+      result.append('igor')
 
-    for subsystem in started_list:
-      self.wait_for_service(subsystem[0], pid=subsystem[1])
+    result.append('gate')
+    return result
 
-    pid = self.maybe_start_job(jobs, 'gate')
-    self.wait_for_service('gate', pid=pid)
+  def start_spinnaker_subsystems(self, jobs):
+    ready_secs = {}
+    for level in self.get_startup_levels(self.get_enabled_subsystem_names()):
+      started_list = []
+      for subsys in level:
+        pid = self.maybe_start_job(jobs, subsys)
+        if pid:
+          started_list.append((subsys, pid))
+      ready_secs.update(self.wait_for_services(started_list))
 
-  def get_all_java_subsystem_jobs(self):
+    print 'Time until each subsystem was accepting requests:'
+    for subsys in sorted(ready_secs, key=ready_secs.get):
+      print '  {subsys:<12} {secs:.1f}s'.format(subsys=subsys,
+                                                secs=ready_secs[subsys])
+
+  def get_all_java_subsystem_jobs(self, expected=None):
     """Look up all the running java jobs.
 
+    Args:
+      expected [list of string]: The subsystems the caller is about to act on.
+         These are always looked for, even if the process registry does not
+         know about them. Each one that is not running costs a scan of all
+         the processes, so only pass subsystems that are enabled.
+
+    Returns:
+       dictionary keyed by package name (spinnaker subsystem) with pid values.
+    """
+    if self.__process_registry:
+      return self.__process_registry.get_jobs(expected)
+    return self.get_all_java_subsystem_jobs_from_jvm()
+
+  def get_all_java_subsystem_jobs_from_jvm(self):
+    """Look up all the running java jobs using the JVM tools.
+
+    This is used on platforms without /proc, and is much slower.
+
     Returns:
        dictionary keyed by package name (spinnaker subsystem) with pid values.
     """
@@ -397,7 +564,7 @@ class Runner(object):
                                dir=self.__installation.UTILITY_SCRIPT_DIR))
 
     with open(path, 'r') as f:
-      data = yaml.load(f, Loader=yaml.Loader)
+      data = yaml_util.load_yaml(f)
     return data['server']['port'], data['server'].get('address', None)
 
   @staticmethod
@@ -405,7 +572,12 @@ class Runner(object):
     return subprocess.Popen(['/usr/bin/tail', '-f', path], stdout=sys.stdout,
                             shell=False)
 
-  def wait_for_service(self, subsystem, pid, show_log_while_waiting=True):
+  def get_service_endpoint(self, subsystem):
+    """Determine the host and port that the subsystem accepts requests on.
+
+    Returns:
+      host, port
+    """
     try:
       port, address = self.find_port_and_address(subsystem)
     except KeyError:
@@ -415,53 +587,117 @@ class Runner(object):
       sys.stderr.write(error)
       raise SystemExit(error)
 
-    log_path = os.path.join(self.__installation.LOG_DIR, subsystem + '.log')
-    print ('Waiting for {subsys} to start accepting requests on port {port}...'
-           .format(subsys=subsystem, port=port))
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if address:
+      host_colon = address.find(':')
+      host = address if host_colon < 0 else address[:host_colon]
+    else:
+      host = 'localhost'
+    return host, port
 
-    tail_process = None
-    wait_msg_retries = 5 # Give half a second before showing log/warning.
-    while True:
-      if address:
-        host_colon = address.find(':')
-        host = address if host_colon < 0 else address[:host_colon]
-      else:
-        host = 'localhost'
+  def get_service_log_path(self, subsystem):
+    """Returns the path of the log file the subsystem writes to."""
+    return os.path.join(self.__installation.LOG_DIR, subsystem + '.log')
 
-      try:
-        sock.connect((host, port))
-        break
-      except IOError:
-        if pid == self.EXTERNAL_PID:
-           tail_process = True  # Pretend, but really nothing to tail.
-        else:
-           try:
-             os.kill(pid, 0)
-           except OSError:
-             raise SystemExit('{subsys} failed to start'.format(
-                 subsys=subsystem))
-
-        if show_log_while_waiting and not tail_process:
-          if wait_msg_retries > 0:
-            # Give an initial delay before checking,
-            # as well as a delay between checks.
-            # The initial delay is because of a race condition having an old
-            # log file and starting to write a new one.
-            wait_msg_retries -= 1
-          elif not os.path.exists(log_path):
-            print '{path} does not yet exist..'.format(path=log_path)
-            wait_msg_retries = 5  # don't display again for half a second.
-          else:
-            tail_process = self.start_tail(log_path)
-
-        time.sleep(0.1)
-
-    if tail_process and pid != self.EXTERNAL_PID:
-      tail_process.kill()
-    sock.close()
-    print 'Spinnaker subsystem={subsys} is up.'.format(subsys=subsystem)
+  def wait_for_services(self, pid_list, show_log_while_waiting=True):
+    """Wait for all the given subsystems to start accepting requests.
+
+    The subsystems are probed together, each backing off independently
+    between failed connection attempts.
+
+    Args:
+      pid_list [list of (string, int)]: The subsystems to wait on and their
+         process ids (or EXTERNAL_PID).
+      show_log_while_waiting [bool]: Tail the logs of local subsystems that
+         are still not up after READINESS_STATUS_SECS until they are.
+
+    Returns:
+      dictionary keyed by subsystem name with the number of seconds it took
+      each to start accepting requests.
+    """
+    tail_processes = {}
+    try:
+      return self.__wait_for_services(
+          pid_list, tail_processes if show_log_while_waiting else None)
+    finally:
+      for tail_process in tail_processes.values():
+        self.__stop_tail(tail_process)
 
+  @staticmethod
+  def __stop_tail(tail_process):
+    tail_process.kill()
+    tail_process.wait()
+
+  def __tail_slow_service_logs(self, pending, tail_processes):
+    """Start tailing the logs of the pending subsystems not already tailed."""
+    for probe in pending:
+      if probe.pid == self.EXTERNAL_PID or probe.subsystem in tail_processes:
+        continue
+      log_path = self.get_service_log_path(probe.subsystem)
+      if not os.path.exists(log_path):
+        print '{path} does not yet exist..'.format(path=log_path)
+        continue
+      tail_processes[probe.subsystem] = self.start_tail(log_path)
+
+  def __wait_for_services(self, pid_list, tail_processes):
+    start_time = time.time()
+    pending = []
+    for subsystem, pid in pid_list:
+      host, port = self.get_service_endpoint(subsystem)
+      print ('Waiting for {subsys} to start accepting requests on port {port}...'
+             .format(subsys=subsystem, port=port))
+      pending.append(_ReadinessProbe(subsystem, pid, host, port,
+                                     self.MAX_READINESS_BACKOFF_SECS))
+
+    ready_secs = {}
+    next_status_time = start_time + self.READINESS_STATUS_SECS
+    while pending:
+      now = time.time()
+      ready = []
+      for probe in pending:
+        probe.expire_attempt(now)
+        if probe.sock is None and probe.next_attempt <= now:
+          if probe.start_attempt(now):
+            ready.append(probe)
+
+      if not ready:
+        for probe in pending:
+          if probe.pid == self.EXTERNAL_PID:
+            continue
+          try:
+            os.kill(probe.pid, 0)
+          except OSError:
+            for other in pending:
+              other.close()
+            raise SystemExit('{subsys} failed to start'.format(
+                subsys=probe.subsystem))
+
+        if now >= next_status_time:
+          print 'Still waiting on {subsystems}'.format(
+              subsystems=', '.join([probe.subsystem for probe in pending]))
+          if tail_processes is not None:
+            self.__tail_slow_service_logs(pending, tail_processes)
+          next_status_time = now + self.READINESS_STATUS_SECS
+
+        in_progress = [probe for probe in pending if probe.sock is not None]
+        idle_until = [probe.next_attempt
+                      for probe in pending if probe.sock is None]
+        timeout = min(idle_until + [now + self.MAX_READINESS_BACKOFF_SECS,
+                                    next_status_time])
+        writable = select.select([], in_progress, [],
+                                 max(0, timeout - now))[1]
+        now = time.time()
+        ready = [probe for probe in writable if probe.finish_attempt(now)]
+
+      for probe in ready:
+        probe.close()
+        pending.remove(probe)
+        ready_secs[probe.subsystem] = now - start_time
+        print 'Spinnaker subsystem={subsys} is up.'.format(
+            subsys=probe.subsystem)
+        if tail_processes and probe.subsystem in tail_processes:
+          self.__stop_tail(tail_processes.pop(probe.subsystem))
+
+    return ready_secs
 
   def warn_if_configuration_looks_old(self):
     local_yml_path = os.path.join(self.__installation.USER_CONFIG_DIR,
@@ -512,7 +748,10 @@ Proceeding anyway.
 
     google_enabled = self.__bindings.get('providers.google.enabled')
 
-    jobs = self.get_all_java_subsystem_jobs()
+    # Only look for the subsystems we are going to start. Disabled ones are
+    # never running unless we started them, so they have pidfiles then.
+    jobs = self.get_all_java_subsystem_jobs(
+        self.get_enabled_subsystem_names())
     self.start_spinnaker_subsystems(jobs)
     self.start_deck()
     print 'Started all Spinnaker components.'
@@ -527,47 +766,114 @@ Proceeding anyway.
     self.stop_subsystem(name, pid)
     return pid
 
+  @staticmethod
+  def is_process_running(pid):
+    try:
+      os.kill(pid, 0)
+      return True
+    except OSError as error:
+      return error.errno == errno.EPERM
+
+  def wait_for_stopped(self, pid_list, grace_secs):
+    """Wait for all the given subsystems to terminate.
+
+    Any subsystems still running after the grace period are killed.
+    Those still running KILL_WAIT_SECS after that are given up on.
+
+    Args:
+      pid_list [list of (string, int)]: The subsystems that were signaled
+         to stop and their process ids.
+      grace_secs [int]: How long to wait before escalating to SIGKILL.
+
+    Returns:
+      dictionary keyed by subsystem name with the number of seconds it
+      took each to stop. Subsystems that did not stop are omitted.
+    """
+    start_time = time.time()
+    pending = list(pid_list)
+    stopped_secs = {}
+    kill_time = None
+    next_status_time = start_time + 10
+    while True:
+      now = time.time()
+      for name, pid in list(pending):
+        if not self.is_process_running(pid):
+          pending.remove((name, pid))
+          stopped_secs[name] = now - start_time
+          print '{name} pid={pid} stopped.'.format(name=name, pid=pid)
+          if self.process_registry:
+            self.process_registry.forget(name)
+      if not pending:
+        break
+
+      if kill_time is not None and now - kill_time >= self.KILL_WAIT_SECS:
+        for name, pid in pending:
+          sys.stderr.write('ERROR: {name} pid={pid} did not stop even after'
+                           ' being killed.\n'.format(name=name, pid=pid))
+        break
+
+      if kill_time is None and now - start_time >= grace_secs:
+        for name, pid in pending:
+          sys.stderr.write('WARNING: Killing {name} pid={pid} because it did'
+                           ' not stop within {secs}s.\n'
+                           .format(name=name, pid=pid, secs=grace_secs))
+          try:
+            os.kill(pid, signal.SIGKILL)
+          except OSError:
+            pass
+        kill_time = now
+      elif now >= next_status_time:
+        print 'Waiting on {names}'.format(
+            names=', '.join(['{0} pid={1}'.format(name, pid)
+                             for name, pid in pending]))
+        next_status_time = now + 10
+      time.sleep(0.1)
+
+    return stopped_secs
+
   def stop(self, options):
-    stopped_list = []
     component = options.component.lower()
     if not component:
       component = self.__SPINNAKER_COMPONENT
 
-    jobs = self.get_all_java_subsystem_jobs()
     if component != self.__SPINNAKER_COMPONENT:
         if component == 'deck':
           self.stop_deck()
-        else:
-          pid = self.maybe_stop_subsystem(component, jobs)
-          if pid:
-            stopped_list.append((component, pid))
+          return
+        levels = [[component]]
     else:
         self.stop_deck()
-        for name in self.get_all_subsystem_names():
-          pid = self.maybe_stop_subsystem(name, jobs)
-          if pid:
-            stopped_list.append((name, pid))
-
-    for name,pid in stopped_list:
-        count = 0
-        while True:
-          try:
-            os.kill(pid, 0)
-            count += 1
-            if count % 10 == 0:
-                if count == 0:
-                  sys.stdout.write('Waiting on {name}, pid={pid}..'.format(
-                      name=name, pid=pid))
-                else:
-                  sys.stdout.write('.')
-                sys.stdout.flush()
-            time.sleep(0.1)
-          except OSError:
-            if count > 10:  # We didn't start logging until 10
-              sys.stdout.write('{pid} stopped.\n'.format(pid=pid))
-              sys.stdout.flush()
-            break
-
+        # Stop in the reverse order that we start so that nothing is
+        # routed to subsystems that are already stopping.
+        levels = self.get_startup_levels(self.get_all_subsystem_names())
+        levels.reverse()
+
+    # Subsystems we started are all in the registry, even if they have since
+    # been disabled, so only the enabled ones need to be looked for.
+    jobs = self.get_all_java_subsystem_jobs(
+        [component] if component != self.__SPINNAKER_COMPONENT
+        else self.get_enabled_subsystem_names())
+    stopped_secs = {}
+    failed = []
+    for level in levels:
+      stopped_list = []
+      for name in level:
+        pid = self.maybe_stop_subsystem(name, jobs)
+        if pid:
+          stopped_list.append((name, pid))
+      stopped_secs.update(
+          self.wait_for_stopped(stopped_list, options.stop_grace_secs))
+      failed.extend([name for name, _ in stopped_list
+                     if name not in stopped_secs])
+
+    if stopped_secs:
+      print 'Time until each subsystem stopped:'
+      for name in sorted(stopped_secs, key=stopped_secs.get):
+        print '  {name:<12} {secs:.1f}s'.format(name=name,
+                                                secs=stopped_secs[name])
+    if failed:
+      raise SystemExit('Failed to stop {names}'.format(
+          names=', '.join(failed)))
 
   def run(self, options):
     action = options.action.upper()
@@ -580,7 +886,8 @@ Proceeding anyway.
       if component == self.__SPINNAKER_COMPONENT:
         self.start_all(options)
       else:
-        self.maybe_start_job(self.get_all_java_subsystem_jobs(), component)
+        self.maybe_start_job(
+            self.get_all_java_subsystem_jobs([component]), component)
 
     if action == 'STOP':
       self.stop(options)
@@ -589,6 +896,9 @@ Proceeding anyway.
     parser.add_argument('action', help='START or STOP or RESTART')
     parser.add_argument('component',
                         help='Name of component to start or stop, or ALL')
+    parser.add_argument('--stop_grace_secs', default=60, type=int,
+                        help='How long to wait for a subsystem to stop before'
+                             ' killing it.')
 
   def check_configuration(self, options):
     local_path = os.path.join(self.__installation.USER_CONFIG_DIR,
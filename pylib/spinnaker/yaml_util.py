@@ -12,10 +12,46 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import os
 import re
 import yaml
 
+try:
+  # These are only defined when PyYAML can import its libyaml extension.
+  from yaml import CLoader as _AcceleratedLoader
+  from yaml import CSafeLoader as _AcceleratedSafeLoader
+  HAVE_ACCELERATED_YAML = True
+except ImportError:
+  HAVE_ACCELERATED_YAML = False
+
+
+def yaml_loader(safe=False, accelerated=True):
+  """Return the yaml Loader class to load documents with.
+
+  Args:
+    safe [boolean]: If True then only construct standard yaml types.
+    accelerated [boolean]: If True then use the libyaml based loader when
+       it is available. Otherwise always use the pure python one.
+
+  Returns:
+    A Loader class for yaml.load.
+  """
+  if accelerated and HAVE_ACCELERATED_YAML:
+    return _AcceleratedSafeLoader if safe else _AcceleratedLoader
+  return yaml.SafeLoader if safe else yaml.Loader
+
+
+def load_yaml(stream, safe=False):
+  """Load the first document in a yaml string or file stream.
+
+  This uses the fastest loader available. The libyaml based loader does not
+  keep the document source in its marks, so use the pure python yaml.Loader
+  where the marks matter.
+  """
+  return yaml.load(stream, Loader=yaml_loader(safe=safe))
+
+
 def yml_or_yaml_path(basedir, basename):
   """Return a path to the requested YAML file.
 
@@ -38,36 +74,151 @@ def yml_or_yaml_path(basedir, basename):
   return yml_path
 
 
+# Matches a ${key} or ${key:default} reference within a binding value.
+_EXPRESSION_RE = re.compile(r'\${([\._a-zA-Z0-9]+)(:.+?)?}')
+
+# Types of typed values that are safe to share between callers.
+_IMMUTABLE_TYPES = (basestring, bool, int, long, float, type(None))
+
+
+def _typed_value(value_text, cache):
+  """Convert the text of a value into the YAML value.
+
+  This is used for type conversion for default values and environment
+  variable overrides. There doesnt seem to be a direct API so we parse a
+  small document, but we remember the scalar results since the same
+  handful of values are converted over and over.
+
+  Args:
+    value_text [string]: The text to convert.
+    cache [dict]: The previously converted scalar values keyed by their text.
+  """
+  try:
+    return cache[value_text]
+  except KeyError:
+    pass
+
+  value = load_yaml('x: {0}'.format(value_text))['x']
+  if isinstance(value, _IMMUTABLE_TYPES):
+    cache[value_text] = value
+  return value
+
+
+class _CompiledValue(object):
+  """A binding value pre-parsed into literal text and variable references.
+
+  Attributes:
+    text [string]: The original value text.
+    exact_reference [(string, string)]: If the entire text is a single
+       reference then this is its (key, default), where default is None
+       if the reference does not have one. Otherwise None.
+    fragments [list]: The text as a list of literal strings interleaved
+       with (key, default, reference_text) tuples for each reference.
+  """
+  __slots__ = ('text', 'exact_reference', 'fragments')
+
+  def __init__(self, text):
+    self.text = text
+    self.exact_reference = None
+    self.fragments = []
+
+    offset = 0
+    for match in _EXPRESSION_RE.finditer(text):
+      key = str(match.group(1))
+      default = match.group(2)[1:] if match.group(2) else None
+      if match.start() == 0 and match.end() == len(text):
+        self.exact_reference = (key, default)
+      if match.start() > offset:
+        self.fragments.append(text[offset:match.start()])
+      self.fragments.append((key, default, match.group(0)))
+      offset = match.end()
+    if offset < len(text):
+      self.fragments.append(text[offset:])
+
+
+def _compile_value(text, cache):
+  """Return the _CompiledValue for the given text, compiling it if needed.
+
+  Args:
+    text [string]: The value text.
+    cache [dict]: The previously compiled values keyed by their text.
+  """
+  compiled = cache.get(text)
+  if compiled is None:
+    compiled = _CompiledValue(text)
+    cache[text] = compiled
+  return compiled
+
+
+class _ResolvedEntry(object):
+  """A memoized resolution of a key.
+
+  The entry remains valid until the bindings change or the environment
+  introduces or changes an override for any of the keys it depended on.
+  """
+  __slots__ = ('value', 'depends_on', 'environ')
+
+  def __init__(self, value, depends_on):
+    self.value = value
+    self.depends_on = frozenset(depends_on)
+    self.environ = [(key, os.environ.get(key, None))
+                    for key in self.depends_on]
+
+  def is_current(self):
+    for key, value in self.environ:
+      if os.environ.get(key, None) != value:
+        return False
+    return True
+
+
 class YamlBindings(object):
   """Implements a map from yaml using variable references similar to spring."""
 
   @property
   def map(self):
+    """The raw bindings.
+
+    Callers that modify this directly rather than through import_dict
+    must call invalidate() afterwards so cached resolutions are dropped.
+    """
     return self.__map
 
   def __init__(self):
     self.__map = {}
+    self.__resolved = {}
+
+    # The values parsed while resolving, which only grow with the bindings
+    # and environment they came from, so are dropped along with them.
+    self.__typed_values = {}
+    self.__compiled_values = {}
 
   def __getitem__(self, field):
-    return self.__get_field_value(field, [], original=field)
+    return self.__get_field_value(field, set(), original=field)
 
   def get(self, field, default=None):
     try:
-      return self.__get_field_value(field, [], original=field)
+      return self.__get_field_value(field, set(), original=field)
     except KeyError:
       return default
 
+  def invalidate(self):
+    """Forget all the previously resolved and parsed values."""
+    self.__resolved = {}
+    self.__typed_values = {}
+    self.__compiled_values = {}
+
   def import_dict(self, d):
     if d is not None:
+      self.invalidate()
       for name,value in d.items():
         self.__update_field(name, value, self.__map)
 
   def import_string(self, s):
-    self.import_dict(yaml.load(s, Loader=yaml.Loader))
+    self.import_dict(load_yaml(s))
 
   def import_path(self, path):
     with open(path, 'r') as f:
-      self.import_dict(yaml.load(f, Loader=yaml.Loader))
+      self.import_dict(load_yaml(f))
 
   def __update_field(self, name, value, container):
     if not isinstance(value, dict) or not name in container:
@@ -96,65 +247,100 @@ class YamlBindings(object):
         node = node[part]
     return node
 
-  def __typed_value(self, value_text):
-    """Convert the text of a value into the YAML value.
+  def __get_field_value(self, field, visiting, original):
+    return self.__lookup(field, visiting, original)[0]
+
+  def __lookup(self, field, visiting, original):
+    """Resolve the value of field, consulting and updating the memo table.
+
+    Args:
+      field [string]: The dot-delimited key to resolve.
+      visiting [set]: The keys whose resolution is currently in progress.
+         Encountering one of these again means the references form a cycle.
+      original [string]: The key originally requested, for error reporting.
+
+    Returns:
+      value, depends_on
+
+      where:
+        value: The resolved value.
+        depends_on: [frozenset] Every key consulted to produce the value.
 
-    This is used for type conversion for default values.
-    Not particularly efficient, but there doesnt seem to be a direct API.
+    Raises:
+      KeyError if field is not bound.
     """
-    return yaml.load('x: {0}'.format(value_text), Loader=yaml.Loader)['x']
+    entry = self.__resolved.get(field)
+    if entry is not None and entry.is_current():
+      return entry.value, entry.depends_on
 
-  def __get_field_value(self, field, saw, original):
     value = os.environ.get(field, None)
     if value is None:
       value = self.__get_node(field)
     else:
-      value = self.__typed_value(value)
-    if not isinstance(value, basestring) or value.find('$') < 0:
-      return value
+      value = _typed_value(value, self.__typed_values)
 
-    if field in saw:
-      raise ValueError('Cycle looking up variable ' + original)
-    saw = saw + [field]
+    depends_on = set([field])
+    if isinstance(value, basestring) and value.find('$') >= 0:
+      if field in visiting:
+        raise ValueError('Cycle looking up variable ' + original)
+      visiting.add(field)
+      try:
+        value = self.__evaluate(
+            _compile_value(value, self.__compiled_values),
+            visiting, original, depends_on)
+      finally:
+        visiting.discard(field)
 
-    return self.__resolve_value(value, saw, original)
+    entry = _ResolvedEntry(value, depends_on)
+    self.__resolved[field] = entry
+    return value, entry.depends_on
 
-  def __resolve_value(self, value, saw, original):
-    expression_re = re.compile('\${([\._a-zA-Z0-9]+)(:.+?)?}')
-    exact_match = expression_re.match(value)
+  def __evaluate(self, compiled, visiting, original, depends_on):
+    """Evaluate a compiled value against the current bindings.
 
-    if exact_match and exact_match.group(0) == value:
+    Args:
+      compiled [_CompiledValue]: The value to evaluate.
+      visiting [set]: See __lookup.
+      original [string]: See __lookup.
+      depends_on [set]: Accumulates the keys consulted during evaluation.
+    """
+    if compiled.exact_reference is not None:
+      key, default = compiled.exact_reference
       try:
-        got = self.__get_field_value(exact_match.group(1), saw, original)
+        got, consulted = self.__lookup(key, visiting, original)
+        depends_on.update(consulted)
         return got
       except KeyError:
-        if exact_match.group(2):
-          return self.__typed_value(exact_match.group(2)[1:])
-        else:
-          return value
+        depends_on.add(key)
+        if default is not None:
+          return _typed_value(default, self.__typed_values)
+        return compiled.text
 
     result = []
-    offset = 0
+    for fragment in compiled.fragments:
+      if isinstance(fragment, basestring):
+        result.append(fragment)
+        continue
 
-    # Look for fragments of ${key} or ${key:default} then resolve them.
-    text = value
-    for match in expression_re.finditer(text):
-        result.append(text[offset:match.start()])
-        try:
-          got = self.__get_field_value(str(match.group(1)), saw, original)
-          result.append(str(got))
-        except KeyError:
-          if match.group(2):
-            result.append(str(match.group(2)[1:]))
-          else:
-            result.append(match.group(0))
-        offset = match.end()  # skip trailing '}'
-    result.append(text[offset:])
+      # Look for fragments of ${key} or ${key:default} then resolve them.
+      key, default, text = fragment
+      try:
+        got, consulted = self.__lookup(key, visiting, original)
+        depends_on.update(consulted)
+        result.append(str(got))
+      except KeyError:
+        depends_on.add(key)
+        if default is not None:
+          result.append(str(default))
+        else:
+          result.append(text)
 
     return ''.join(result)
 
   def replace(self, text):
-    return self.__resolve_value(text, [], text)
+    # The text is often a whole file that will not be seen again,
+    # so dont remember it.
+    return self.__evaluate(_CompiledValue(text), set(), text, set())
 
 
   def __get_flat_keys(self, container):
@@ -186,10 +372,8 @@ class YamlBindings(object):
     updated_keys = bindings.__get_flat_keys(bindings.__map)
     source = '' # declare so this is in scope for both 'with' blocks
     with open(path, 'r') as source_file:
-      source = source_file.read()
-      for prop in updated_keys:
-        source = bindings.transform_yaml_source(source, prop,
-                                                add_new_nodes=add_new_nodes)
+      source = bindings.transform_yaml_source_keys(
+          source_file.read(), updated_keys, add_new_nodes=add_new_nodes)
 
     with open(path, 'w') as source_file:
       source_file.write(source)
@@ -202,7 +386,10 @@ class YamlBindings(object):
 
     Args:
       source: [string] The YAML source text.
-      root_node: [yaml.nodes.MappingNode]  The composed yaml tree
+      root_node: [yaml.SpanIndex] The index of the source from
+         yaml.index_spans, which can be reused for any number of lookups.
+         A composed yaml tree is also accepted, but is not used beyond
+         indexing the source.
       full_key: [string] Dot-delimited path whose value we're looking for
       raise_if_not_found: [boolean] Whether to raise a KeyError or return
          additional context if key isnt found.
@@ -216,52 +403,41 @@ class YamlBindings(object):
                               to cut.
     """
     parts = full_key.split('.')
-    if not isinstance(root_node, yaml.nodes.MappingNode):
-      if not root_node and not raise_if_not_found:
+    span_index = root_node
+    if not isinstance(span_index, yaml.SpanIndex):
+      span_index = yaml.index_spans(source, Loader=yaml.Loader)
+    if span_index.root_kind is not yaml.nodes.MappingNode:
+      if span_index.root_kind is None and not raise_if_not_found:
         return (self._make_missing_key_text('', parts), '\n'), (0, 0)
       else:
-        raise ValueError(root_node.__class__.__name__ + ' is not a yaml node.')
-
-    closest_node = None
-    for key_index, key in enumerate(parts):
-      found = False
-      for node in root_node.value:
-        if node[0].value == key:
-          closest_node = node
-          found = True
-          break
-      if not found:
-        break
-      root_node = closest_node[1]
-
-    if closest_node is None:
+        raise ValueError((span_index.root_kind or type(None)).__name__
+                         + ' is not a yaml node.')
+
+    depth, closest = span_index.find_closest(tuple(parts))
+    if closest is None:
       if raise_if_not_found:
         raise KeyError(full_key)
       # Nothing matches, so stick this at the start of the file.
       return (self._make_missing_key_text('', parts), '\n'), (0, 0)
 
-    span = (closest_node[1].start_mark.index,
-            closest_node[1].end_mark.index)
+    span = (closest.value_start, closest.value_end)
     span_is_empty = span[0] == span[1]
 
-    if found:
-      # value of closest_node is what we are going to replace.
+    if depth == len(parts):
+      # value of closest is what we are going to replace.
       # There is still a space between the token and value we write.
       return (' ' if span_is_empty else '', ''), span
 
     if raise_if_not_found:
-      raise KeyError('.'.join(parts[0:key_index + 1]))
+      raise KeyError('.'.join(parts[0:depth + 1]))
 
     # We are going to add a new child. This is going to be indented equal
     # to the current line if the value isnt empty, otherwise one more level.
-    line_start = closest_node[0].start_mark.index - 1
-    while line_start >= 0 and source[line_start] == ' ':
-      line_start -= 1
-
-    indent = ' ' * (closest_node[0].start_mark.index - line_start + 1)
-    key_text = self._make_missing_key_text(indent, parts[key_index:])
+    indent = ' ' * closest.indent
+    key_text = self._make_missing_key_text(indent, parts[depth:])
     if span_is_empty:
-      key_text = '  ' + prefix
+      # The parent has no value so the child starts a new line under it.
+      return ('\n' + indent + key_text, ''), (span[0], span[0])
     return (key_text, '\n' + indent), (span[0], span[0])
 
   def _make_missing_key_text(self, indent, keys):
@@ -292,11 +468,97 @@ class YamlBindings(object):
     Returns:
       Transformed source with value of key replaced to match the bindings.
     """
-    try:
-      value = self[key]
-    except KeyError:
+    return self.transform_yaml_source_keys(
+        source, [key], add_new_nodes=add_new_nodes)
+
+  def transform_yaml_source_keys(self, source, keys, add_new_nodes=True):
+    """Transform the given yaml source so the values of keys match the bindings.
+
+    This is equivalent to calling transform_yaml_source for each of the keys,
+    but the source is only indexed once and all the edits are spliced into
+    the result together. Missing keys that share a parent are added together
+    beneath it in the order they were given.
+
+    Args:
+      source [string]: A YAML document
+      keys [list of string]: The keys into the bindings to update.
+         Keys that are not among the bindings are ignored.
+      add_new_nodes [boolean]: If true, add nodes for keys not already present.
+           Otherwise raise a KeyError.
+
+    Returns:
+      Transformed source with value of each key replaced to match the bindings.
+
+    Raises:
+      ValueError if a key is nested within another of the keys.
+    """
+    values = collections.OrderedDict()
+    for key in keys:
+      try:
+        values[key] = self.__format_source_value(self[key])
+      except KeyError:
+        pass
+    if not values:
       return source
 
+    # The edit for a key would overlap the edit for any key nested within it.
+    paths = set(tuple(key.split('.')) for key in values)
+    for key in values:
+      parts = tuple(key.split('.'))
+      for depth in range(1, len(parts)):
+        if parts[0:depth] in paths:
+          raise ValueError('Cannot update both "{parent}" and "{key}".'
+                           .format(parent='.'.join(parts[0:depth]), key=key))
+
+    # The offsets are all that is needed, so dont compose the whole document.
+    span_index = yaml.index_spans(source, Loader=yaml.Loader)
+    if span_index.root_kind is not yaml.nodes.MappingNode:
+      if span_index.root_kind is not None or not add_new_nodes:
+        raise ValueError((span_index.root_kind or type(None)).__name__
+                         + ' is not a yaml node.')
+
+    edits = []
+    missing = collections.OrderedDict()
+    for key, value in values.items():
+      parts = tuple(key.split('.'))
+      depth, closest = span_index.find_closest(parts)
+
+      if depth == len(parts):
+        # There is still a space between the token and value we write.
+        text_before = ' ' if closest.value_start == closest.value_end else ''
+        edits.append((closest.value_start, closest.value_end,
+                      text_before + value))
+        continue
+
+      if not add_new_nodes:
+        raise KeyError(key if depth == 0 else '.'.join(parts[0:depth + 1]))
+
+      tree = missing.setdefault(parts[0:depth], collections.OrderedDict())
+      for part in parts[depth:-1]:
+        tree = tree.setdefault(part, collections.OrderedDict())
+      tree[parts[-1]] = value
+
+    insertions = [self.__make_insertion_edit(span_index.get(parent), tree)
+                  for parent, tree in missing.items()]
+
+    # Stable sort keeps insertions ahead of replacements at the same offset.
+    # Otherwise the text after the insertion would repeat what was replaced.
+    edits = insertions + edits
+    edits.sort(key=lambda edit: edit[0])
+    result = []
+    offset = 0
+    for start_cut, end_cut, text in edits:
+      if start_cut < offset:
+        raise ValueError('Overlapping edits at offset {0}.'.format(start_cut))
+      result.append(source[offset:start_cut])
+      result.append(text)
+      offset = end_cut
+    result.append(source[offset:])
+    return ''.join(result)
+
+  @staticmethod
+  def __format_source_value(value):
+    """Returns the text to write into yaml source for a bound value."""
     if isinstance(value, basestring) and re.search('{[^}]*{', value):
       # Quote strings with nested {} yaml flows
       value = '"{0}"'.format(value)
@@ -305,21 +567,47 @@ class YamlBindings(object):
     if isinstance(value, bool):
       value = str(value).lower()
 
-    yaml_root = yaml.compose(source)
-    context, span = self.find_yaml_context(
-        source, yaml_root, key, not add_new_nodes)
-
-    text_before = context[0]
-    text_after = context[1]
-    start_cut = span[0]
-    end_cut = span[1]
-    return ''.join([
-        source[0:start_cut],
-        text_before,
-        '{value}'.format(value=value),
-        text_after,
-        source[end_cut:]
-    ])
+    return '{value}'.format(value=value)
+
+  def __make_insertion_edit(self, parent_span, tree):
+    """Determine how to add new nodes beneath an existing parent.
+
+    Args:
+      parent_span [yaml.Span]: The span of the entry that the new nodes are
+         added to, or None for the document root.
+      tree [OrderedDict]: The missing keys relative to the parent, whose values
+         are either nested OrderedDict or the text of the value to write.
+
+    Returns:
+      (start_cut, end_cut, text) edit to splice into the source.
+    """
+    if parent_span is None:
+      # Nothing matches, so stick this at the start of the file.
+      return (0, 0, self.__render_missing_keys('', tree) + '\n')
+
+    # We are going to add new children. These are going to be indented equal
+    # to the current line if the value isnt empty, otherwise one more level.
+    indent = ' ' * parent_span.indent
+    insert_at = parent_span.value_start
+    text = self.__render_missing_keys(indent, tree)
+    if insert_at == parent_span.value_end:
+      return (insert_at, insert_at, '\n' + indent + text)
+    return (insert_at, insert_at, text + '\n' + indent)
+
+  @staticmethod
+  def __render_missing_keys(indent, tree, depth=0):
+    """Render the text for new nodes in the style of _make_missing_key_text."""
+    lines = []
+    for key, value in tree.items():
+      if isinstance(value, dict):
+        lines.append('{extra_indent}{key}:'.format(extra_indent='  ' * depth,
+                                                   key=key))
+        lines.append(YamlBindings.__render_missing_keys(indent, value,
+                                                        depth + 1))
+      else:
+        lines.append('{extra_indent}{key}: {value}'
+                     .format(extra_indent='  ' * depth, key=key, value=value))
+    return ('\n' + indent).join(lines)
 
 
 def load_bindings(installed_config_dir, user_config_dir, only_if_local=False):
@@ -7,6 +7,7 @@ from nodes import *
 
 from loader import *
 from dumper import *
+from spans import *
 
 __version__ = '3.11'
 
@@ -61,6 +62,17 @@ def compose_all(stream, Loader=Loader):
     finally:
         loader.dispose()
 
+def index_spans(stream, Loader=Loader):
+    """
+    Parse the first YAML document in a stream
+    and produce a SpanIndex of where its mapping entries are.
+    """
+    loader = Loader(stream)
+    try:
+        return SpanIndexer(loader).index()
+    finally:
+        loader.dispose()
+
 def load(stream, Loader=Loader):
     """
     Parse the first YAML document in a stream
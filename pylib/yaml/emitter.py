@@ -11,6 +11,8 @@ __all__ = ['Emitter', 'EmitterError']
 from error import YAMLError
 from events import *
 
+import re
+
 class EmitterError(YAMLError):
     pass
 
@@ -28,6 +30,13 @@ class ScalarAnalysis(object):
         self.allow_double_quoted = allow_double_quoted
         self.allow_block = allow_block
 
+class _OutputBuffer(object):
+    # Collects what the emitter writes until the next flush_stream.
+
+    def __init__(self):
+        self.chunks = []
+        self.write = self.chunks.append
+
 class Emitter(object):
 
     DEFAULT_TAG_PREFIXES = {
@@ -35,6 +44,20 @@ class Emitter(object):
         u'tag:yaml.org,2002:' : u'!!',
     }
 
+    # The fast path collects the output of each document in one buffer
+    # rather than making a stream.write call for every token, reuses the
+    # analysis of scalars and tags it has already seen (keys repeat
+    # throughout most documents), recognizes simple scalars with one match
+    # and writes plain scalars that cannot wrap in one piece.
+    # It produces exactly the same output; set `fast_path` to False to
+    # compare with the general path.
+    fast_path = True
+    LINE_BREAK = re.compile(u'[\n\x85\u2028\u2029]')
+
+    # Scalars such as names, versions and paths that any style can hold.
+    SIMPLE_SCALAR = re.compile(
+            u'[0-9A-Za-z_/](?:[-0-9A-Za-z_./ ]*[-0-9A-Za-z_./])?\Z')
+
     def __init__(self, stream, canonical=None, indent=None, width=None,
             allow_unicode=None, line_break=None):
 
@@ -103,6 +126,12 @@ class Emitter(object):
         self.analysis = None
         self.style = None
 
+        # The stream the fast path flushes its buffer to, and the analysis
+        # of scalars and tags already seen.
+        self.output_stream = None
+        self.analysis_cache = {}
+        self.tag_cache = {}
+
     def dispose(self):
         # Reset the state attributes (to clear self-references)
         self.states = []
@@ -161,6 +190,9 @@ class Emitter(object):
         if isinstance(self.event, StreamStartEvent):
             if self.event.encoding and not getattr(self.stream, 'encoding', None):
                 self.encoding = self.event.encoding
+            if self.fast_path:
+                self.output_stream = self.stream
+                self.stream = _OutputBuffer()
             self.write_stream_start()
             self.state = self.expect_first_document_start
         else:
@@ -184,6 +216,7 @@ class Emitter(object):
                 version_text = self.prepare_version(self.event.version)
                 self.write_version_directive(version_text)
             self.tag_prefixes = self.DEFAULT_TAG_PREFIXES.copy()
+            self.tag_cache = {}
             if self.event.tags:
                 handles = self.event.tags.keys()
                 handles.sort()
@@ -580,6 +613,15 @@ class Emitter(object):
         return u''.join(chunks)
 
     def prepare_tag(self, tag):
+        if not self.fast_path:
+            return self.prepare_new_tag(tag)
+        text = self.tag_cache.get(tag)
+        if text is None:
+            text = self.prepare_new_tag(tag)
+            self.tag_cache[tag] = text
+        return text
+
+    def prepare_new_tag(self, tag):
         if not tag:
             raise EmitterError("tag must not be empty")
         if tag == u'!':
@@ -627,6 +669,21 @@ class Emitter(object):
         return anchor
 
     def analyze_scalar(self, scalar):
+        if not self.fast_path:
+            return self.analyze_new_scalar(scalar)
+        analysis = self.analysis_cache.get(scalar)
+        if analysis is None:
+            if self.SIMPLE_SCALAR.match(scalar):
+                analysis = ScalarAnalysis(scalar=scalar, empty=False,
+                        multiline=False, allow_flow_plain=True,
+                        allow_block_plain=True, allow_single_quoted=True,
+                        allow_double_quoted=True, allow_block=True)
+            else:
+                analysis = self.analyze_new_scalar(scalar)
+            self.analysis_cache[scalar] = analysis
+        return analysis
+
+    def analyze_new_scalar(self, scalar):
 
         # Empty scalar is a special case.
         if not scalar:
@@ -788,7 +845,14 @@ class Emitter(object):
     # Writers.
 
     def flush_stream(self):
-        if hasattr(self.stream, 'flush'):
+        if self.output_stream is not None:
+            chunks = self.stream.chunks
+            if chunks:
+                self.output_stream.write(''.join(chunks))
+                del chunks[:]
+            if hasattr(self.output_stream, 'flush'):
+                self.output_stream.flush()
+        elif hasattr(self.stream, 'flush'):
             self.stream.flush()
 
     def write_stream_start(self):
@@ -1092,6 +1156,15 @@ class Emitter(object):
             self.stream.write(data)
         self.whitespace = False
         self.indention = False
+        if (self.fast_path and not self.LINE_BREAK.search(text)
+                and (not split or self.column+len(text) <= self.best_width
+                    or u' ' not in text)):
+            # Nothing to break or wrap, so the text goes out as it is.
+            self.column += len(text)
+            if self.encoding:
+                text = text.encode(self.encoding)
+            self.stream.write(text)
+            return
         spaces = False
         breaks = False
         start = end = 0
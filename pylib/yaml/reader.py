@@ -19,7 +19,7 @@ __all__ = ['Reader', 'ReaderError']
 
 from error import YAMLError, Mark
 
-import codecs, re
+import bisect, codecs, re
 
 class ReaderError(YAMLError):
 
@@ -54,134 +54,112 @@ class Reader(object):
     #  - a file-like object with its `read` method returning `str`,
     #  - a file-like object with its `read` method returning `unicode`.
 
-    # Yeah, it's ugly and slow.
+    # The whole input is decoded and checked in one pass up front, so moving
+    # forward is just pointer arithmetic. The line and column are not tracked
+    # as the reader moves; they are looked up in an index of line break
+    # offsets, which is only built once a line or column is asked for.
 
     def __init__(self, stream):
         self.name = None
         self.stream = None
-        self.stream_pointer = 0
-        self.eof = True
         self.buffer = u''
         self.pointer = 0
-        self.raw_buffer = None
-        self.raw_decode = None
         self.encoding = None
-        self.index = 0
-        self.line = 0
-        self.column = 0
+        self.line_starts = None
+        self.bom_offsets = None
+        self.position_pointer = None
+        self.position = None
         if isinstance(stream, unicode):
             self.name = "<unicode string>"
-            self.check_printable(stream)
-            self.buffer = stream+u'\0'
+            data = stream
         elif isinstance(stream, str):
             self.name = "<string>"
-            self.raw_buffer = stream
-            self.determine_encoding()
+            data = self.decode(stream)
         else:
             self.stream = stream
             self.name = getattr(stream, 'name', "<file>")
-            self.eof = False
-            self.raw_buffer = ''
-            self.determine_encoding()
+            data = stream.read()
+            if not isinstance(data, unicode):
+                data = self.decode(data)
+        self.check_printable(data)
+        self.buffer = data+u'\0'
+
+    @property
+    def index(self):
+        return self.pointer
+
+    @property
+    def line(self):
+        return self.get_position()[0]
+
+    @property
+    def column(self):
+        return self.get_position()[1]
 
     def peek(self, index=0):
-        try:
-            return self.buffer[self.pointer+index]
-        except IndexError:
-            self.update(index+1)
-            return self.buffer[self.pointer+index]
+        return self.buffer[self.pointer+index]
 
     def prefix(self, length=1):
-        if self.pointer+length >= len(self.buffer):
-            self.update(length)
         return self.buffer[self.pointer:self.pointer+length]
 
     def forward(self, length=1):
-        if self.pointer+length+1 >= len(self.buffer):
-            self.update(length+1)
-        while length:
-            ch = self.buffer[self.pointer]
-            self.pointer += 1
-            self.index += 1
-            if ch in u'\n\x85\u2028\u2029'  \
-                    or (ch == u'\r' and self.buffer[self.pointer] != u'\n'):
-                self.line += 1
-                self.column = 0
-            elif ch != u'\uFEFF':
-                self.column += 1
-            length -= 1
+        self.pointer += length
 
     def get_mark(self):
+        line, column = self.get_position()
         if self.stream is None:
-            return Mark(self.name, self.index, self.line, self.column,
+            return Mark(self.name, self.pointer, line, column,
                     self.buffer, self.pointer)
         else:
-            return Mark(self.name, self.index, self.line, self.column,
+            return Mark(self.name, self.pointer, line, column,
                     None, None)
 
-    def determine_encoding(self):
-        while not self.eof and len(self.raw_buffer) < 2:
-            self.update_raw()
-        if not isinstance(self.raw_buffer, unicode):
-            if self.raw_buffer.startswith(codecs.BOM_UTF16_LE):
-                self.raw_decode = codecs.utf_16_le_decode
-                self.encoding = 'utf-16-le'
-            elif self.raw_buffer.startswith(codecs.BOM_UTF16_BE):
-                self.raw_decode = codecs.utf_16_be_decode
-                self.encoding = 'utf-16-be'
-            else:
-                self.raw_decode = codecs.utf_8_decode
-                self.encoding = 'utf-8'
-        self.update(1)
+    # A line ends after any of these; '\r' only if it is not part of '\r\n'.
+    LINE_BREAK = re.compile(u'[\n\x85\u2028\u2029]|\r(?!\n)')
+    def get_position(self):
+        # Returns the (line, column) of the current character.
+        # Byte order marks do not count towards the column.
+        if self.position_pointer == self.pointer:
+            return self.position
+        if self.line_starts is None:
+            self.line_starts = [0]+[match.end() for match
+                    in self.LINE_BREAK.finditer(self.buffer)]
+            self.bom_offsets = [match.start() for match
+                    in re.finditer(u'\uFEFF', self.buffer)]
+        line = bisect.bisect_right(self.line_starts, self.pointer)-1
+        line_start = self.line_starts[line]
+        column = self.pointer-line_start
+        if self.bom_offsets:
+            column -= (bisect.bisect_left(self.bom_offsets, self.pointer)
+                    - bisect.bisect_left(self.bom_offsets, line_start))
+        self.position_pointer = self.pointer
+        self.position = (line, column)
+        return self.position
+
+    def decode(self, data):
+        if data.startswith(codecs.BOM_UTF16_LE):
+            self.encoding = 'utf-16-le'
+            decode = codecs.utf_16_le_decode
+        elif data.startswith(codecs.BOM_UTF16_BE):
+            self.encoding = 'utf-16-be'
+            decode = codecs.utf_16_be_decode
+        else:
+            self.encoding = 'utf-8'
+            decode = codecs.utf_8_decode
+        try:
+            return decode(data, 'strict', True)[0]
+        except UnicodeDecodeError, exc:
+            raise ReaderError(self.name, exc.start, exc.object[exc.start],
+                    exc.encoding, exc.reason)
 
     NON_PRINTABLE = re.compile(u'[^\x09\x0A\x0D\x20-\x7E\x85\xA0-\uD7FF\uE000-\uFFFD]')
     def check_printable(self, data):
         match = self.NON_PRINTABLE.search(data)
         if match:
             character = match.group()
-            position = self.index+(len(self.buffer)-self.pointer)+match.start()
-            raise ReaderError(self.name, position, ord(character),
+            raise ReaderError(self.name, match.start(), ord(character),
                     'unicode', "special characters are not allowed")
 
-    def update(self, length):
-        if self.raw_buffer is None:
-            return
-        self.buffer = self.buffer[self.pointer:]
-        self.pointer = 0
-        while len(self.buffer) < length:
-            if not self.eof:
-                self.update_raw()
-            if self.raw_decode is not None:
-                try:
-                    data, converted = self.raw_decode(self.raw_buffer,
-                            'strict', self.eof)
-                except UnicodeDecodeError, exc:
-                    character = exc.object[exc.start]
-                    if self.stream is not None:
-                        position = self.stream_pointer-len(self.raw_buffer)+exc.start
-                    else:
-                        position = exc.start
-                    raise ReaderError(self.name, position, character,
-                            exc.encoding, exc.reason)
-            else:
-                data = self.raw_buffer
-                converted = len(data)
-            self.check_printable(data)
-            self.buffer += data
-            self.raw_buffer = self.raw_buffer[converted:]
-            if self.eof:
-                self.buffer += u'\0'
-                self.raw_buffer = None
-                break
-
-    def update_raw(self, size=1024):
-        data = self.stream.read(size)
-        if data:
-            self.raw_buffer += data
-            self.stream_pointer += len(data)
-        else:
-            self.eof = True
-
 #try:
 #    import psyco
 #    psyco.bind(Reader)
@@ -29,6 +29,8 @@ __all__ = ['Scanner', 'ScannerError']
 from error import MarkedYAMLError
 from tokens import *
 
+import re
+
 class ScannerError(MarkedYAMLError):
     pass
 
@@ -45,6 +47,22 @@ class SimpleKey(object):
 
 class Scanner(object):
 
+    # The fast path matches runs of characters with these expressions
+    # directly against the reader's buffer, which holds the whole input,
+    # rather than looking at one character at a time. It produces exactly
+    # the same tokens; set `fast_path` to False to compare with the general
+    # path.
+    fast_path = True
+    SPACES = re.compile(u' *')
+    SPACES_AND_COMMENT = re.compile(u' *(?:#[^\0\r\n\x85\u2028\u2029]*)?')
+    PLAIN_BLOCK_RUN = re.compile(u'[^\0 \t\r\n\x85\u2028\u2029:]*'
+            u'(?::(?![\0 \t\r\n\x85\u2028\u2029])[^\0 \t\r\n\x85\u2028\u2029:]*)*')
+    PLAIN_FLOW_RUN = re.compile(u'[^\0 \t\r\n\x85\u2028\u2029,:?\[\]{}]*')
+
+    # These are the only characters that can start something other than a
+    # plain scalar ('.' for the document end marker).
+    NOT_PLAIN_START = u'\0 \t\r\n\x85\u2028\u2029-?:,[]{}#&*!|>\'\"%@`.'
+
     def __init__(self):
         """Initialize the scanner."""
         # It is assumed that Scanner and Reader will have a common descendant.
@@ -165,6 +183,11 @@ class Scanner(object):
         # Peek the next character.
         ch = self.peek()
 
+        # Most tokens in block style documents are plain scalars. Nothing
+        # else can start with one of these characters, so skip the checks.
+        if self.fast_path and ch not in self.NOT_PLAIN_START:
+            return self.fetch_plain()
+
         # Is it the end of stream?
         if ch == u'\0':
             return self.fetch_stream_end()
@@ -774,11 +797,15 @@ class Scanner(object):
             self.forward()
         found = False
         while not found:
-            while self.peek() == u' ':
-                self.forward()
-            if self.peek() == u'#':
-                while self.peek() not in u'\0\r\n\x85\u2028\u2029':
+            if self.fast_path:
+                self.forward(self.SPACES_AND_COMMENT.match(
+                        self.buffer, self.pointer).end()-self.pointer)
+            else:
+                while self.peek() == u' ':
                     self.forward()
+                if self.peek() == u'#':
+                    while self.peek() not in u'\0\r\n\x85\u2028\u2029':
+                        self.forward()
             if self.scan_line_break():
                 if not self.flow_level:
                     self.allow_simple_key = True
@@ -1292,14 +1319,21 @@ class Scanner(object):
             length = 0
             if self.peek() == u'#':
                 break
-            while True:
+            if self.fast_path:
+                run = self.PLAIN_FLOW_RUN if self.flow_level  \
+                        else self.PLAIN_BLOCK_RUN
+                length = run.match(self.buffer, self.pointer).end()  \
+                        - self.pointer
                 ch = self.peek(length)
-                if ch in u'\0 \t\r\n\x85\u2028\u2029'   \
-                        or (not self.flow_level and ch == u':' and
-                                self.peek(length+1) in u'\0 \t\r\n\x85\u2028\u2029') \
-                        or (self.flow_level and ch in u',:?[]{}'):
-                    break
-                length += 1
+            else:
+                while True:
+                    ch = self.peek(length)
+                    if ch in u'\0 \t\r\n\x85\u2028\u2029'   \
+                            or (not self.flow_level and ch == u':' and
+                                    self.peek(length+1) in u'\0 \t\r\n\x85\u2028\u2029') \
+                            or (self.flow_level and ch in u',:?[]{}'):
+                        break
+                    length += 1
             # It's not clear what we should do with ':' in the flow context.
             if (self.flow_level and ch == u':'
                     and self.peek(length+1) not in u'\0 \t\r\n\x85\u2028\u2029,[]{}'):
@@ -1326,8 +1360,12 @@ class Scanner(object):
         # We just forbid them completely. Do not use tabs in YAML!
         chunks = []
         length = 0
-        while self.peek(length) in u' ':
-            length += 1
+        if self.fast_path:
+            length = self.SPACES.match(self.buffer, self.pointer).end()  \
+                    - self.pointer
+        else:
+            while self.peek(length) in u' ':
+                length += 1
         whitespaces = self.prefix(length)
         self.forward(length)
         ch = self.peek()
@@ -0,0 +1,200 @@
+# Builds an index of where the mapping entries of a document are in its
+# source text, straight from the parser events and without composing nodes.
+#
+#   SpanIndex
+# Maps key paths (tuples of the keys leading to an entry) to a Span with the
+# offsets of the entry's key and value. Entries are indexed the same way a
+# walk of the composed document would find them: only through nested
+# mappings, only the first of any repeated key, and aliases take the offsets
+# of the node they refer to.
+
+__all__ = ['Span', 'SpanIndex', 'SpanIndexer']
+
+from composer import ComposerError
+from events import *
+from nodes import *
+
+class Span(object):
+    # The offsets are character indexes into the source.
+    # indent is the indentation to use for new children of the entry.
+    __slots__ = ('key_start', 'value_start', 'value_end', 'indent',
+            'is_mapping')
+
+    def __init__(self, key_start, value_start, value_end, indent, is_mapping):
+        self.key_start = key_start
+        self.value_start = value_start
+        self.value_end = value_end
+        self.indent = indent
+        self.is_mapping = is_mapping
+
+    def __repr__(self):
+        return '%s(key_start=%r, value_start=%r, value_end=%r, indent=%r)' \
+                % (self.__class__.__name__, self.key_start, self.value_start,
+                        self.value_end, self.indent)
+
+class SpanIndex(object):
+
+    def __init__(self, spans, root_kind):
+        # root_kind is the node class the document root would compose into,
+        # or None if the stream has no document.
+        self.spans = spans
+        self.root_kind = root_kind
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __contains__(self, path):
+        return path in self.spans
+
+    def __getitem__(self, path):
+        return self.spans[path]
+
+    def get(self, path, default=None):
+        return self.spans.get(path, default)
+
+    def find_closest(self, path):
+        # Return (depth, span) for the longest prefix of path in the index,
+        # where span is None if not even path[0] is there.
+        depth = len(path)
+        while depth > 0:
+            span = self.spans.get(path[:depth])
+            if span is not None:
+                return depth, span
+            depth -= 1
+        return 0, None
+
+class _Anchor(object):
+    # What an alias needs from the node its anchor is on.
+    __slots__ = ('start', 'end', 'kind', 'value', 'spans', 'start_mark')
+
+    def __init__(self, start, kind, value, start_mark):
+        self.start = start
+        self.end = None
+        self.kind = kind
+        self.value = value
+        self.spans = None
+        self.start_mark = start_mark
+
+class SpanIndexer(object):
+
+    def __init__(self, loader):
+        # The loader only needs to provide the parser interface.
+        self.loader = loader
+        self.anchors = {}
+        self.unfinished_aliases = []
+
+    def index(self):
+        loader = self.loader
+
+        # Drop the STREAM-START event.
+        loader.get_event()
+
+        root_kind = None
+        spans = {}
+        if not loader.check_event(StreamEndEvent):
+            document_event = loader.get_event()
+            kind, start, end, value = self.index_node(spans, ())
+            root_kind = kind
+            loader.get_event()
+
+            # Ensure that the stream contains no more documents.
+            if not loader.check_event(StreamEndEvent):
+                event = loader.get_event()
+                raise ComposerError("expected a single document in the stream",
+                        document_event.start_mark, "but found another document",
+                        event.start_mark)
+
+        # Drop the STREAM-END event.
+        loader.get_event()
+
+        for span, anchor in self.unfinished_aliases:
+            span.value_end = anchor.end
+        return SpanIndex(spans, root_kind)
+
+    def index_node(self, spans, path):
+        # Consume the events for a node, adding the entries beneath it to
+        # spans if path is not None. Returns (kind, start, end, scalar value)
+        # where end is None for an alias of a node still being indexed.
+        loader = self.loader
+        if loader.check_event(AliasEvent):
+            event = loader.get_event()
+            anchor = self.anchors.get(event.anchor)
+            if anchor is None:
+                raise ComposerError(None, None, "found undefined alias %r"
+                        % event.anchor.encode('utf-8'), event.start_mark)
+            if path is not None and anchor.spans and anchor.end is not None:
+                self.merge(spans, path, anchor.spans)
+            return anchor.kind, anchor.start, anchor.end, anchor.value
+
+        event = loader.peek_event()
+        anchor = None
+        if event.anchor is not None:
+            if event.anchor in self.anchors:
+                raise ComposerError("found duplicate anchor %r; first occurrence"
+                        % event.anchor.encode('utf-8'),
+                        self.anchors[event.anchor].start_mark,
+                        "second occurrence", event.start_mark)
+            if isinstance(event, ScalarEvent):
+                kind = ScalarNode
+            elif isinstance(event, SequenceStartEvent):
+                kind = SequenceNode
+            else:
+                kind = MappingNode
+            anchor = _Anchor(event.start_mark.index, kind,
+                    getattr(event, 'value', None), event.start_mark)
+            self.anchors[event.anchor] = anchor
+
+        if loader.check_event(ScalarEvent):
+            event = loader.get_event()
+            kind, value = ScalarNode, event.value
+            start, end = event.start_mark.index, event.end_mark.index
+        elif loader.check_event(SequenceStartEvent):
+            start = loader.get_event().start_mark.index
+            kind, value = SequenceNode, None
+            while not loader.check_event(SequenceEndEvent):
+                self.index_node(None, None)
+            end = loader.get_event().end_mark.index
+        else:
+            start = loader.get_event().start_mark.index
+            kind, value = MappingNode, None
+            if anchor is not None:
+                # Index relative to the anchor so aliases can reuse them.
+                anchor.spans = {}
+                self.index_mapping(anchor.spans, ())
+                if path is not None:
+                    self.merge(spans, path, anchor.spans)
+            else:
+                self.index_mapping(spans, path)
+            end = loader.get_event().end_mark.index
+        if anchor is not None:
+            anchor.end = end
+        return kind, start, end, value
+
+    def index_mapping(self, spans, path):
+        buffer = self.loader.buffer
+        while not self.loader.check_event(MappingEndEvent):
+            key_kind, key_start, key_end, key = self.index_node(None, None)
+            child = None
+            if path is not None and key_kind is ScalarNode:
+                child = path+(key,)
+                if child in spans:
+                    child = None
+            value_start_event = self.loader.peek_event()
+            kind, value_start, value_end, value = \
+                    self.index_node(spans, child)
+            if child is None:
+                continue
+            line_start = key_start-1
+            while line_start >= 0 and buffer[line_start] == u' ':
+                line_start -= 1
+            span = Span(key_start, value_start, value_end,
+                    key_start-line_start+1, kind is MappingNode)
+            if value_end is None:
+                self.unfinished_aliases.append(
+                        (span, self.anchors[value_start_event.anchor]))
+            spans[child] = span
+
+    def merge(self, spans, path, relative_spans):
+        for relative_path, span in relative_spans.items():
+            spans.setdefault(path+relative_path, span)
+
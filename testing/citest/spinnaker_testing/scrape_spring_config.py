@@ -15,11 +15,12 @@
 """Derives a spinnaker subsystem spring configuration."""
 
 import logging
+import os
 import re
 import time
 import socket
 import urllib2
-from json import JSONDecoder
+from json import JSONDecoder, JSONEncoder
 
 from .expression_dict import ExpressionDict
 
@@ -119,3 +120,75 @@ def scrape_spring_config(url, timeout=60, empty_if_404=True):
     raise ValueError('Invalid HTTP={code} from {url}:\n{msg}'.format(
         code=http_code, url=url, msg=content))
   return JSONDecoder().decode(content)
+
+
+# Snapshots older than this are not used, even for the same deployment.
+CONFIG_SNAPSHOT_MAX_AGE_SECS = 2 * 60 * 60
+
+
+def save_config_snapshot(path, url, config, deployment_id, timestamp=None):
+  """Write a scraped configuration so other processes can reuse it.
+
+  The snapshot is a JSON document with the "url" it was scraped from,
+  the "deployment_id" of the deployment it was scraped from, the
+  "timestamp" it was taken at, and the "config" itself as returned by
+  scrape_spring_config.
+
+  Args:
+    path: [string] The path to write the snapshot to.
+    url: [string] The url the config was scraped from.
+    config: [dict] The scraped configuration.
+    deployment_id: [string] Identifies the deployment that was scraped.
+    timestamp: [float] When the config was scraped. Defaults to now.
+  """
+  snapshot = {
+      'url': url,
+      'deployment_id': deployment_id,
+      'timestamp': time.time() if timestamp is None else timestamp,
+      'config': config
+  }
+  temp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+  with open(temp_path, 'w') as stream:
+    stream.write(JSONEncoder().encode(snapshot))
+  os.rename(temp_path, path)
+
+
+def load_config_snapshot(path, deployment_id,
+                         max_age_secs=CONFIG_SNAPSHOT_MAX_AGE_SECS):
+  """Load a configuration written by save_config_snapshot.
+
+  This does not touch the network. The snapshot is only used if it was
+  scraped from the expected deployment within the last max_age_secs.
+  The url it was scraped from does not matter since the tunnel to the
+  same service may have been restarted on another port since.
+
+  Args:
+    path: [string] The path of the snapshot.
+    deployment_id: [string] The deployment the caller is testing.
+    max_age_secs: [float] The oldest snapshot to accept.
+
+  Returns:
+    The configuration dictionary or None if there is no usable snapshot.
+  """
+  if not deployment_id:
+    logging.info('Ignoring config snapshot %s without a deployment id.', path)
+    return None
+
+  try:
+    with open(path, 'r') as stream:
+      snapshot = JSONDecoder().decode(stream.read())
+  except (IOError, OSError, ValueError) as ex:
+    logging.warning('Could not load config snapshot %s: %s', path, ex)
+    return None
+
+  if snapshot.get('deployment_id') != deployment_id:
+    logging.info('Ignoring config snapshot %s because it is for'
+                 ' deployment %s.', path, snapshot.get('deployment_id'))
+    return None
+
+  age = time.time() - snapshot.get('timestamp', 0)
+  if age > max_age_secs:
+    logging.info('Ignoring config snapshot %s because it is %d secs old.',
+                 path, age)
+    return None
+  return snapshot.get('config')
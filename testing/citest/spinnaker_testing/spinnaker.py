@@ -72,7 +72,9 @@ from citest.base import JournalLogger
 import spinnaker_testing.yaml_accumulator as yaml_accumulator
 from spinnaker_testing.expression_dict import ExpressionDict
 
-from .scrape_spring_config import scrape_spring_config
+from .scrape_spring_config import (
+    load_config_snapshot,
+    scrape_spring_config)
 
 
 def name_value_to_dict(content):
@@ -285,7 +287,9 @@ class SpinnakerAgent(service_testing.HttpAgent):
                       port=bindings['NATIVE_PORT'] or port))
 
       return cls.new_native_instance(
-          name, status_factory=status_factory, base_url=base_url)
+          name, status_factory=status_factory, base_url=base_url,
+          config_snapshot_path=bindings.get('SPRING_CONFIG_SNAPSHOT'),
+          deployment_id=bindings.get('SPRING_CONFIG_SNAPSHOT_DEPLOYMENT_ID'))
 
     if host_platform == 'gce':
       return cls.new_gce_instance_from_bindings(
@@ -355,7 +359,8 @@ class SpinnakerAgent(service_testing.HttpAgent):
     return spinnaker_agent
 
   @classmethod
-  def new_native_instance(cls, name, status_factory, base_url):
+  def new_native_instance(cls, name, status_factory, base_url,
+                          config_snapshot_path=None, deployment_id=None):
     """Create a new Spinnaker HttpAgent talking to the specified server port.
 
     Args:
@@ -363,6 +368,9 @@ class SpinnakerAgent(service_testing.HttpAgent):
       status_factory: [SpinnakerStatus (SpinnakerAgent, HttpResponseType)]
          Factory method for creating specialized SpinnakerStatus instances.
       base_url: [string] The service base URL to send messages to.
+      config_snapshot_path: [string] If provided, a file written by
+         save_config_snapshot to use rather than scraping the service.
+      deployment_id: [string] The deployment the snapshot must be from.
 
     Returns:
       A SpinnakerAgent connected to the specified instance port.
@@ -375,7 +383,12 @@ class SpinnakerAgent(service_testing.HttpAgent):
 
     logger.info('%s is available at %s', name, base_url)
     env_url = os.path.join(base_url, 'resolvedEnv')
-    deployed_config = scrape_spring_config(env_url)
+    deployed_config = None
+    if config_snapshot_path:
+      deployed_config = load_config_snapshot(config_snapshot_path,
+                                             deployment_id)
+    if deployed_config is None:
+      deployed_config = scrape_spring_config(env_url)
     JournalLogger.journal_or_log_detail(
         '{0} configuration'.format(name), deployed_config)
 
@@ -159,6 +159,22 @@ class SpinnakerTestScenario(sk.AgentTestScenario):
              ' is "native". It is not needed if the system is using its'
              ' standard port.'.format(system=cls.ENDPOINT_SUBSYSTEM))
 
+    builder.add_argument(
+        '--spring_config_snapshot',
+        default=defaults.get('SPRING_CONFIG_SNAPSHOT', None),
+        help='A file with the {system} configuration already scraped by'
+             ' the process running the tests. If it was scraped from the'
+             ' deployment named by --spring_config_snapshot_deployment_id'
+             ' and is still recent then it is used instead of scraping the'
+             ' service again.'.format(system=cls.ENDPOINT_SUBSYSTEM))
+
+    builder.add_argument(
+        '--spring_config_snapshot_deployment_id',
+        default=defaults.get('SPRING_CONFIG_SNAPSHOT_DEPLOYMENT_ID', None),
+        help='Identifies the deployment being tested. The'
+             ' --spring_config_snapshot is only used if it was taken'
+             ' from this deployment.')
+
     builder.add_argument(
         '--test_stack', default=defaults.get('TEST_STACK', 'test'),
         help='Default Spinnaker stack decorator.')
@@ -17,6 +17,10 @@
 
 import yaml
 
+# The libyaml based loader is much faster, but is not always installed.
+# This package does not have access to spinnaker.yaml_util so picks its own.
+_LOADER = getattr(yaml, 'CLoader', yaml.Loader)
+
 
 def __flatten_into(root, prefix, target):
   """Helper function that flattens a dictionary into the target dictionary.
@@ -55,7 +59,7 @@ def load_string(source, target):
     source: [string] YAML document text.
     target: [dict] To update from YAML.
   """
-  target.update(flatten(yaml.load(source, Loader=yaml.Loader)))
+  target.update(flatten(yaml.load(source, Loader=_LOADER)))
 
 
 def load_path(path, target):
@@ -66,5 +70,5 @@ def load_path(path, target):
     target: [dict] To update from YAML.
   """
   with open(path, 'r') as f:
-    target.update(flatten(yaml.load(f, Loader=yaml.Loader)))
+    target.update(flatten(yaml.load(f, Loader=_LOADER)))
 
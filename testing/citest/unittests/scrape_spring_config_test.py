@@ -0,0 +1,68 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from spinnaker_testing.scrape_spring_config import (
+    load_config_snapshot,
+    save_config_snapshot)
+
+URL = 'http://localhost:8084/resolvedEnv'
+DEPLOYMENT_ID = 'a1b2c3'
+
+
+class ConfigSnapshotTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.temp_dir, 'gate.resolved_env.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def test_load_matching_snapshot(self):
+    config = {'systemProperties': {'spring.config.name': 'gate'}}
+    save_config_snapshot(self.path, URL, config, DEPLOYMENT_ID)
+    self.assertEqual(config, load_config_snapshot(self.path, DEPLOYMENT_ID))
+
+  def test_ignore_mismatched_snapshot(self):
+    save_config_snapshot(self.path, URL, {'a': 'A'}, DEPLOYMENT_ID)
+    self.assertIsNone(load_config_snapshot(self.path, 'other-deployment'))
+    self.assertIsNone(load_config_snapshot(self.path, None))
+    self.assertIsNone(load_config_snapshot(
+        os.path.join(self.temp_dir, 'missing.json'), DEPLOYMENT_ID))
+
+  def test_ignore_stale_snapshot(self):
+    save_config_snapshot(self.path, URL, {'a': 'A'}, DEPLOYMENT_ID,
+                         timestamp=time.time() - 120)
+    self.assertIsNone(
+        load_config_snapshot(self.path, DEPLOYMENT_ID, max_age_secs=60))
+    self.assertEqual(
+        {'a': 'A'},
+        load_config_snapshot(self.path, DEPLOYMENT_ID, max_age_secs=300))
+
+  def test_ignore_corrupt_snapshot(self):
+    with open(self.path, 'w') as stream:
+      stream.write('{"url": ')
+    self.assertIsNone(load_config_snapshot(self.path, DEPLOYMENT_ID))
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(ConfigSnapshotTest)
+  unittest.TextTestRunner(verbosity=2).run(suite)
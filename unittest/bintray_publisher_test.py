@@ -0,0 +1,178 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import BaseHTTPServer
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+import bintray_publisher
+from bintray_publisher import (
+    BintrayError,
+    BintrayPublisher,
+    BintrayUpload,
+    HttpConnectionPool)
+
+
+class FakeBintrayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Records each request and responds with the server's next scripted status.
+  """
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, format, *args):
+    pass
+
+  def __handle(self):
+    length = int(self.headers.getheader('Content-Length', 0))
+    body = self.rfile.read(length)
+    server = self.server
+    server.requests.append(
+        (self.command, self.path, self.headers.getheader('Authorization'),
+         body, self.client_address))
+    status = server.statuses.pop(0) if server.statuses else 201
+    self.send_response(status)
+    self.send_header('Content-Length', '0')
+    self.end_headers()
+
+  do_PUT = __handle
+  do_POST = __handle
+  do_DELETE = __handle
+
+
+class BintrayPublisherTest(unittest.TestCase):
+  def setUp(self):
+    self.server = BaseHTTPServer.HTTPServer(('localhost', 0),
+                                            FakeBintrayHandler)
+    self.server.requests = []
+    self.server.statuses = []
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+
+    self.temp_dir = tempfile.mkdtemp()
+    self.pool = HttpConnectionPool(
+        'localhost', self.server.server_address[1], use_ssl=False,
+        max_connections=1)
+    self.publisher = BintrayPublisher(
+        'owner/repo', 'user', 'key', pool=self.pool, max_retries=2,
+        initial_backoff_secs=0.01, wipe_package_on_409=True)
+
+  def tearDown(self):
+    self.pool.close()
+    self.server.shutdown()
+    self.server.server_close()
+    shutil.rmtree(self.temp_dir)
+
+  def make_upload(self, name, content):
+    path = os.path.join(self.temp_dir, name)
+    with open(path, 'wb') as f:
+      f.write(content)
+    return BintrayUpload(path, 'clouddriver', '1.2.3', name, '')
+
+  def test_streams_files_over_one_connection(self):
+    old_chunk_size = bintray_publisher.UPLOAD_CHUNK_SIZE
+    bintray_publisher.UPLOAD_CHUNK_SIZE = 7
+    try:
+      uploads = [self.make_upload('a.deb', 'A' * 100),
+                 self.make_upload('b.deb', 'B' * 50)]
+      self.publisher.publish_all(uploads, concurrency=2)
+    finally:
+      bintray_publisher.UPLOAD_CHUNK_SIZE = old_chunk_size
+
+    requests = sorted(self.server.requests)
+    self.assertEqual(2, len(requests))
+    self.assertEqual(
+        ('PUT', '/content/owner/repo/clouddriver/1.2.3/a.deb'
+                ';publish=1;override=1'),
+        requests[0][:2])
+    self.assertEqual('Basic dXNlcjprZXk=', requests[0][2])
+    self.assertEqual('A' * 100, requests[0][3])
+    self.assertEqual('B' * 50, requests[1][3])
+
+    # Both uploads reused the single keep-alive connection.
+    self.assertEqual(requests[0][4], requests[1][4])
+
+  def test_retries_transient_errors(self):
+    self.server.statuses = [503, 500]
+    self.publisher.publish(self.make_upload('a.deb', 'data'))
+    self.assertEqual(['PUT'] * 3,
+                     [request[0] for request in self.server.requests])
+
+  def test_creates_missing_package(self):
+    self.server.statuses = [400, 201]
+    self.publisher.publish(self.make_upload('a.deb', 'data'))
+    self.assertEqual(
+        [('PUT', 'data'), ('POST', None), ('PUT', 'data')],
+        [(request[0], request[3] if request[0] == 'PUT' else None)
+         for request in self.server.requests])
+    self.assertEqual('/packages/owner/repo', self.server.requests[1][1])
+    self.assertIn('"name": "clouddriver"', self.server.requests[1][3])
+
+  def test_wipes_conflicting_file(self):
+    self.server.statuses = [409, 200]
+    self.publisher.publish(self.make_upload('a.deb', 'data'))
+    self.assertEqual(
+        [('PUT', '/content/owner/repo/clouddriver/1.2.3/a.deb'
+                 ';publish=1;override=1'),
+         ('DELETE', '/content/owner/repo/a.deb'),
+         ('PUT', '/content/owner/repo/clouddriver/1.2.3/a.deb'
+                 ';publish=1;override=1')],
+        [request[:2] for request in self.server.requests])
+
+  def test_permanent_error(self):
+    self.server.statuses = [403]
+    with self.assertRaises(BintrayError) as context:
+      self.publisher.publish(self.make_upload('a.deb', 'data'))
+    self.assertEqual(403, context.exception.status)
+    self.assertEqual(1, len(self.server.requests))
+
+  def test_publishes_staged_versions_together(self):
+    uploads = [self.make_upload('a.deb', 'A'), self.make_upload('b.deb', 'B')]
+    self.publisher.publish_all(uploads, stage=True)
+    self.assertEqual(
+        ['/content/owner/repo/clouddriver/1.2.3/a.deb;publish=0;override=1',
+         '/content/owner/repo/clouddriver/1.2.3/b.deb;publish=0;override=1'],
+        sorted([request[1] for request in self.server.requests]))
+
+    del self.server.requests[:]
+    self.publisher.publish_staged()
+    self.assertEqual(
+        [('POST', '/content/owner/repo/clouddriver/1.2.3/publish', '{}')],
+        [(request[0], request[1], request[3])
+         for request in self.server.requests])
+
+    # Nothing is left staged.
+    del self.server.requests[:]
+    self.publisher.publish_staged()
+    self.assertEqual([], self.server.requests)
+
+  def test_discards_staged_versions(self):
+    self.publisher.publish(self.make_upload('a.deb', 'A'), stage=True)
+    del self.server.requests[:]
+    self.publisher.publish_staged(discard=True)
+    self.assertEqual(
+        [('POST', '/content/owner/repo/clouddriver/1.2.3/publish',
+          '{"discard": true}')],
+        [(request[0], request[1], request[3])
+         for request in self.server.requests])
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(BintrayPublisherTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -0,0 +1,104 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from build_cache import BuildCache
+
+
+class BuildCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.cache_dir = os.path.join(self.temp_dir, 'cache')
+    self.build_root = os.path.join(self.temp_dir, 'build')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def write_artifact(self, relpath, content):
+    path = os.path.join(self.build_root, relpath)
+    if not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(content)
+
+  def test_make_key(self):
+    key = BuildCache.make_key('orca', 'abc', platform='debian')
+    self.assertTrue(key.startswith('orca-'))
+    self.assertEqual(key, BuildCache.make_key('orca', 'abc',
+                                              platform='debian'))
+    self.assertNotEqual(key, BuildCache.make_key('orca', 'abd',
+                                                 platform='debian'))
+    self.assertNotEqual(key, BuildCache.make_key('orca', 'abc',
+                                                 platform='redhat'))
+
+  def test_store_and_restore(self):
+    cache = BuildCache(self.cache_dir, max_bytes=1024)
+    key = BuildCache.make_key('orca', 'abc')
+    self.assertIsNone(cache.lookup(key, self.build_root))
+
+    relpath = os.path.join('build', 'distributions', 'orca_1.0_all.deb')
+    self.write_artifact(relpath, 'DEB')
+    cache.store(key, self.build_root, [relpath], component='orca')
+
+    shutil.rmtree(self.build_root)
+    metadata = cache.lookup(key, self.build_root)
+    self.assertEqual('orca', metadata['component'])
+    self.assertEqual(3, metadata['bytes'])
+    with open(os.path.join(self.build_root, relpath), 'r') as f:
+      self.assertEqual('DEB', f.read())
+    self.assertEqual([key], cache.hits)
+    self.assertEqual([key], cache.misses)
+
+  def test_restore_replaces_stale_artifacts(self):
+    cache = BuildCache(self.cache_dir, max_bytes=1024)
+    key = BuildCache.make_key('orca', 'abc')
+    relpath = os.path.join('build', 'distributions', 'orca_1.0_all.deb')
+    self.write_artifact(relpath, 'NEW')
+    cache.store(key, self.build_root, [relpath])
+
+    # A leftover from another build that happens to be the same size.
+    self.write_artifact(relpath, 'OLD')
+    self.assertIsNotNone(cache.lookup(key, self.build_root))
+    with open(os.path.join(self.build_root, relpath), 'r') as f:
+      self.assertEqual('NEW', f.read())
+
+  def test_evicts_least_recently_used(self):
+    cache = BuildCache(self.cache_dir, max_bytes=25)
+    self.write_artifact('a', 'x' * 10)
+    keys = [BuildCache.make_key(name, 'abc') for name in ['one', 'two']]
+    for key in keys:
+      cache.store(key, self.build_root, ['a'])
+
+    # Touch the first entry so the second is the least recently used.
+    os.utime(os.path.join(self.cache_dir, keys[1], 'metadata.json'),
+             (time.time() - 100, time.time() - 100))
+    self.assertIsNotNone(cache.lookup(keys[0], self.build_root))
+
+    third = BuildCache.make_key('three', 'abc')
+    cache.store(third, self.build_root, ['a'])
+    self.assertEqual(sorted([keys[0], third]),
+                     sorted(os.listdir(self.cache_dir)))
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(BuildCacheTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -0,0 +1,140 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from build_scheduler import (
+    BuildHistory,
+    BuildScheduler,
+    QUOTA_ERROR_RE,
+    QuotaExceededError,
+    TokenBucket)
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 1000.0
+    self.sleeps = []
+
+  def time(self):
+    return self.now
+
+  def sleep(self, secs):
+    self.sleeps.append(secs)
+    self.now += secs
+
+
+class BuildSchedulerTest(unittest.TestCase):
+  def test_token_bucket_limits_rate(self):
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0.5, capacity=2,
+                         clock=clock.time, sleep=clock.sleep)
+    self.assertEqual(0, bucket.acquire())
+    self.assertEqual(0, bucket.acquire())
+    self.assertEqual(2.0, bucket.acquire())
+    self.assertEqual([2.0], clock.sleeps)
+
+  def test_token_bucket_adapts(self):
+    bucket = TokenBucket(rate=8, capacity=1, min_rate=1)
+    bucket.penalize()
+    bucket.penalize()
+    self.assertEqual(2, bucket.rate)
+    bucket.reward()
+    self.assertEqual(3.75, bucket.rate)
+    for _ in range(4):
+      bucket.reward()
+    self.assertEqual(8, bucket.rate)
+
+  def test_retries_quota_errors(self):
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1000, capacity=10)
+    scheduler = BuildScheduler(bucket, max_in_flight=2, max_retries=2,
+                               initial_backoff_secs=5, sleep=clock.sleep)
+    lock = threading.Lock()
+    attempts = {}
+
+    def build(name):
+      with lock:
+        attempts[name] = attempts.get(name, 0) + 1
+        count = attempts[name]
+      if name == 'rejected' or (name == 'flaky' and count < 3):
+        raise QuotaExceededError('Quota exceeded')
+      if name == 'broken':
+        raise ValueError('Build failed')
+
+    timings = scheduler.run(['ok', 'flaky', 'rejected', 'broken'], build)
+    self.assertEqual(['ok', 'flaky', 'rejected', 'broken'],
+                     [timing.name for timing in timings])
+    self.assertEqual([1, 3, 3, 1], [timing.attempts for timing in timings])
+    self.assertEqual([None, None],
+                     [timing.error for timing in timings[:2]])
+    self.assertTrue(isinstance(timings[2].error, QuotaExceededError))
+    self.assertTrue(isinstance(timings[3].error, ValueError))
+    self.assertTrue(timings[1].queue_secs >= 15)
+    self.assertEqual(sorted([5, 10, 5, 10]), sorted(clock.sleeps))
+
+  def test_quota_error_re(self):
+    for text in [
+        'ERROR: (gcloud.container.builds.submit) RESOURCE_EXHAUSTED: x',
+        'Quota exceeded for quota metric \'Build requests\' of service',
+        '"reason": "rateLimitExceeded"',
+        'ERROR: (gcloud.container.builds.submit) HTTPError 429: Too many',
+        '< HTTP/1.1 429 Too Many Requests']:
+      self.assertTrue(QUOTA_ERROR_RE.search(text), text)
+
+    for text in [
+        'RateLimitingInterceptorSpec > should throttle FAILED',
+        'QuotaSpec failed',
+        'Compilation error at Foo.java line 429',
+        'Setting the rate limit to 429 requests per second',
+        'tests completed, 429 failed']:
+      self.assertFalse(QUOTA_ERROR_RE.search(text), text)
+
+  def test_history_orders_longest_first(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(temp_dir, 'history', 'durations.json')
+      history = BuildHistory(path)
+      for secs in [100, 900, 120]:
+        history.record('clouddriver', 'package', secs)
+      history.record('clouddriver', 'copy', 10)
+      history.record('deck', 'package', 200)
+      history.record('deck', 'copy', 5)
+      history.record('orca', 'package', 60)
+      history.save()
+
+      history = BuildHistory(path)
+      self.assertEqual(120, history.expected_secs('clouddriver', 'package'))
+      self.assertEqual(
+          ['echo', 'deck', 'clouddriver', 'orca'],
+          history.order_longest_first(['orca', 'clouddriver', 'echo', 'deck'],
+                                      ['package', 'copy']))
+      self.assertEqual(
+          ['deck', 'clouddriver', 'orca'],
+          history.order_longest_first(['orca', 'clouddriver', 'deck'],
+                                      ['package']))
+    finally:
+      shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(BuildSchedulerTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
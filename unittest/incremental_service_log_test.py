@@ -0,0 +1,130 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from validate_bom__deploy import (
+    BaseValidateBomDeployer,
+    make_incremental_gzip_script)
+
+
+class LocalLogDeployer(BaseValidateBomDeployer):
+  """Collects the service logs from a local directory."""
+
+  def __init__(self, options, remote_dir):
+    super(LocalLogDeployer, self).__init__(options)
+    self.__remote_dir = remote_dir
+
+  def do_make_incremental_log_command(self, service, offset, head_checksum,
+                                      log_dir):
+    return make_incremental_gzip_script(
+        os.path.join(self.__remote_dir, service + '.log'),
+        offset, head_checksum)
+
+
+class IncrementalServiceLogTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.remote_dir = os.path.join(self.temp_dir, 'remote')
+    os.makedirs(self.remote_dir)
+    options = argparse.Namespace(
+        log_dir=os.path.join(self.temp_dir, 'logs'),
+        deploy_incremental_logs=True, deploy_log_concurrency=4)
+    self.log_dir = os.path.join(options.log_dir, 'service_logs')
+    self.deployer = LocalLogDeployer(options, self.remote_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def write_log(self, content, mode='w'):
+    with open(os.path.join(self.remote_dir, 'orca.log'), mode) as f:
+      f.write(content)
+
+  def collect(self):
+    """Collect the logs and return (collected orca log, orca manifest entry)."""
+    self.deployer.collect_logs()
+    with open(os.path.join(self.log_dir, 'manifest.json'), 'r') as f:
+      entry = json.JSONDecoder().decode(f.read())['orca']
+    with gzip.open(os.path.join(self.log_dir, 'orca.log.gz'), 'rb') as f:
+      return f.read(), entry
+
+  def test_first_then_appended_fetch(self):
+    self.write_log('line 1\n')
+    content, entry = self.collect()
+    self.assertEqual('line 1\n', content)
+    self.assertEqual(7, entry['offset'])
+    self.assertEqual(7, entry['new_bytes'])
+
+    self.write_log('line 2\n', mode='a')
+    content, entry = self.collect()
+    self.assertEqual('line 1\nline 2\n', content)
+    self.assertEqual(14, entry['offset'])
+    self.assertEqual(7, entry['new_bytes'])
+
+    content, entry = self.collect()
+    self.assertEqual('line 1\nline 2\n', content)
+    self.assertEqual(0, entry['new_bytes'])
+
+  def test_truncated_log(self):
+    self.write_log('a long first log\n')
+    self.collect()
+    self.write_log('new\n')
+    content, entry = self.collect()
+    self.assertEqual('new\n', content)
+    self.assertEqual(4, entry['offset'])
+
+  def test_rotated_log_larger_than_offset(self):
+    self.write_log('old\n')
+    self.collect()
+
+    # The log was replaced and the new one already grew past the offset.
+    self.write_log('a new log that is longer than the old one\n')
+    content, entry = self.collect()
+    self.assertEqual('a new log that is longer than the old one\n', content)
+    self.assertEqual(len(content), entry['new_bytes'])
+
+  def test_missing_local_log_starts_over(self):
+    self.write_log('line 1\n')
+    self.collect()
+
+    # The collected log went away but the manifest still has its offset.
+    os.remove(os.path.join(self.log_dir, 'orca.log.gz'))
+    self.write_log('line 2\n', mode='a')
+    content, entry = self.collect()
+    self.assertEqual('line 1\nline 2\n', content)
+    self.assertEqual(14, entry['offset'])
+    self.assertEqual(14, entry['new_bytes'])
+    self.assertNotIn('error', entry)
+
+  def test_missing_log(self):
+    self.deployer.collect_logs()
+    with open(os.path.join(self.log_dir, 'manifest.json'), 'r') as f:
+      entry = json.JSONDecoder().decode(f.read())['orca']
+    self.assertTrue('No such file' in entry['error'])
+
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.CRITICAL)
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(IncrementalServiceLogTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -0,0 +1,114 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from spinnaker.process_registry import ProcessRegistry
+
+
+class ProcessRegistryTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.proc_dir = os.path.join(self.temp_dir, 'proc')
+    self.run_dir = os.path.join(self.temp_dir, 'run')
+    os.mkdir(self.proc_dir)
+    self.registry = ProcessRegistry(self.run_dir, '/opt',
+                                    proc_dir=self.proc_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def add_process(self, pid, args):
+    os.mkdir(os.path.join(self.proc_dir, str(pid)))
+    with open(os.path.join(self.proc_dir, str(pid), 'cmdline'), 'w') as f:
+      f.write('\0'.join(args) + '\0')
+
+  def remove_process(self, pid):
+    shutil.rmtree(os.path.join(self.proc_dir, str(pid)))
+
+  def add_subsystem(self, pid, subsystem):
+    self.add_process(
+        pid, ['/usr/bin/java', '-Xmx1g',
+              '-classpath', '/opt/{0}/lib/{0}.jar'.format(subsystem),
+              'com.netflix.spinnaker.{0}.Main'.format(subsystem)])
+
+  def test_scan_writes_pidfiles(self):
+    self.add_subsystem(10, 'clouddriver')
+    self.add_subsystem(20, 'gate')
+    self.add_process(30, ['/bin/bash', '-c', '/opt/gate/bin/gate'])
+    self.add_process(40, ['/usr/bin/java', 'org.gradle.launcher.GradleMain'])
+
+    self.assertEqual({'clouddriver': 10, 'gate': 20}, self.registry.get_jobs())
+    self.assertEqual(['clouddriver.pid', 'gate.pid'],
+                     sorted(os.listdir(self.run_dir)))
+
+  def test_pidfiles_are_trusted(self):
+    self.add_subsystem(10, 'clouddriver')
+    self.registry.get_jobs()
+
+    # A process the registry does not know about is not found by a lookup
+    # so long as all the pidfiles are still current.
+    self.add_subsystem(20, 'gate')
+    self.assertEqual({'clouddriver': 10}, self.registry.get_jobs())
+    self.assertEqual({'clouddriver': 10, 'gate': 20}, self.registry.refresh())
+
+  def test_expected_subsystem_without_pidfile(self):
+    self.add_subsystem(10, 'clouddriver')
+    self.registry.get_jobs()
+
+    # gate was started by hand, so only a scan of /proc will find it.
+    self.add_subsystem(20, 'gate')
+    self.assertEqual({'clouddriver': 10, 'gate': 20},
+                     self.registry.get_jobs(['clouddriver', 'gate']))
+    self.assertEqual(['clouddriver.pid', 'gate.pid'],
+                     sorted(os.listdir(self.run_dir)))
+
+  def test_empty_registry_is_rescanned(self):
+    self.add_subsystem(10, 'clouddriver')
+    self.registry.get_jobs()
+    self.registry.forget('clouddriver')
+    self.assertEqual({'clouddriver': 10}, self.registry.get_jobs())
+
+  def test_stale_pidfile(self):
+    self.add_subsystem(10, 'clouddriver')
+    self.add_subsystem(20, 'gate')
+    self.registry.get_jobs()
+
+    self.remove_process(10)
+    self.add_process(10, ['/bin/sleep', '100'])
+    self.assertEqual({'gate': 20}, self.registry.get_jobs())
+    self.assertEqual(['gate.pid'], os.listdir(self.run_dir))
+
+  def test_launched_subsystem(self):
+    self.registry.get_jobs()
+    self.add_process(30, ['/bin/bash', '-c', '/opt/orca/bin/orca'])
+    self.registry.record_launch('orca', 30)
+    self.assertEqual({}, self.registry.get_jobs())
+    self.assertEqual(['orca.pid'], os.listdir(self.run_dir))
+
+    self.add_subsystem(31, 'orca')
+    self.assertEqual({'orca': 31}, self.registry.get_jobs())
+    with open(os.path.join(self.run_dir, 'orca.pid'), 'r') as f:
+      self.assertEqual('31', f.read().strip())
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(ProcessRegistryTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
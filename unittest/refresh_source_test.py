@@ -0,0 +1,125 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import re
+import sys
+import threading
+import time
+import unittest
+
+from StringIO import StringIO
+
+from refresh_source import Refresher, ThreadOutputRouter
+
+
+class RefreshSourceTest(unittest.TestCase):
+  def setUp(self):
+    self.original_stdout = sys.stdout
+    self.original_stderr = sys.stderr
+    self.output = StringIO()
+    sys.stdout = self.output
+
+  def tearDown(self):
+    sys.stdout = self.original_stdout
+    sys.stderr = self.original_stderr
+
+  def make_refresher(self, concurrency):
+    return Refresher(argparse.Namespace(extra_repos=None,
+                                        refresh_concurrency=concurrency))
+
+  def test_router_captures_per_thread(self):
+    stream = StringIO()
+    router = ThreadOutputRouter(stream)
+    buffers = [StringIO(), StringIO()]
+
+    def write(index):
+      router.capture(buffers[index])
+      for line in range(3):
+        router.write('{0}.{1}\n'.format(index, line))
+        time.sleep(0.01)
+      router.release()
+
+    threads = [threading.Thread(target=write, args=[index])
+               for index in range(2)]
+    for thread in threads:
+      thread.start()
+    router.write('main\n')
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual('main\n', stream.getvalue())
+    self.assertEqual('0.0\n0.1\n0.2\n', buffers[0].getvalue())
+    self.assertEqual('1.0\n1.1\n1.2\n', buffers[1].getvalue())
+
+  def test_concurrent_refresh_attempts_all(self):
+    attempted = []
+    def refresh(repository):
+      attempted.append(repository.name)
+      print 'start {0}'.format(repository.name)
+      time.sleep(0.01)
+      sys.stderr.write('end {0}\n'.format(repository.name))
+      if repository.name in ['orca', 'gate']:
+        raise SystemExit('{0} failed'.format(repository.name))
+
+    refresher = self.make_refresher(4)
+    with self.assertRaises(SystemExit) as context:
+      refresher.refresh_all_repositories(refresh)
+    self.assertEqual('orca failed', context.exception.message)
+    self.assertEqual(sys.stdout, self.output)
+
+    # Each repository's output is written out together.
+    output = self.output.getvalue()
+    names = re.findall(r'(?m)^----- (\S+) ', output)
+    self.assertEqual(sorted(attempted), sorted(names))
+    for name in names:
+      self.assertTrue(
+          re.search(r'----- {0} \(.*\) -----\nstart {0}\nend {0}\n'
+                    .format(name), output), name)
+    self.assertTrue(re.search(r'orca +FAILED', output))
+    self.assertTrue(re.search(r'deck +OK', output))
+
+  def test_sequential_refresh_stops_at_error(self):
+    attempted = []
+    def refresh(repository):
+      attempted.append(repository.name)
+      if repository.name == 'orca':
+        raise SystemExit('orca failed')
+
+    with self.assertRaises(SystemExit):
+      self.make_refresher(1).refresh_all_repositories(refresh)
+    self.assertEqual(['spinnaker', 'clouddriver', 'orca'], attempted)
+    output = self.output.getvalue()
+    self.assertTrue('Repository refresh summary:' in output)
+    self.assertTrue(re.search(r'clouddriver +OK', output))
+
+  def test_keyboard_interrupt_is_not_deferred(self):
+    attempted = []
+    def refresh(repository):
+      attempted.append(repository.name)
+      if repository.name == 'spinnaker':
+        raise KeyboardInterrupt()
+      time.sleep(0.05)
+
+    with self.assertRaises(KeyboardInterrupt):
+      self.make_refresher(2).refresh_all_repositories(refresh)
+    self.assertEqual(sys.stdout, self.output)
+    self.assertLess(len(attempted), 6)
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(RefreshSourceTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
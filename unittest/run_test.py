@@ -0,0 +1,84 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import unittest
+
+import spinnaker.run
+from spinnaker.run import run_and_monitor
+
+
+class RunTest(unittest.TestCase):
+  def test_run_and_monitor(self):
+    result = run_and_monitor('echo hello; echo world >&2; exit 3',
+                             echo=False)
+    self.assertEqual(3, result.returncode)
+    self.assertEqual('hello\n', result.stdout)
+    self.assertEqual('world\n', result.stderr)
+
+  def test_run_and_monitor_input(self):
+    result = run_and_monitor('cat', echo=False, input='some\ninput')
+    self.assertEqual(0, result.returncode)
+    self.assertEqual('some\ninput', result.stdout)
+
+  def test_observed_lines(self):
+    observed = []
+    def observe(fragments):
+      observed.append(''.join(fragments))
+
+    result = run_and_monitor(
+        'printf "a\\nb"; sleep 0.2; printf "c\\nd\\n"; printf tail',
+        echo=False, observe_stdout=observe)
+    self.assertEqual('a\nbc\nd\ntail', result.stdout)
+    self.assertEqual(result.stdout, ''.join(observed))
+    for text in observed[:-1]:
+      self.assertTrue(text.endswith('\n'))
+
+  def test_observed_without_capture(self):
+    observed = []
+    result = run_and_monitor(
+        'echo out; echo err >&2', echo=False, capture=False,
+        observe_stdout=observed.append, observe_stderr=observed.append)
+    self.assertEqual(0, result.returncode)
+    self.assertIsNone(result.stdout)
+    self.assertIsNone(result.stderr)
+    self.assertEqual(['err\n', 'out\n'], sorted(''.join(fragments)
+                                                 for fragments in observed))
+
+  def test_spilled_output(self):
+    original_max = spinnaker.run.MAX_BUFFERED_OUTPUT_BYTES
+    spinnaker.run.MAX_BUFFERED_OUTPUT_BYTES = 1024
+    try:
+      result = run_and_monitor('seq 1 100000', echo=False)
+    finally:
+      spinnaker.run.MAX_BUFFERED_OUTPUT_BYTES = original_max
+
+    self.assertEqual(0, result.returncode)
+    self.assertEqual(''.join(['%d\n' % i for i in range(1, 100001)]),
+                     result.stdout)
+
+  def test_exit_with_background_child(self):
+    # The background child holds our stdout open after the shell exits.
+    start_time = time.time()
+    result = run_and_monitor('(sleep 5 &); echo done', echo=False)
+    self.assertEqual('done\n', result.stdout)
+    self.assertLess(time.time() - start_time, 4)
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(RunTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
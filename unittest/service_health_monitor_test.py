@@ -0,0 +1,217 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import sys
+import threading
+import time
+import unittest
+
+from validate_bom__test import ForwardedPort
+from validate_bom__test import ServiceHealthMonitor
+
+
+class FakeChild(object):
+  def __init__(self, ignore_terminate=False):
+    self.returncode = None
+    self.pid = 1234
+    self.ignore_terminate = ignore_terminate
+    self.signals = []
+
+  def poll(self):
+    return self.returncode
+
+  def terminate(self):
+    self.signals.append('TERM')
+    if not self.ignore_terminate:
+      self.returncode = -15
+
+  def kill(self):
+    self.signals.append('KILL')
+    self.returncode = -9
+
+
+class ServiceHealthMonitorTest(unittest.TestCase):
+  def setUp(self):
+    self.ports = itertools.count(1000)
+    self.forwarded = []
+    self.service_ports = {}
+    self.unhealthy = set()
+    self.blocked_ports = {}
+    self.monitor = None
+
+  def tearDown(self):
+    for event in self.blocked_ports.values():
+      event.set()
+    if self.monitor:
+      self.monitor.close()
+
+  def forward(self, service_name):
+    self.forwarded.append(service_name)
+    forwarding = ForwardedPort(FakeChild(), next(self.ports))
+    self.service_ports[forwarding.port] = service_name
+    return forwarding
+
+  def probe(self, port, timeout):
+    if port in self.blocked_ports:
+      self.blocked_ports[port].wait(10)
+    if self.service_ports[port] in self.unhealthy:
+      raise IOError('Connection refused')
+
+  def make_monitor(self, **kwargs):
+    kwargs.setdefault('min_interval', 0.01)
+    kwargs.setdefault('max_interval', 0.05)
+    self.monitor = ServiceHealthMonitor(
+        kwargs.pop('forward', self.forward), probe_func=self.probe, **kwargs)
+    return self.monitor
+
+  def test_waits_until_ready(self):
+    monitor = self.make_monitor()
+    forwarding = monitor.wait_until_ready('gate', 5)
+    self.assertEqual('gate', self.service_ports[forwarding.port])
+    self.assertEqual(forwarding, monitor.wait_until_ready('gate', 5))
+    self.assertEqual(['gate'], self.forwarded)
+
+  def test_times_out_by_clock(self):
+    self.unhealthy.add('gate')
+    clock = itertools.count(0, 10)
+    monitor = self.make_monitor(clock=lambda: next(clock))
+    with self.assertRaises(RuntimeError) as context:
+      monitor.wait_until_ready('gate', 30)
+    self.assertIn('Timed out', str(context.exception))
+
+  def test_slow_probe_does_not_delay_others(self):
+    monitor = self.make_monitor()
+    self.blocked_ports[1000] = threading.Event()
+    with self.assertRaises(RuntimeError):
+      monitor.wait_until_ready('slow', 0.2)
+
+    # The probe of "slow" is still outstanding.
+    forwarding = monitor.wait_until_ready('fast', 5)
+    self.assertEqual('fast', self.service_ports[forwarding.port])
+
+    self.blocked_ports[1000].set()
+    monitor.wait_until_ready('slow', 5)
+
+  def test_restarts_tunnel_without_blocking_monitor(self):
+    restarting = threading.Event()
+    finish_restart = threading.Event()
+
+    def forward(service_name):
+      if service_name in self.forwarded:
+        restarting.set()
+        finish_restart.wait(10)
+      return self.forward(service_name)
+
+    monitor = self.make_monitor(forward=forward)
+    first = monitor.wait_until_ready('gate', 5)
+    monitor.wait_until_ready('orca', 5)
+    first.child.kill()
+    self.assertTrue(restarting.wait(5))
+
+    # Other callers are not held up by the tunnel being restarted.
+    lookup = threading.Thread(
+        target=lambda: monitor.get_forwarded_port('gate'))
+    lookup.start()
+    lookup.join(2)
+    self.assertFalse(lookup.is_alive())
+    self.assertEqual(first, monitor.get_forwarded_port('gate'))
+
+    finish_restart.set()
+    second = monitor.wait_until_ready('gate', 5)
+    self.assertNotEqual(first.port, second.port)
+    self.assertEqual(['gate', 'orca', 'gate'], self.forwarded)
+
+  def test_gives_up_after_max_restarts(self):
+    def forward(service_name):
+      forwarding = self.forward(service_name)
+      forwarding.child.kill()
+      return forwarding
+
+    monitor = self.make_monitor(forward=forward, max_restarts=2)
+    with self.assertRaises(RuntimeError) as context:
+      monitor.wait_until_ready('gate', 5)
+    self.assertIn('failed', str(context.exception))
+    self.assertEqual(['gate'] * 3, self.forwarded)
+
+  def test_forward_failure_can_be_retried(self):
+    failures = [ValueError('no tunnel')]
+
+    def forward(service_name):
+      if failures:
+        raise failures.pop()
+      return self.forward(service_name)
+
+    monitor = self.make_monitor(forward=forward)
+    with self.assertRaises(ValueError):
+      monitor.wait_until_ready('gate', 5)
+    monitor.wait_until_ready('gate', 5)
+    self.assertEqual(['gate'], self.forwarded)
+
+  def test_close_terminates_before_killing(self):
+    stubborn = []
+
+    def forward(service_name):
+      forwarding = self.forward(service_name)
+      if service_name == 'orca':
+        forwarding = ForwardedPort(FakeChild(ignore_terminate=True),
+                                   forwarding.port)
+        self.service_ports[forwarding.port] = service_name
+        stubborn.append(forwarding.child)
+      return forwarding
+
+    monitor = self.make_monitor(forward=forward)
+    monitor.CLOSE_GRACE_SECS = 0.2
+    gate = monitor.wait_until_ready('gate', 5)
+    monitor.wait_until_ready('orca', 5)
+    monitor.close()
+    self.assertEqual(['TERM'], gate.child.signals)
+    self.assertEqual(['TERM', 'KILL'], stubborn[0].signals)
+
+  def test_tunnel_restarted_after_close_is_terminated(self):
+    restarting = threading.Event()
+    finish_restart = threading.Event()
+    restarted = []
+
+    def forward(service_name):
+      if service_name in self.forwarded:
+        restarting.set()
+        finish_restart.wait(10)
+        forwarding = self.forward(service_name)
+        restarted.append(forwarding)
+        return forwarding
+      return self.forward(service_name)
+
+    monitor = self.make_monitor(forward=forward)
+    monitor.CLOSE_GRACE_SECS = 0.2
+    first = monitor.wait_until_ready('gate', 5)
+    first.child.kill()
+    self.assertTrue(restarting.wait(5))
+
+    # close() gives up waiting on the restart, which then cleans up itself.
+    monitor.close()
+    finish_restart.set()
+    for _ in range(50):
+      if restarted and restarted[0].child.signals:
+        break
+      time.sleep(0.1)
+    self.assertEqual(['TERM'], restarted[0].child.signals)
+    self.assertEqual(first, monitor.get_forwarded_port('gate'))
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(ServiceHealthMonitorTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -15,7 +15,10 @@
 # limitations under the License.
 
 import argparse
+import shutil
+import subprocess
 import sys
+import tempfile
 import unittest
 
 from annotate_source import Annotator, CommitTag, VersionBump
@@ -154,6 +157,61 @@ class SourceAnnotatorTest(unittest.TestCase):
     result = annotator.bump_semver(self.PREV_VERSION, commit_hashes, commit_msgs)
     self.assertEqual(expect, result)
 
+  def test_iter_commits_since(self):
+    path = tempfile.mkdtemp()
+    try:
+      def git(*args):
+        return subprocess.check_output(
+            ['git', '-C', path, '-c', 'user.name=test',
+             '-c', 'user.email=test@test'] + list(args)).strip()
+
+      git('init', '-q')
+      git('commit', '-q', '--allow-empty', '-m', 'fix(stuff): Initial.')
+      base = git('rev-parse', 'HEAD')
+      git('commit', '-q', '--allow-empty', '-m',
+          'feat(stuff): New thing.\n\nBREAKING CHANGE: Removed old thing.')
+      breaking = git('rev-parse', 'HEAD')
+      git('commit', '-q', '--allow-empty', '-m', 'fix(stuff): Fixed.')
+      head = git('rev-parse', 'HEAD')
+
+      annotator = Annotator(OPTIONS, path=path)
+      commits = list(annotator.iter_commits_since(base))
+      self.assertEqual([head, breaking], [commit.hash for commit in commits])
+      self.assertEqual('fix(stuff): Fixed.\n', commits[0].msg)
+
+      prev_version = CommitTag(base + ' refs/tag/version-1.2.3')
+      self.assertEqual(
+          VersionBump('version-2.0.0', head, major=True),
+          annotator.bump_semver_from_commits(
+              prev_version, annotator.iter_commits_since(base)))
+    finally:
+      shutil.rmtree(path)
+
+  def test_bulk_tag_updates(self):
+    path = tempfile.mkdtemp()
+    try:
+      def git(*args):
+        return subprocess.check_output(
+            ['git', '-C', path, '-c', 'user.name=test',
+             '-c', 'user.email=test@test'] + list(args)).strip()
+
+      git('init', '-q')
+      git('commit', '-q', '--allow-empty', '-m', 'fix(stuff): Initial.')
+      head = git('rev-parse', 'HEAD')
+
+      annotator = Annotator(OPTIONS, path=path)
+      self.assertEqual(
+          4, annotator.update_tag_refs(
+              create_tags=['version-1.0.0', 'v1', 'v2', 'other'],
+              commit_hash=head))
+      annotator.parse_git_tree()
+      self.assertEqual('version-1.0.0', annotator.current_version.tag)
+
+      annotator.delete_unwanted_tags()
+      self.assertEqual('version-1.0.0', git('tag', '-l'))
+    finally:
+      shutil.rmtree(path)
+
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
   Annotator.init_argument_parser(parser)
@@ -0,0 +1,164 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from spinnaker.spinnaker_runner import Runner
+
+
+class TestRunner(Runner):
+  """A Runner that does not need an installation to be configured."""
+
+  process_registry = None
+
+  def __init__(self, endpoints, log_dir=None):
+    self.__endpoints = endpoints
+    self.__log_dir = log_dir
+    self.tail_processes = {}
+
+  def get_service_endpoint(self, subsystem):
+    return self.__endpoints[subsystem]
+
+  def get_service_log_path(self, subsystem):
+    return os.path.join(self.__log_dir, subsystem + '.log')
+
+  def start_tail(self, path):
+    process = subprocess.Popen(['sleep', '30'])
+    self.tail_processes[os.path.basename(path)] = process
+    return process
+
+
+class SpinnakerRunnerTest(unittest.TestCase):
+  def test_startup_levels(self):
+    self.assertEqual(
+        [Runner.INDEPENDENT_SUBSYSTEM_LIST, ['igor', 'fiat'], ['gate']],
+        Runner.get_startup_levels(
+            Runner.INDEPENDENT_SUBSYSTEM_LIST + ['igor', 'fiat', 'gate']))
+
+  def test_startup_levels_ignore_missing_dependencies(self):
+    self.assertEqual(
+        [['clouddriver', 'orca'], ['gate']],
+        Runner.get_startup_levels(['gate', 'clouddriver', 'orca']))
+
+  def test_wait_for_services(self):
+    listening = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening.bind(('localhost', 0))
+    listening.listen(5)
+    ready_port = listening.getsockname()[1]
+
+    late = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    late.bind(('localhost', 0))
+    late_port = late.getsockname()[1]
+    timer = threading.Timer(0.5, late.listen, [5])
+    timer.start()
+
+    runner = TestRunner({'ready': ('localhost', ready_port),
+                         'late': ('localhost', late_port)})
+    try:
+      got = runner.wait_for_services([('ready', os.getpid()),
+                                      ('late', Runner.EXTERNAL_PID)])
+    finally:
+      timer.join()
+      listening.close()
+      late.close()
+
+    self.assertEqual(['late', 'ready'], sorted(got.keys()))
+    self.assertLess(got['ready'], got['late'])
+    self.assertGreaterEqual(got['late'], 0.5)
+
+  def test_wait_for_services_tails_slow_logs(self):
+    log_dir = tempfile.mkdtemp()
+    with open(os.path.join(log_dir, 'late.log'), 'w') as f:
+      f.write('starting\n')
+    listening = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening.bind(('localhost', 0))
+    listening.listen(5)
+    late = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    late.bind(('localhost', 0))
+    timer = threading.Timer(0.5, late.listen, [5])
+    timer.start()
+
+    runner = TestRunner({'ready': listening.getsockname(),
+                         'late': late.getsockname()}, log_dir=log_dir)
+    runner.READINESS_STATUS_SECS = 0.2
+    try:
+      runner.wait_for_services([('ready', os.getpid()),
+                                ('late', os.getpid())])
+    finally:
+      timer.join()
+      listening.close()
+      late.close()
+      shutil.rmtree(log_dir)
+
+    # Only the slow subsystem had its log shown, and only while waiting.
+    self.assertEqual(['late.log'], runner.tail_processes.keys())
+    self.assertIsNotNone(runner.tail_processes['late.log'].returncode)
+
+  def test_wait_for_stopped(self):
+    # The children need to be reaped for them to disappear, so do that in
+    # the background as they terminate.
+    polite = subprocess.Popen(['sleep', '30'])
+    stubborn = subprocess.Popen(
+        [sys.executable, '-c',
+         'import signal, time\n'
+         'signal.signal(signal.SIGTERM, signal.SIG_IGN)\n'
+         'time.sleep(30)'])
+    reapers = [threading.Thread(target=process.wait)
+               for process in [polite, stubborn]]
+    for reaper in reapers:
+      reaper.start()
+
+    time.sleep(0.2)  # Give the stubborn process time to ignore SIGTERM
+    polite.send_signal(signal.SIGTERM)
+    stubborn.send_signal(signal.SIGTERM)
+    runner = TestRunner({})
+    got = runner.wait_for_stopped([('polite', polite.pid),
+                                   ('stubborn', stubborn.pid)], 1)
+    for reaper in reapers:
+      reaper.join()
+
+    self.assertEqual(['polite', 'stubborn'], sorted(got.keys()))
+    self.assertLess(got['polite'], 1)
+    self.assertGreaterEqual(got['stubborn'], 1)
+    self.assertEqual(-signal.SIGKILL, stubborn.returncode)
+
+  def test_wait_for_stopped_gives_up_after_kill(self):
+    # This child is never reaped, so it lingers as a zombie once killed.
+    zombie = subprocess.Popen(['sleep', '30'])
+    runner = TestRunner({})
+    runner.KILL_WAIT_SECS = 0.5
+    start_time = time.time()
+    try:
+      got = runner.wait_for_stopped([('zombie', zombie.pid)], 0)
+    finally:
+      zombie.kill()
+      zombie.wait()
+    self.assertEqual({}, got)
+    self.assertLess(time.time() - start_time, 5)
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(SpinnakerRunnerTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
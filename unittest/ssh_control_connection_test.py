@@ -0,0 +1,201 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from spinnaker.run import run_quick
+import validate_bom__deploy
+from validate_bom__deploy import SshControlConnection
+
+
+# A stand-in for ssh that runs remote commands locally.
+# The master is "running" while its control socket path exists.
+# It refuses the first REFUSE_COUNT attempts to start a master as if the
+# instance were still booting. Every invocation is logged as
+# "<mode> <master-was-running>", except for port forwarding requests to the
+# master, which are logged as "<forward|cancel> <forwarding>".
+FAKE_SSH = """#!/bin/bash
+control_path=$(echo "$@" | sed 's/.*ControlPath=\\([^ ]*\\).*/\\1/')
+log={root}/ssh.log
+if [[ " $* " == *" -O check "* ]]; then
+  [[ -e $control_path ]]; exit $?
+elif [[ " $* " == *" -O exit "* ]]; then
+  rm -f $control_path; exit 0
+elif [[ " $* " == *" -O forward "* || " $* " == *" -O cancel "* ]]; then
+  [[ -e $control_path ]] || exit 255
+  operation=$(echo "$@" | sed 's/.*-O \\([^ ]*\\).*/\\1/')
+  spec=$(echo "$@" | sed 's/.*-L \\([^ ]*\\).*/\\1/')
+  echo "$operation $spec" >> $log; exit 0
+elif [[ " $* " == *" ControlMaster=yes "* ]]; then
+  echo attempt >> {root}/attempts
+  if [[ $(wc -l < {root}/attempts) -le {refuse_count} ]]; then
+    echo "Connection refused"; exit 255
+  fi
+  touch $control_path; echo "master false" >> $log; exit 0
+fi
+echo "command $([[ -e $control_path ]] && echo true || echo false)" >> $log
+cd {root}/remote && bash -c "${{@: -1}}"
+"""
+
+# A stand-in for scp copying into the fake remote home directory.
+FAKE_SCP = """#!/bin/bash
+control_path=$(echo "$@" | sed 's/.*ControlPath=\\([^ ]*\\).*/\\1/')
+echo "scp $([[ -e $control_path ]] && echo true || echo false)" >> {root}/ssh.log
+files=()
+for arg in "$@"; do
+  case "$arg" in
+    -i|-o|-P) skip=1 ;;
+    *) if [[ -n $skip ]]; then skip=; else files+=("$arg"); fi ;;
+  esac
+done
+unset 'files[${{#files[@]}}-1]'
+cp "${{files[@]}}" {root}/remote/
+"""
+
+
+class SshControlConnectionTest(unittest.TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(self.root, 'remote'))
+    self.ssh = self.write_script('ssh', FAKE_SSH)
+    self.scp = self.write_script('scp', FAKE_SCP)
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def write_script(self, name, template):
+    path = os.path.join(self.root, name)
+    with open(path, 'w') as f:
+      f.write(template.format(root=self.root, refuse_count=2))
+    os.chmod(path, stat.S_IRWXU)
+    return path
+
+  def read_log(self):
+    with open(os.path.join(self.root, 'ssh.log'), 'r') as f:
+      return f.read().split('\n')[:-1]
+
+  def make_connection(self):
+    return SshControlConnection(
+        'hal', 'instance', '/dev/null', ssh_binary=self.ssh,
+        scp_binary=self.scp, control_dir=self.root)
+
+  def test_commands_reuse_master(self):
+    connection = self.make_connection()
+    self.assertFalse(connection.is_connected())
+    connection.connect(timeout=10, initial_backoff=0.01)
+    self.assertTrue(connection.is_connected())
+
+    local_path = os.path.join(self.root, 'script.sh')
+    with open(local_path, 'w') as f:
+      f.write('echo "hello $1"\n')
+    self.assertEqual(0, run_quick(connection.make_scp_command([local_path]),
+                                  echo=False).returncode)
+    result = run_quick(
+        connection.make_ssh_command('bash ./script.sh "a world"'),
+        echo=False)
+    self.assertEqual('hello a world', result.stdout.strip())
+
+    connection.close()
+    self.assertFalse(connection.is_connected())
+    self.assertEqual(['master false', 'scp true', 'command true'],
+                     self.read_log())
+    with open(os.path.join(self.root, 'attempts'), 'r') as f:
+      self.assertEqual(3, len(f.read().split()))
+
+  def test_connect_timeout(self):
+    connection = self.make_connection()
+    with self.assertRaises(RuntimeError):
+      connection.connect(timeout=0, initial_backoff=0.01)
+    self.assertFalse(connection.is_connected())
+
+  def wait_for_log(self, line, timeout=10):
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+      if os.path.exists(os.path.join(self.root, 'ssh.log')):
+        if line in self.read_log():
+          return True
+      time.sleep(0.05)
+    return False
+
+  def wait_for_exit(self, child, timeout=10):
+    end_time = time.time() + timeout
+    while child.poll() is None and time.time() < end_time:
+      time.sleep(0.05)
+    return child.poll()
+
+  def start_port_forward(self, connection):
+    command = connection.make_port_forward_command(
+        8084, 80, poll_interval=0.1)
+    self.assertIn('ControlPath={0}'.format(connection.control_path),
+                  ' '.join(command))
+    child = subprocess.Popen(command)
+    self.assertTrue(self.wait_for_log('forward 8084:localhost:80'))
+    return child
+
+  def test_port_forward_lives_until_terminated(self):
+    connection = self.make_connection()
+    connection.connect(timeout=10, initial_backoff=0.01)
+    child = self.start_port_forward(connection)
+    time.sleep(0.5)
+    self.assertIsNone(child.poll())
+
+    child.terminate()
+    self.assertEqual(0, self.wait_for_exit(child))
+    self.assertTrue(self.wait_for_log('cancel 8084:localhost:80'))
+    connection.close()
+
+  def test_port_forward_exits_with_master(self):
+    connection = self.make_connection()
+    connection.connect(timeout=10, initial_backoff=0.01)
+    child = self.start_port_forward(connection)
+    connection.close()
+    self.assertIsNotNone(self.wait_for_exit(child))
+
+  def test_port_forward_fails_without_master(self):
+    connection = self.make_connection()
+    child = subprocess.Popen(
+        connection.make_port_forward_command(8084, 80, poll_interval=0.1))
+    self.assertNotEqual(0, self.wait_for_exit(child))
+
+  def test_close_removes_temporary_control_dir(self):
+    registered = []
+    original_register = validate_bom__deploy.atexit.register
+    validate_bom__deploy.atexit.register = registered.append
+    try:
+      connection = SshControlConnection(
+          'hal', 'instance', '/dev/null', ssh_binary=self.ssh,
+          scp_binary=self.scp)
+      control_dir = os.path.dirname(connection.control_path)
+      for _ in range(2):
+        connection.connect(timeout=10, initial_backoff=0.01)
+        self.assertTrue(connection.is_connected())
+        connection.close()
+        self.assertFalse(os.path.exists(control_dir))
+    finally:
+      validate_bom__deploy.atexit.register = original_register
+    self.assertEqual([connection.close], registered)
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(SshControlConnectionTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -0,0 +1,177 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import yaml
+
+from build_scheduler import BuildHistory
+from validate_bom__test import ValidateBomTestController
+
+
+class FakeDeployer(object):
+  def __init__(self, options):
+    self.options = options
+
+  def notify_port_forward_failed(self, service_name):
+    pass
+
+
+class RecordingController(ValidateBomTestController):
+  """Runs each scheduled test as a short sleep, recording what happened."""
+
+  def __init__(self, deployer):
+    super(RecordingController, self).__init__(deployer)
+    self.lock = threading.Lock()
+    self.started = []
+    self.in_use = {}
+    self.max_in_use = {}
+
+  def make_test_command_or_none(self, test_name, spec):
+    return [test_name]
+
+  def run_scheduled_test(self, entry):
+    with self.lock:
+      self.started.append(entry.name)
+      for name, count in entry.quota.items():
+        self.in_use[name] = self.in_use.get(name, 0) + count
+        self.max_in_use[name] = max(self.max_in_use.get(name, 0),
+                                    self.in_use[name])
+    time.sleep(0.05)
+    with self.lock:
+      for name, count in entry.quota.items():
+        self.in_use[name] -= count
+
+
+class MessageCollector(logging.Handler):
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.messages = []
+
+  def emit(self, record):
+    self.messages.append(record.getMessage())
+
+
+class ValidateBomSchedulerTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.history_path = os.path.join(self.temp_dir, 'history.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def make_controller(self, tests, concurrency, default_quota='x=3',
+                      history=None):
+    history_file = BuildHistory(self.history_path)
+    for name, secs in (history or {}).items():
+      history_file.record(name, 'test', secs)
+    history_file.save()
+
+    profile_path = os.path.join(self.temp_dir, 'profiles.yml')
+    with open(profile_path, 'w') as stream:
+      yaml.safe_dump({'tests': tests}, stream)
+
+    options = argparse.Namespace(
+        test_default_quota=default_quota,
+        test_quota=None,
+        test_profiles=profile_path,
+        test_extra_profile_bindings=None,
+        test_concurrency=concurrency,
+        test_history_path=self.history_path,
+        deploy_version='test',
+        test_disable=False,
+        test_include='.*',
+        test_exclude=None)
+    return RecordingController(FakeDeployer(options))
+
+  def test_priority_order(self):
+    controller = self.make_controller(
+        {'short': {'quota': {'x': 1}},
+         'long': {'quota': {'x': 1}},
+         'new': {'quota': {'x': 1}},
+         'big_a': {'quota': {'x': 2}},
+         'big_b': {'quota': {'x': 2}}},
+        concurrency=1,
+        history={'short': 10, 'long': 100, 'big_a': 10, 'big_b': 10})
+    controller.run_tests()
+    self.assertEqual(['new', 'long', 'big_a', 'big_b', 'short'],
+                     controller.started)
+
+  def test_quota_is_never_oversubscribed(self):
+    tests = {'test_{0}'.format(i): {'quota': {'x': 1 + i % 3}}
+             for i in range(8)}
+    controller = self.make_controller(tests, concurrency=8)
+    controller.run_tests()
+    self.assertEqual(sorted(tests.keys()), sorted(controller.started))
+    self.assertEqual(3, controller.max_in_use['x'])
+    self.assertEqual([], controller.failed)
+
+  def test_large_quota_is_not_starved(self):
+    tests = {'small_{0}'.format(i): {'quota': {'x': 1}} for i in range(8)}
+    tests.update({'first': {'quota': {'x': 1}},
+                  'big': {'quota': {'x': 3}}})
+    history = {name: 10 for name in tests}
+    history.update({'first': 100, 'big': 50})
+    controller = self.make_controller(tests, concurrency=3,
+                                      history=history)
+    controller.run_tests()
+
+    # "big" is passed over for the small tests until it has waited on three
+    # of them, then they wait for it rather than it waiting for all of them.
+    self.assertEqual(
+        ['first', 'small_0', 'small_1', 'small_2', 'big'],
+        controller.started[:5])
+    self.assertEqual(3, controller.max_in_use['x'])
+
+  def test_quota_wait_reported_once_per_test(self):
+    collector = MessageCollector()
+    logger = logging.getLogger()
+    old_level = logger.level
+    logger.setLevel(logging.INFO)
+    logger.addHandler(collector)
+    try:
+      controller = self.make_controller(
+          {'first': {'quota': {'x': 1}},
+           'second': {'quota': {'x': 1}},
+           'third': {'quota': {'x': 1}}},
+          concurrency=3, default_quota='x=1')
+      controller.run_tests()
+    finally:
+      logger.removeHandler(collector)
+      logger.setLevel(old_level)
+
+    self.assertEqual(3, len(controller.started))
+    waiting = [message for message in collector.messages
+               if 'waiting on quota' in message]
+    # The two tests left waiting are each reported exactly once,
+    # no matter how many times the queue was rescanned.
+    self.assertEqual(2, len(waiting))
+    self.assertEqual(2, len(set(waiting)))
+    self.assertFalse([message for message in collector.messages
+                      if 'Rejecting' in message])
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(ValidateBomSchedulerTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -0,0 +1,91 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import StringIO
+import sys
+import unittest
+import yaml
+
+from benchmark_yaml import load_corpus, make_synthetic_bom
+
+
+class GeneralPathDumper(yaml.Dumper):
+  fast_path = False
+
+
+class GeneralPathSafeDumper(yaml.SafeDumper):
+  fast_path = False
+
+
+# Scalars that need quoting, escaping, wrapping or a block style.
+EDGE_CASES = {
+    'empty': ['', [], {}],
+    'indicators': ['- x', ':', 'a: b', '?', '#', 'a #b', '---x', '...', '@x'],
+    'implicit': ['010', '1.5e3', 'no', '~', '2017-01-01', 'x y'],
+    'spaces': [' lead', 'trail ', 'a  b', ' '.join(['word'] * 40)],
+    'breaks': ['line\nbreak', 'trail\n', '\n\nlead', u'x\u2028y'],
+    'unicode': [u'caf\xe9', u'\ufeffbom', '\x07bell', "'quoted'"],
+    'keys': {1: True, 2.5: None, 'x' * 130: 'long key', ('a', 'b'): 'c'},
+    'long': 'x' * 100 + ' ' + 'y' * 10,
+}
+
+
+class YamlEmitterTest(unittest.TestCase):
+  def assertSameAsGeneralPath(self, documents, **kwargs):
+    for fast, general in [(yaml.Dumper, GeneralPathDumper),
+                          (yaml.SafeDumper, GeneralPathSafeDumper)]:
+      try:
+        expect = yaml.dump_all(documents, Dumper=general, **kwargs)
+      except yaml.YAMLError:
+        self.assertRaises(yaml.YAMLError, yaml.dump_all, documents,
+                          Dumper=fast, **kwargs)
+        continue
+      got = yaml.dump_all(documents, Dumper=fast, **kwargs)
+      self.assertEqual(type(expect), type(got))
+      self.assertEqual(expect, got)
+
+  def test_corpus(self):
+    for name, text in load_corpus(50):
+      document = yaml.load(text)
+      self.assertSameAsGeneralPath([document], default_flow_style=False)
+      self.assertSameAsGeneralPath([document])
+
+  def test_edge_cases(self):
+    documents = [EDGE_CASES, make_synthetic_bom(5), EDGE_CASES]
+    for kwargs in [{}, {'default_flow_style': False},
+                   {'default_flow_style': True}, {'allow_unicode': True},
+                   {'encoding': None}, {'encoding': 'utf-16-le'},
+                   {'width': 20, 'indent': 4}, {'canonical': True},
+                   {'explicit_start': True, 'explicit_end': True}]:
+      self.assertSameAsGeneralPath(documents, **kwargs)
+
+  def test_writes_each_document_once(self):
+    writes = []
+    class Stream(StringIO.StringIO):
+      def write(self, data):
+        writes.append(data)
+    yaml.dump_all([make_synthetic_bom(20), {'a': 1}], Stream(),
+                  default_flow_style=False)
+    self.assertEqual(2, len(writes))
+    self.assertEqual(yaml.dump_all([make_synthetic_bom(20), {'a': 1}],
+                                   Dumper=GeneralPathDumper,
+                                   default_flow_style=False),
+                     ''.join(writes))
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(YamlEmitterTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -0,0 +1,51 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import StringIO
+import sys
+import unittest
+import yaml
+
+from benchmark_yaml import load_corpus
+from spinnaker.yaml_util import HAVE_ACCELERATED_YAML, load_yaml, yaml_loader
+
+
+class YamlLoaderTest(unittest.TestCase):
+  def test_loader_selection(self):
+    self.assertEqual(yaml.Loader, yaml_loader(accelerated=False))
+    self.assertEqual(yaml.SafeLoader, yaml_loader(safe=True,
+                                                  accelerated=False))
+    if HAVE_ACCELERATED_YAML:
+      self.assertEqual(yaml.CLoader, yaml_loader())
+      self.assertEqual(yaml.CSafeLoader, yaml_loader(safe=True))
+    else:
+      self.assertEqual(yaml.Loader, yaml_loader())
+
+  def test_parity_with_pure_python(self):
+    corpus = load_corpus(200)
+    corpus.append(('scalars', 'a: 010\nb: 1.5e3\nc: no\nd: ~\ne: 2017-01-01\n'
+                              'f: !!str 12\ng: [x, {y: z}]\nh: "\\u263a"\n'))
+    for name, text in corpus:
+      expect = yaml.load(text, Loader=yaml.Loader)
+      self.assertEqual(expect, load_yaml(text), name)
+      self.assertEqual(expect, load_yaml(StringIO.StringIO(text)), name)
+      self.assertEqual(yaml.load(text, Loader=yaml.SafeLoader),
+                       load_yaml(text, safe=True), name)
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(YamlLoaderTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
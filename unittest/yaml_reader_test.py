@@ -0,0 +1,71 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import StringIO
+import sys
+import unittest
+
+from yaml.reader import Reader, ReaderError
+
+
+class YamlReaderTest(unittest.TestCase):
+  def positions(self, reader):
+    result = []
+    while reader.peek() != u'\0':
+      result.append((reader.index, reader.line, reader.column))
+      reader.forward()
+    return result
+
+  def test_line_breaks(self):
+    reader = Reader(u'a\r\nb\rc\x85d\u2028e\n')
+    self.assertEqual(
+        [(0, 0, 0), (1, 0, 1), (2, 0, 2), (3, 1, 0), (4, 1, 1), (5, 2, 0),
+         (6, 2, 1), (7, 3, 0), (8, 3, 1), (9, 4, 0), (10, 4, 1)],
+        self.positions(reader))
+    mark = reader.get_mark()
+    self.assertEqual((11, 5, 0), (mark.index, mark.line, mark.column))
+
+  def test_byte_order_mark_is_not_a_column(self):
+    reader = Reader('\xef\xbb\xbfab\n')
+    self.assertEqual('utf-8', reader.encoding)
+    self.assertEqual([(0, 0, 0), (1, 0, 0), (2, 0, 1), (3, 0, 2)],
+                     self.positions(reader))
+
+  def test_file_stream(self):
+    reader = Reader(StringIO.StringIO(u'key: \u263a\n'.encode('utf-8')))
+    self.assertEqual('utf-8', reader.encoding)
+
+    reader = Reader(StringIO.StringIO(
+        '\xff\xfe' + u'key: \u263a\n'.encode('utf-16-le')))
+    self.assertEqual('utf-16-le', reader.encoding)
+    reader.forward(6)
+    self.assertEqual(u'\u263a\n', reader.prefix(2))
+    self.assertEqual(5, reader.column)
+    self.assertIsNone(reader.get_mark().buffer)
+
+  def test_errors(self):
+    with self.assertRaises(ReaderError) as context:
+      Reader('ab\n\x07')
+    self.assertEqual(3, context.exception.position)
+
+    with self.assertRaises(ReaderError) as context:
+      Reader(StringIO.StringIO('ab\xc3\x28'))
+    self.assertEqual(2, context.exception.position)
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(YamlReaderTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
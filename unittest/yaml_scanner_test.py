@@ -0,0 +1,86 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import os
+import sys
+import unittest
+import yaml
+
+from benchmark_yaml import load_corpus
+
+
+class GeneralPathLoader(yaml.Loader):
+  fast_path = False
+
+
+EDGE_CASES = [
+    'a: b:c\nd: e: f\n',
+    'url: http://host:8080/path # comment\n#only\n  # indented\nx:   y  \n',
+    'multi: first\n  second\n\n  third\nnext: ok\n',
+    'a:b: c\n"q": \'s\'\n? k\n: v\n',
+    'f: {a: b, c: [d, e:f, g]}\ns: [a:, b]\n',
+    'l:\n- one\n- two: 2\n  three: 3\n-\n--- \n... \n',
+    'x: &a v\ny: *a\nt: !!str 1\nz: |\n  lit\n  eral\nw: >\n  fold\n',
+    u'k: v\r\nj: \u2028w\r\n\x85m: n\ufeff',
+    u'# comment\rk: v # comment\u2028j: w\n',
+    'trailing: space \n\ttab: no\n',
+    'a: b #c\nd: e#f\n%notdirective: x\n',
+    'bad: [a: b: c]\n',
+    'bad: value\n  more: x\n',
+]
+
+
+class YamlScannerTest(unittest.TestCase):
+  def scan(self, source, loader):
+    tokens = []
+    try:
+      for token in yaml.scan(source, Loader=loader):
+        tokens.append((token.__class__.__name__,
+                       getattr(token, 'value', None),
+                       getattr(token, 'plain', None),
+                       token.start_mark.index, token.start_mark.line,
+                       token.start_mark.column, token.end_mark.index,
+                       token.end_mark.line, token.end_mark.column))
+    except yaml.YAMLError as ex:
+      tokens.append(str(ex))
+    return tokens
+
+  def assertSameTokens(self, name, source):
+    self.assertEqual(self.scan(source, GeneralPathLoader),
+                     self.scan(source, yaml.Loader), name)
+
+  def test_corpus(self):
+    root = os.path.join(os.path.dirname(__file__), '..')
+    corpus = load_corpus(50)
+    for pattern in ['dev/*.yml', 'dev/*.yaml', 'dev/**/*.yml',
+                    'google/**/*.yml']:
+      for path in sorted(glob.glob(os.path.join(root, pattern))):
+        with open(path, 'r') as stream:
+          corpus.append((path, stream.read()))
+    for name, source in corpus:
+      self.assertSameTokens(name, source)
+
+  def test_edge_cases(self):
+    for source in EDGE_CASES:
+      self.assertSameTokens(source, source)
+      if not isinstance(source, unicode):
+        self.assertSameTokens(source, unicode(source, 'latin-1'))
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(YamlScannerTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -0,0 +1,104 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+import yaml
+
+from benchmark_yaml import load_corpus
+from spinnaker.yaml_util import YamlBindings
+
+
+def index_composed_spans(source):
+  """Index the mapping entries of a composed document the way spans do."""
+  root = yaml.compose(source)
+  if not isinstance(root, yaml.nodes.MappingNode):
+    return {}
+  result = {}
+  stack = [((), root)]
+  while stack:
+    prefix, mapping_node = stack.pop()
+    for key_node, value_node in mapping_node.value:
+      path = prefix + (key_node.value,)
+      if path in result:
+        continue
+      key_start = key_node.start_mark.index
+      line_start = key_start - 1
+      while line_start >= 0 and source[line_start] == ' ':
+        line_start -= 1
+      result[path] = (key_start, value_node.start_mark.index,
+                      value_node.end_mark.index, key_start - line_start + 1)
+      if isinstance(value_node, yaml.nodes.MappingNode):
+        stack.append((path, value_node))
+  return result
+
+
+class YamlSpansTest(unittest.TestCase):
+  def assertSameAsComposed(self, source):
+    index = yaml.index_spans(source)
+    self.assertEqual(
+        index_composed_spans(source),
+        {path: (span.key_start, span.value_start, span.value_end, span.indent)
+         for path, span in index.spans.items()})
+
+  def test_corpus(self):
+    for _, source in load_corpus(20):
+      self.assertSameAsComposed(source)
+
+  def test_aliases_and_duplicates(self):
+    source = ('a: &x {b: 1, c: {d: 2}}\ne: *x\nf:\n  - &y {g: 1}\nh: *y\n'
+              'a: dup\ni:\nj:\n  k: 1\n  k:\n    l: 2\n&m key: 1\n*m : 2\n')
+    self.assertSameAsComposed(source)
+    index = yaml.index_spans(source)
+    self.assertEqual(index[('a', 'c', 'd')].value_start,
+                     index[('e', 'c', 'd')].value_start)
+    self.assertTrue(('h', 'g') in index)
+    self.assertFalse(('j', 'k', 'l') in index)
+    self.assertEqual((2, index[('a', 'c')]),
+                     index.find_closest(('a', 'c', 'missing')))
+    self.assertEqual((0, None), index.find_closest(('missing',)))
+
+  def test_root_kind(self):
+    self.assertEqual(yaml.nodes.MappingNode, yaml.index_spans('a: 1').root_kind)
+    self.assertEqual(yaml.nodes.SequenceNode, yaml.index_spans('- 1').root_kind)
+    self.assertIsNone(yaml.index_spans('').root_kind)
+    with self.assertRaises(yaml.composer.ComposerError):
+      yaml.index_spans('a: 1\n---\nb: 2\n')
+
+  def test_find_yaml_context_reuses_index(self):
+    source = 'a:\n  b: B\n  c:\nd: D\n'
+    bindings = YamlBindings()
+    index = yaml.index_spans(source)
+    self.assertEqual((('', ''), (8, 9)),
+                     bindings.find_yaml_context(source, index, 'a.b', True))
+    self.assertEqual(((' ', ''), (14, 14)),
+                     bindings.find_yaml_context(source, index, 'a.c', True))
+    self.assertEqual((('\n    x: ', ''), (14, 14)),
+                     bindings.find_yaml_context(source, index, 'a.c.x', False))
+    self.assertEqual((('x: ', '\n  '), (5, 5)),
+                     bindings.find_yaml_context(source, index, 'a.x', False))
+    with self.assertRaises(KeyError):
+      bindings.find_yaml_context(source, index, 'a.x', True)
+
+    # Composed trees are still accepted.
+    self.assertEqual(
+        bindings.find_yaml_context(source, index, 'd', True),
+        bindings.find_yaml_context(source, yaml.compose(source), 'd', True))
+
+
+if __name__ == '__main__':
+  loader = unittest.TestLoader()
+  suite = loader.loadTestsFromTestCase(YamlSpansTest)
+  got = unittest.TextTestRunner(verbosity=2).run(suite)
+  sys.exit(len(got.errors) + len(got.failures))
@@ -222,6 +222,34 @@ e:
     with self.assertRaises(ValueError):
       bindings.get('field')
 
+  def test_cyclic_reference_indirect(self):
+    bindings = YamlBindings()
+    bindings.import_dict({'a': 'x${b}', 'b': '${c:C}', 'c': '${a}'})
+    with self.assertRaises(ValueError):
+      bindings.get('a')
+    with self.assertRaises(ValueError):
+      bindings.get('c')
+
+  def test_resolved_value_invalidated_by_import(self):
+    bindings = YamlBindings()
+    bindings.import_dict({'field': '${injected.value:DEFAULT}'})
+    self.assertEqual('DEFAULT', bindings.get('field'))
+    bindings.import_dict({'injected': {'value': 'HELLO'}})
+    self.assertEqual('HELLO', bindings.get('field'))
+    bindings.import_dict({'injected': {'value': 'WORLD'}})
+    self.assertEqual('WORLD', bindings.get('field'))
+
+  def test_resolved_value_invalidated_by_environ(self):
+    bindings = YamlBindings()
+    bindings.import_dict({'field': 'a.${TEST_LATE_VARIABLE:missing}'})
+    self.assertEqual('a.missing', bindings.get('field'))
+    os.environ['TEST_LATE_VARIABLE'] = 'found'
+    try:
+      self.assertEqual('a.found', bindings.get('field'))
+    finally:
+      del os.environ['TEST_LATE_VARIABLE']
+    self.assertEqual('a.missing', bindings.get('field'))
+
   def test_load_None_strings(self):
     bindings = YamlBindings()
     bindings.import_dict({'a': None, 'b': 'B'})
@@ -307,6 +335,81 @@ unique:
      self.assertEqual(expect, got)
 
 
+  def test_transform_keys(self):
+     bindings = YamlBindings()
+     bindings.import_dict({'a': {'b': {'space': 'WithSpace',
+                                       'empty': 'Empty',
+                                       'new': {'x': 'X', 'y': True}},
+                                 'c': 'C'},
+                           'e': {'child': 'Child'},
+                           'z': 1})
+     source = """
+a:
+  b:
+    space: SPACE
+    empty:
+e:
+unique: U
+"""
+     expect = """z: 1
+
+a:
+  c: C
+  b:
+    new:
+      x: X
+      y: true
+    space: WithSpace
+    empty: Empty
+e:
+  child: Child
+unique: U
+"""
+     got = bindings.transform_yaml_source_keys(
+         source, ['z', 'a.b.new.x', 'a.b.new.y', 'a.b.space', 'a.b.empty',
+                  'a.c', 'e.child', 'bogus'])
+     self.assertEqual(expect, got)
+     comparison_bindings = YamlBindings()
+     comparison_bindings.import_string(got)
+     self.assertEqual(dict(bindings.map, unique='U'), comparison_bindings.map)
+
+     with self.assertRaises(KeyError):
+       bindings.transform_yaml_source_keys(source, ['a.b.space', 'a.c'],
+                                           add_new_nodes=False)
+
+  def test_transform_keys_insert_and_replace_at_same_offset(self):
+     bindings = YamlBindings()
+     bindings.import_dict({'a': {'c': 'C', 'x': 'X2'}})
+     source = """a:
+  x: X
+"""
+     # Adding "a.c" inserts at the start of a's value, ahead of "a.x".
+     expect = """a:
+  c: C
+  x: X2
+"""
+     got = bindings.transform_yaml_source_keys(source, ['a.x', 'a.c'])
+     self.assertEqual(expect, got)
+     comparison_bindings = YamlBindings()
+     comparison_bindings.import_string(got)
+     self.assertEqual(bindings.map, comparison_bindings.map)
+
+  def test_transform_keys_rejects_nested_keys(self):
+     bindings = YamlBindings()
+     bindings.import_dict({'a': {'c': 'C', 'x': 'X2', 'y': 'Y2'}})
+     source = """a:
+  x: X
+  y: Y
+"""
+     for keys in [['a', 'a.c'], ['a.c', 'a'], ['a', 'a.x'], ['a.x', 'a']]:
+       with self.assertRaises(ValueError):
+         bindings.transform_yaml_source_keys(source, keys)
+
+     # Repeating a key is not a conflict.
+     self.assertEqual(
+         bindings.transform_yaml_source_keys(source, ['a.x']),
+         bindings.transform_yaml_source_keys(source, ['a.x', 'a.x']))
+
   def test_transform_fail(self):
      bindings = YamlBindings()
      bindings.import_dict({'a': {'b': { 'child': 'Hello, World!'}},